@@ -0,0 +1,339 @@
+import asyncio
+import calendar
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from data_access import dal, MONGO_MAX_STALENESS_S
+from txn_codec import ml_stage_name
+
+# Columnar analytics sink.
+#
+# Aggregate analytics (dashboard totals, stats) are answered from Parquet files
+# under ANALYTICS_STORE_DIR instead of the operational collections. A capture job
+# on the first worker reads what changed since its watermark every
+# ANALYTICS_CAPTURE_SECONDS, with indexed range queries on the primary:
+#   - payments scored in the window (``timestamp``)
+#   - reviews decided in the window (``approved_at`` / ``rejected_at``)
+# and appends them as delta rows: +1 under the decision a payment was scored
+# with, then -1 REVIEW / +1 APPROVE|BLOCK when an analyst decides it. Totals are
+# plain sums over ``sign``, so rows are never rewritten. The window stops
+# ANALYTICS_LAG_SECONDS short of now so payments still in flight aren't missed.
+#
+# Each micro-batch is one file named after the window it covers,
+# ``<start_ms>-<end_ms>.parquet``, renamed into place when complete (empty
+# windows too, so the watermark is always the largest window end on disk). Runs
+# of small files are merged into larger ones; a file whose window lies inside
+# another file's window is ignored, so a crash mid-merge never counts rows twice.
+#
+# ``python analytics_store.py`` backfills everything before the first capture
+# window, hot tier and monthly archives, as the window starting at 0. Until that
+# file exists the store is not ``ready`` and endpoints keep reading Mongo.
+#
+# Files are immutable, so each worker caches the columns it has read per file.
+# Workers on one host share the directory; several hosts need shared storage.
+
+ANALYTICS_STORE_DIR = os.getenv("ANALYTICS_STORE_DIR", "")
+ANALYTICS_CAPTURE_SECONDS = int(os.getenv("ANALYTICS_CAPTURE_SECONDS", "30"))
+ANALYTICS_LAG_SECONDS = int(os.getenv("ANALYTICS_LAG_SECONDS", "60"))
+# Files with fewer rows are merged once MERGE_MIN_FILES of them are adjacent
+ANALYTICS_TARGET_ROWS = int(os.getenv("ANALYTICS_TARGET_ROWS", "1000000"))
+MERGE_MIN_FILES = 16
+BACKFILL_BATCH_SIZE = 10000
+
+SCHEMA = pa.schema([
+    ("transaction_id", pa.string()),
+    ("user_id", pa.string()),
+    # When the row counts: scoring time, or review time for review deltas
+    ("event_time", pa.timestamp("ms")),
+    ("decision", pa.dictionary(pa.int8(), pa.string())),
+    ("sign", pa.int8()),
+    ("amount", pa.float64()),
+    ("risk_score", pa.float32()),
+    ("ml_stage", pa.dictionary(pa.int8(), pa.string())),
+    ("payment_type", pa.dictionary(pa.int8(), pa.string())),
+])
+PROJECTION = {
+    "_id": 0, "transaction_id": 1, "user_id": 1, "timestamp": 1, "decision": 1, "amount": 1,
+    "risk_score": 1, "ml_stage": 1, "payment_type": 1, "approved_at": 1, "rejected_at": 1
+}
+
+
+def to_ms(ts: datetime) -> int:
+    return calendar.timegm(ts.utctimetuple()) * 1000 + ts.microsecond // 1000
+
+
+def from_ms(ms: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(milliseconds=ms)
+
+
+def scored_decision(txn: dict) -> str:
+    """The decision a payment was scored with, before any manual review"""
+    if txn.get("approved_at") or txn.get("rejected_at"):
+        return "REVIEW"
+    return txn["decision"]
+
+
+def delta_rows(scored: list, approved: list, rejected: list) -> list:
+    """Delta rows for payments scored and reviews decided in one window"""
+    rows = []
+
+    def row(txn, event_time, decision, sign):
+        rows.append({
+            "transaction_id": txn["transaction_id"],
+            "user_id": txn.get("user_id"),
+            "event_time": event_time,
+            "decision": decision,
+            "sign": sign,
+            "amount": float(txn.get("amount", 0.0)),
+            "risk_score": txn.get("risk_score"),
+            "ml_stage": ml_stage_name(txn.get("ml_stage")),
+            "payment_type": txn.get("payment_type")
+        })
+
+    for txn in scored:
+        row(txn, txn["timestamp"], scored_decision(txn), 1)
+    for txn in approved:
+        row(txn, txn["approved_at"], "REVIEW", -1)
+        row(txn, txn["approved_at"], "APPROVE", 1)
+    for txn in rejected:
+        row(txn, txn["rejected_at"], "REVIEW", -1)
+        row(txn, txn["rejected_at"], "BLOCK", 1)
+    return rows
+
+
+def _window_filter(field: str, start: datetime, end: datetime) -> dict:
+    return {field: {"$gt": start, "$lte": end}}
+
+
+async def read_window(collection, start: datetime, end: datetime) -> list:
+    """Delta rows for (start, end] from one transactions collection"""
+    scored = await collection.find(_window_filter("timestamp", start, end), PROJECTION).to_list(length=None)
+    approved = await collection.find(_window_filter("approved_at", start, end), PROJECTION).to_list(length=None)
+    rejected = await collection.find(_window_filter("rejected_at", start, end), PROJECTION).to_list(length=None)
+    return delta_rows(scored, approved, rejected)
+
+
+class AnalyticsStore:
+    def __init__(self, directory: str = ANALYTICS_STORE_DIR):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self._cache = {}            # file name -> Table of the columns read so far
+        self._lock = threading.Lock()
+        self.watermark = None       # ms; end of the last captured window
+        self.stats = {"captured_rows": 0, "files_written": 0, "merges": 0, "last_capture_ms": None}
+
+    # ===== FILES =====
+    def files(self, prune: bool = False) -> list:
+        """Live (start_ms, end_ms, name) windows, oldest first; the writer prunes superseded files"""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        windows = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                start, end = name[:-len(".parquet")].split("-")
+                windows.append((int(start), int(end), name))
+        # Widest first so a merged file shadows the parts it was built from
+        windows.sort(key=lambda w: (w[0], -w[1]))
+        live = []
+        for window in windows:
+            if live and window[1] <= live[-1][1]:
+                if prune:
+                    self._remove(window[2])
+            else:
+                live.append(window)
+        return live
+
+    def _remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, table: pa.Table, start_ms: int, end_ms: int) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{start_ms}-{end_ms}.parquet"
+        tmp = os.path.join(self.directory, f".{name}.tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, os.path.join(self.directory, name))
+        return name
+
+    @property
+    def ready(self) -> bool:
+        files = self.files()
+        return bool(files) and files[0][0] == 0
+
+    # ===== CAPTURE =====
+    def append(self, rows: list, start_ms: int, end_ms: int):
+        """Write one window's delta rows (blocking)"""
+        self._write(pa.Table.from_pylist(rows, schema=SCHEMA), start_ms, end_ms)
+        self.stats["files_written"] += 1
+        self.stats["captured_rows"] += len(rows)
+        self.watermark = end_ms
+
+    def merge_small(self):
+        """Merge the oldest run of adjacent small files into one (blocking)"""
+        run = []
+        for window in self.files(prune=True):
+            if pq.read_metadata(os.path.join(self.directory, window[2])).num_rows < ANALYTICS_TARGET_ROWS:
+                run.append(window)
+            elif len(run) >= MERGE_MIN_FILES:
+                break
+            else:
+                run = []
+        if len(run) < MERGE_MIN_FILES:
+            return
+        table = pa.concat_tables([pq.read_table(os.path.join(self.directory, w[2]), schema=SCHEMA) for w in run])
+        self._write(table, run[0][0], run[-1][1])
+        for window in run:
+            self._remove(window[2])
+        self.stats["merges"] += 1
+
+    async def capture_once(self, now: datetime = None):
+        end = (now or datetime.utcnow()) - timedelta(seconds=ANALYTICS_LAG_SECONDS)
+        end_ms = to_ms(end)
+        loop = asyncio.get_running_loop()
+        if self.watermark is None:
+            files = await loop.run_in_executor(None, self.files)
+            if not files:
+                # Anchor the first window on disk; the backfill covers everything before it
+                await loop.run_in_executor(None, self.append, [], end_ms, end_ms)
+            self.watermark = files[-1][1] if files else end_ms
+        if end_ms <= self.watermark:
+            return
+        started = time.perf_counter()
+        # Primary reads: a lagging secondary could miss documents inside the window
+        rows = await read_window(dal.transactions, from_ms(self.watermark), from_ms(end_ms))
+        await loop.run_in_executor(None, self.append, rows, self.watermark, end_ms)
+        await loop.run_in_executor(None, self.merge_small)
+        self.stats["last_capture_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def run(self, interval: int = ANALYTICS_CAPTURE_SECONDS):
+        """Background loop started from the FastAPI lifespan"""
+        while True:
+            try:
+                await self.capture_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Analytics capture error: {e}")
+            await asyncio.sleep(interval)
+
+    async def backfill(self, db) -> int:
+        """Capture everything up to the first live window (hot tier and monthly archives) as window 0"""
+        files = self.files()
+        if files and files[0][0] == 0:
+            print("✅ Analytics store already backfilled")
+            return 0
+        # Reads go to secondaries, so stay behind their maximum staleness as well
+        lag = max(ANALYTICS_LAG_SECONDS, MONGO_MAX_STALENESS_S)
+        end_ms = files[0][0] if files else to_ms(datetime.utcnow() - timedelta(seconds=lag))
+        end = from_ms(end_ms)
+        names = ["transactions"] + sorted(
+            n for n in await db.list_collection_names() if n.startswith("transactions_archive_")
+        )
+        tables = []
+        for name in names:
+            # A review can't precede its payment, so the scoring time bounds every row;
+            # converted in batches so a month of documents is never held as dicts
+            cursor = db[name].find({"timestamp": {"$lte": end}}, PROJECTION).batch_size(BACKFILL_BATCH_SIZE)
+            batch = []
+            async for txn in cursor:
+                batch.append(txn)
+                if len(batch) >= BACKFILL_BATCH_SIZE:
+                    tables.append(self._backfill_table(batch, end))
+                    batch = []
+            if batch:
+                tables.append(self._backfill_table(batch, end))
+        table = pa.concat_tables(tables) if tables else SCHEMA.empty_table()
+        self._write(table, 0, end_ms)
+        print(f"✅ Analytics store backfilled {table.num_rows} rows from {len(names)} collections")
+        return table.num_rows
+
+    @staticmethod
+    def _backfill_table(batch: list, end: datetime) -> pa.Table:
+        # Reviews decided after ``end`` belong to the live windows
+        approved = [t for t in batch if t.get("approved_at") and t["approved_at"] <= end]
+        rejected = [t for t in batch if t.get("rejected_at") and t["rejected_at"] <= end]
+        return pa.Table.from_pylist(delta_rows(batch, approved, rejected), schema=SCHEMA)
+
+    # ===== QUERIES =====
+    def table(self, columns: list) -> pa.Table:
+        """The requested columns over every live file (blocking; cached per file)"""
+        with self._lock:
+            for attempt in range(3):
+                try:
+                    return self._read(columns)
+                except FileNotFoundError:
+                    # The capture job merged files while we were listing them
+                    if attempt == 2:
+                        raise
+
+    def _read(self, columns: list) -> pa.Table:
+        files = self.files()
+        live = {name for _, _, name in files}
+        for name in [n for n in self._cache if n not in live]:
+            del self._cache[name]
+        tables = []
+        for _, _, name in files:
+            cached = self._cache.get(name)
+            if cached is None or not set(columns) <= set(cached.column_names):
+                wanted = [c for c in SCHEMA.names if c in columns or (cached is not None and c in cached.column_names)]
+                cached = pq.read_table(os.path.join(self.directory, name), columns=wanted, schema=SCHEMA)
+                self._cache[name] = cached
+            tables.append(cached.select(columns))
+        if not tables:
+            return SCHEMA.empty_table().select(columns)
+        return pa.concat_tables(tables)
+
+    def _decision_totals(self) -> dict:
+        table = self.table(["decision", "sign", "amount"])
+        grouped = pa.table({
+            "decision": pc.cast(table["decision"], pa.string()),
+            "sign": table["sign"],
+            "signed_amount": pc.multiply(table["amount"], table["sign"])
+        }).group_by("decision").aggregate([("sign", "sum"), ("signed_amount", "sum")])
+        counts = dict(zip(grouped["decision"].to_pylist(), grouped["sign_sum"].to_pylist()))
+        volumes = dict(zip(grouped["decision"].to_pylist(), grouped["signed_amount_sum"].to_pylist()))
+        # Review deltas cancel out across decisions, so the sums count each payment once
+        return {
+            "documents": sum(counts.values()),
+            "counts": {d: int(n) for d, n in counts.items()},
+            "volume": float(sum(volumes.values())),
+            "approved_volume": float(volumes.get("APPROVE", 0.0))
+        }
+
+    async def decision_totals(self) -> dict:
+        """Transactions, counts by current decision, volume and approved volume over all time"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._decision_totals)
+
+    def snapshot(self) -> dict:
+        files = self.files()
+        return {
+            "enabled": self.enabled,
+            "ready": bool(files) and files[0][0] == 0,
+            "files": len(files),
+            "watermark": from_ms(files[-1][1]).isoformat() if files else None,
+            **self.stats
+        }
+
+
+analytics_store = AnalyticsStore()
+
+
+if __name__ == "__main__":
+    from data_access import MONGODB_URI, DB_NAME
+
+    async def main():
+        if not analytics_store.enabled:
+            raise SystemExit("Set ANALYTICS_STORE_DIR to backfill the analytics store")
+        await dal.connect(MONGODB_URI, DB_NAME)
+        try:
+            await analytics_store.backfill(dal.analytics.db)
+        finally:
+            dal.close()
+
+    asyncio.run(main())
@@ -1,32 +1,90 @@
 # Save this as backend/app.py and replace your existing file
 
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List
 from datetime import datetime, timedelta
 import joblib
 import numpy as np
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import json
 from dotenv import load_dotenv
+from data_access import dal
+from migrations import run_migrations
+from ledger import debit_account, credit_account, ledger_ref, APPLIED_FIELD
+from bulk_review import bulk_approve, bulk_reject, unclaimed_filter
+import review_queue
+import archive
+import rollups
+import settlement
+from analytics_store import analytics_store
+from idempotency import idempotency_store, request_fingerprint, IdempotencyConflict, IDEMPOTENCY_COLLECTION
+from rules import rule_engine, combine_scores, decide
+from features import build_feature_vector, MODEL_FEATURES
+from cascade import CascadeScorer
+from inference import InferenceBatcher
+from explain import AlertExplainer, EXPLAIN_ENABLED
+from drift import DriftMonitor, load_reference
+from model_bundle import MODEL_BUNDLE_DIR, DRIFT_REFERENCE_FILE, load_bundle
+import fanin
+from fanin import receiver_fanin
+from payees import known_payees
+from gateway import gateway, GatewayUnavailable, void_hold
+import device
+from device import fingerprint, device_index
+from spending_profile import profile_features, record_approved
+import list_cache
+from list_cache import ACCOUNTS, CONTACTS
+from txn_codec import encode_transaction, decode_transaction, feature_vector, RISK_LEVEL_CODES
+from feature_log import feature_log
 
 load_dotenv()
 
-app = FastAPI(title="PayShield Enhanced API", version="2.0.0")
-
-# MongoDB setup
-MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "payshield_fraud_detection")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Mongo connection pool per process, opened after any pre-fork
+    await dal.connect()
+    await gateway.start()
+    if os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true":
+        try:
+            await run_migrations(dal.db)
+        except Exception as e:
+            print(f"⚠️ Index migrations not applied: {e}")
+    
+    # Every worker appends to its own feature log segments
+    feature_log.start()
+    background = []
+    if os.getenv("FANIN_WARMUP", "true").lower() == "true":
+        background.append(asyncio.create_task(fanin.warm_up(dal.transactions)))
+    if os.getenv("DEVICE_WARMUP", "true").lower() == "true":
+        background.append(asyncio.create_task(device.warm_up(dal.transactions)))
+    # Under server.py only the first worker slot runs the archiver
+    if archive.ARCHIVE_ENABLED and os.getenv("WORKER_ID", "0") == "0":
+        background.append(asyncio.create_task(archive.run_archiver()))
+    if rollups.ROLLUPS_ENABLED and os.getenv("WORKER_ID", "0") == "0":
+        background.append(asyncio.create_task(rollups.run_compactor()))
+    if analytics_store.enabled and os.getenv("WORKER_ID", "0") == "0":
+        background.append(asyncio.create_task(analytics_store.run()))
+    if EXPLAIN_ENABLED and explainer.ready and os.getenv("WORKER_ID", "0") == "0":
+        background.append(asyncio.create_task(explainer.run()))
+    if os.getenv("WORKER_ID", "0") == "0":
+        background.append(asyncio.create_task(settlement.run_reconciler()))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        explainer.close()
+        feature_log.close()
+        await gateway.close()
+        dal.close()
 
-client = AsyncIOMotorClient(MONGODB_URI)
-db = client[DB_NAME]
-users_collection = db["users"]
-accounts_collection = db["accounts"]
-transactions_collection = db["transactions"]
-alerts_collection = db["alerts"]
-contacts_collection = db["contacts"]
+app = FastAPI(title="PayShield Enhanced API", version="2.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -40,16 +98,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load ML models
+# Load ML models: a versioned bundle from train.py when MODEL_BUNDLE_DIR is set,
+# otherwise the legacy notebook pickles
+model_manifest = None
 try:
-    model = joblib.load('fraud_detection_xgboost_model.pkl')
-    scaler = joblib.load('fraud_detection_scaler.pkl')
-    print("✅ ML Models loaded")
+    if MODEL_BUNDLE_DIR:
+        model, scaler, model_manifest = load_bundle(MODEL_BUNDLE_DIR)
+        print(f"✅ ML model bundle {model_manifest['version']} loaded")
+    else:
+        model = joblib.load('fraud_detection_xgboost_model.pkl')
+        scaler = joblib.load('fraud_detection_scaler.pkl')
+        print("✅ ML Models loaded")
 except Exception as e:
     print(f"⚠️ Models not loaded: {e}")
     model = None
     scaler = None
 
+# Rules short-circuit first; the model only runs when it can change the decision
+cascade = CascadeScorer(model, scaler)
+# Full-model calls from every endpoint and connection share batches
+batcher = InferenceBatcher(cascade)
+explainer = AlertExplainer(model, scaler)
+drift_monitor = DriftMonitor(scaler, load_reference(
+    os.path.join(model_manifest["path"], DRIFT_REFERENCE_FILE)) if model_manifest else None)
+
 # ============= MODELS =============
 class AccountCreate(BaseModel):
     account_number: str = Field(..., min_length=10, max_length=16)
@@ -88,6 +160,17 @@ class UserByEmail(BaseModel):
     email: str
     firebase_uid: str
 
+class BulkReviewRequest(BaseModel):
+    transaction_ids: List[str] = Field(..., min_length=1, max_length=10000)
+
+class ReviewClaimRequest(BaseModel):
+    limit: int = Field(10, ge=1, le=review_queue.MAX_CLAIM)
+    lease_seconds: int = Field(review_queue.DEFAULT_LEASE_SECONDS, ge=1, le=review_queue.MAX_LEASE_SECONDS)
+
+class ReviewLeaseRequest(BaseModel):
+    transaction_ids: List[str] = Field(..., min_length=1, max_length=review_queue.MAX_CLAIM)
+    lease_seconds: int = Field(review_queue.DEFAULT_LEASE_SECONDS, ge=1, le=review_queue.MAX_LEASE_SECONDS)
+
 class TransactionScoreRequest(BaseModel):
     amount: float = Field(..., gt=0)
     sender_balance: float
@@ -129,15 +212,14 @@ def validate_expiry(expiry_date: str) -> bool:
         print(f"Expiry validation error: {e}")
         return False
 
-async def validate_payment_details(account_number: str, cvv: str, expiry: str) -> dict:
+async def validate_payment_details(account_number: str, cvv: str, expiry: str,
+                                   amount: float = None, reference: str = None) -> dict:
     """
-    Simulate payment gateway validation (Stripe, PayPal, etc.)
-    In production, this would call actual payment gateway API
+    Validate card details, then authorize with the payment gateway (see gateway.py)
     Real gateways validate CVV without storing it
     
-    For demo purposes:
-    - Any 3-4 digit CVV is accepted (simulating successful gateway auth)
-    - In production, the payment gateway validates CVV securely
+    - CVV format and expiry are checked locally first so obviously bad input never leaves the process
+    - Without PAYMENT_GATEWAY_URL (development) a valid format is accepted as authorized
     - CVV is NEVER stored in our database (PCI-DSS compliance)
     """
     try:
@@ -155,38 +237,40 @@ async def validate_payment_details(account_number: str, cvv: str, expiry: str) -
         if not validate_expiry(expiry):
             return {"valid": False, "reason": "Card has expired"}
         
-        # Simulate payment gateway authorization
-        # In real systems: stripe.PaymentIntent.create(amount, card_token)
+        if not gateway.enabled:
+            print(f"✅ Payment gateway validated CVV format: {len(cvv)} digits")
+            return {"valid": True, "reason": "Payment authorized by gateway"}
+        
         # The gateway validates CVV against the card network (Visa/Mastercard/etc)
         # and returns success/failure WITHOUT revealing if CVV was wrong
+        result = await gateway.authorize(
+            {"card_number": account_number, "cvv": cvv, "expiry": expiry, "amount": amount, "reference": reference},
+            idempotency_key=reference or uuid.uuid4().hex
+        )
+        return {
+            "valid": bool(result.get("approved")),
+            "reason": result.get("reason", "Payment declined by gateway"),
+            "authorization_id": result.get("authorization_id")
+        }
         
-        # For demo: Accept all valid format CVVs
-        # In production: Gateway does cryptographic validation
-        print(f"✅ Payment gateway validated CVV format: {len(cvv)} digits")
-        return {"valid": True, "reason": "Payment authorized by gateway"}
-        
+    except GatewayUnavailable as e:
+        print(f"⚠️ {e}")
+        return {"valid": False, "reason": "Payment gateway unavailable", "unavailable": True}
     except Exception as e:
         print(f"❌ Payment gateway error: {e}")
         return {"valid": False, "reason": "Payment gateway error"}
     
-async def get_device_info(user_agent: str) -> dict:
-    return {
-        "user_agent": user_agent or "Unknown",
-        "device_type": "mobile" if user_agent and "Mobile" in user_agent else "desktop",
-        "browser": "chrome" if user_agent and "Chrome" in user_agent else "other"
-    }
-
 async def calculate_velocity_features(user_id: str) -> dict:
     now = datetime.utcnow()
     last_24h = now - timedelta(hours=24)
     last_1h = now - timedelta(hours=1)
     
-    txn_24h = await transactions_collection.count_documents({
+    txn_24h = await dal.transactions.count_documents({
         "user_id": user_id,
         "timestamp": {"$gte": last_24h}
     })
     
-    txn_1h = await transactions_collection.count_documents({
+    txn_1h = await dal.transactions.count_documents({
         "user_id": user_id,
         "timestamp": {"$gte": last_1h}
     })
@@ -195,7 +279,7 @@ async def calculate_velocity_features(user_id: str) -> dict:
         {"$match": {"user_id": user_id, "timestamp": {"$gte": last_24h}}},
         {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
     ]
-    volume_result = await transactions_collection.aggregate(pipeline).to_list(1)
+    volume_result = await dal.transactions.aggregate(pipeline).to_list(1)
     volume_24h = volume_result[0]["total"] if volume_result else 0
     
     return {
@@ -206,7 +290,7 @@ async def calculate_velocity_features(user_id: str) -> dict:
     }
 
 async def check_blacklist(account_number: str) -> bool:
-    blacklist = await db.blacklist.find_one({"account_number": account_number})
+    blacklist = await dal.blacklist.find_one({"account_number": account_number})
     return blacklist is not None
 
 # ============= HEALTH CHECK =============
@@ -217,16 +301,61 @@ async def root():
 @app.get("/api/health")
 async def health_check():
     try:
-        await users_collection.find_one({})
+        await dal.users.find_one({})
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
 
+@app.get("/api/v2/metrics/db-pool")
+async def db_pool_metrics():
+    """Mongo connection pool checkout and wait-time metrics for this process"""
+    return dal.metrics.snapshot()
+
+@app.get("/api/v2/metrics/gateway")
+async def gateway_metrics():
+    """Payment gateway client attempts, hedges, retries and circuit breaker state for this process"""
+    return gateway.snapshot()
+
+@app.get("/api/v2/metrics/cascade")
+async def cascade_metrics():
+    """Per-stage exit rates and latency of cascaded scoring for this process"""
+    return cascade.snapshot()
+
+@app.get("/api/v2/model")
+async def model_info():
+    """Version, training data hash, parameters and validation metrics of the serving model"""
+    if model_manifest:
+        return {k: v for k, v in model_manifest.items() if k != "path"}
+    return {"version": "legacy-pickle" if cascade.ready else None, "features": MODEL_FEATURES}
+
+@app.get("/api/v2/metrics/inference")
+async def inference_metrics():
+    """Full-model batch sizes across the HTTP and WebSocket scoring paths, for this process"""
+    return batcher.snapshot()
+
+@app.get("/api/v2/metrics/analytics-store")
+async def analytics_store_metrics():
+    return await asyncio.get_running_loop().run_in_executor(None, analytics_store.snapshot)
+
+@app.get("/api/v2/metrics/feature-log")
+async def feature_log_metrics():
+    """Records queued, written and dropped by this process's feature log writer"""
+    return feature_log.snapshot()
+
+@app.get("/api/v2/metrics/list-cache")
+async def list_cache_metrics():
+    return list_cache.list_cache.snapshot()
+
+@app.get("/api/v2/metrics/drift")
+async def drift_metrics():
+    """PSI/KS of live model inputs and ML scores against the training reference, for this process"""
+    return drift_monitor.report()
+
 # ============= USER ENDPOINTS =============
 @app.post("/api/user/create")
 async def create_user(user_data: UserCreate):
     try:
-        existing = await users_collection.find_one({"email": user_data.email})
+        existing = await dal.users.find_one({"email": user_data.email})
         if existing:
             existing["_id"] = str(existing["_id"])
             return {"user": existing}
@@ -242,7 +371,7 @@ async def create_user(user_data: UserCreate):
             "created_at": datetime.utcnow()
         }
         
-        result = await users_collection.insert_one(user_dict)
+        result = await dal.users.insert_one(user_dict)
         user_dict["_id"] = str(result.inserted_id)
         
         return {"user": user_dict, "message": "User created successfully"}
@@ -253,7 +382,7 @@ async def create_user(user_data: UserCreate):
 @app.post("/api/user/by-email")
 async def get_user_by_email(request: UserByEmail):
     try:
-        user = await users_collection.find_one({"email": request.email})
+        user = await dal.users.find_one({"email": request.email})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -276,7 +405,7 @@ async def create_account(account: AccountCreate, authorization: str = Header(Non
             raise HTTPException(status_code=401, detail="Authorization header required")
         
         user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
+        user = await dal.users.find_one({"email": user_email})
         
         if not user:
             print(f"❌ User not found: {user_email}")
@@ -285,7 +414,7 @@ async def create_account(account: AccountCreate, authorization: str = Header(Non
         print(f"✅ User found: {user['email']}")
         
         # Check if account already exists
-        existing = await accounts_collection.find_one({
+        existing = await dal.accounts.find_one({
             "user_id": str(user["_id"]),
             "account_number": account.account_number
         })
@@ -309,7 +438,8 @@ async def create_account(account: AccountCreate, authorization: str = Header(Non
             # CVV intentionally NOT stored
         }
         
-        result = await accounts_collection.insert_one(account_data)
+        result = await dal.accounts.insert_one(account_data)
+        await list_cache.bump(dal.users, [str(user["_id"])], ACCOUNTS)
         account_data["_id"] = str(result.inserted_id)
         account_data["account_number"] = mask_account(account_data["account_number"])
         
@@ -324,32 +454,55 @@ async def create_account(account: AccountCreate, authorization: str = Header(Non
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+async def serve_user_list(kind: str, authorization: str, if_none_match: Optional[str], response: Response, load):
+    """
+    Conditional GET for a per-user list (see list_cache.py).
+    ``load(user_id)`` builds the body; it only runs when the list version changed.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    cache = list_cache.list_cache
+    headers = {"Cache-Control": list_cache.CACHE_CONTROL, "Vary": "Authorization"}
+    
+    entry = cache.fresh(authorization, kind)
+    if entry and list_cache.etag_matches(if_none_match, entry[3]):
+        cache.stats["not_modified_local"] += 1
+        return Response(status_code=304, headers={**headers, "ETag": entry[3]})
+    
+    user = await dal.users.find_one({"email": authorization}, {"_id": 1, list_cache.VERSIONS_FIELD: 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_id = str(user["_id"])
+    version = user.get(list_cache.VERSIONS_FIELD, {}).get(kind, 0)
+    
+    entry = cache.get(authorization, kind)
+    if entry and entry[1] == user_id and entry[2] == version:
+        cache.touch(entry)
+        if list_cache.etag_matches(if_none_match, entry[3]):
+            cache.stats["not_modified_version"] += 1
+            return Response(status_code=304, headers={**headers, "ETag": entry[3]})
+        cache.stats["body_cached"] += 1
+    else:
+        entry = cache.put(authorization, kind, user_id, version, await load(user_id))
+        cache.stats["loaded"] += 1
+    
+    response.headers.update({**headers, "ETag": entry[3]})
+    return entry[4]
+
 @app.get("/api/accounts/list")
-async def list_accounts(authorization: str = Header(None)):
-    try:
-        print(f"📥 Fetching accounts for: {authorization}")
-        
-        if not authorization:
-            raise HTTPException(status_code=401, detail="Authorization header required")
-        
-        user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
-        
-        if not user:
-            print(f"❌ User not found: {user_email}")
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        cursor = accounts_collection.find({"user_id": str(user["_id"])})
-        accounts = await cursor.to_list(length=100)
-        
+async def list_accounts(response: Response, authorization: str = Header(None),
+                        if_none_match: Optional[str] = Header(None)):
+    async def load(user_id):
+        accounts = await dal.accounts.find({"user_id": user_id}, {APPLIED_FIELD: 0}).to_list(length=100)
         for acc in accounts:
             acc["_id"] = str(acc["_id"])
             acc["account_number"] = mask_account(acc["account_number"])
             acc.pop("cvv", None)
-        
         print(f"✅ Found {len(accounts)} accounts")
         return {"accounts": accounts}
-        
+    
+    try:
+        return await serve_user_list(ACCOUNTS, authorization, if_none_match, response, load)
     except HTTPException:
         raise
     except Exception as e:
@@ -364,7 +517,7 @@ async def create_contact(contact: ContactCreate, authorization: str = Header(Non
             raise HTTPException(status_code=401, detail="Authorization header required")
         
         user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
+        user = await dal.users.find_one({"email": user_email})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -378,8 +531,10 @@ async def create_contact(contact: ContactCreate, authorization: str = Header(Non
             "created_at": datetime.utcnow()
         }
         
-        result = await contacts_collection.insert_one(contact_data)
+        result = await dal.contacts.insert_one(contact_data)
+        await list_cache.bump(dal.users, [contact_data["user_id"]], CONTACTS)
         contact_data["_id"] = str(result.inserted_id)
+        known_payees.add(contact_data["user_id"], contact.account_number)
         
         return {"message": "Contact saved", "contact": contact_data}
     except HTTPException:
@@ -389,31 +544,142 @@ async def create_contact(contact: ContactCreate, authorization: str = Header(Non
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/contacts/list")
-async def list_contacts(authorization: str = Header(None)):
+async def list_contacts(response: Response, authorization: str = Header(None),
+                        if_none_match: Optional[str] = Header(None)):
+    async def load(user_id):
+        contacts = await dal.contacts.find({"user_id": user_id}).to_list(length=100)
+        for contact in contacts:
+            contact["_id"] = str(contact["_id"])
+        return {"contacts": contacts}
+    
+    try:
+        return await serve_user_list(CONTACTS, authorization, if_none_match, response, load)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error listing contacts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============= PAYMENT WIDGET =============
+# Only the fields the widget renders; account numbers of the caller's own cards are masked
+WIDGET_ACCOUNT_FIELDS = {"bank_name": 1, "account_number": 1, "account_type": 1, "balance": 1, "is_primary": 1}
+WIDGET_CONTACT_FIELDS = {"nickname": 1, "contact_name": 1, "account_number": 1, "bank_name": 1}
+WIDGET_HISTORY_FIELDS = {"_id": 0, "transaction_id": 1, "amount": 1, "decision": 1, "payment_type": 1, "timestamp": 1}
+WIDGET_HISTORY_LIMIT = 5
+
+@app.get("/api/v2/widget/bootstrap")
+async def widget_bootstrap(authorization: str = Header(None)):
+    """Everything the payment widget needs on load: one identity lookup, three concurrent reads"""
     try:
         if not authorization:
             raise HTTPException(status_code=401, detail="Authorization header required")
         
-        user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
-        
+        user = await dal.users.find_one({"email": authorization}, {"_id": 1})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
+        user_id = str(user["_id"])
         
-        cursor = contacts_collection.find({"user_id": str(user["_id"])})
-        contacts = await cursor.to_list(length=100)
-        
+        accounts, contacts, transactions = await asyncio.gather(
+            dal.accounts.find({"user_id": user_id}, WIDGET_ACCOUNT_FIELDS).to_list(length=100),
+            dal.contacts.find({"user_id": user_id}, WIDGET_CONTACT_FIELDS).to_list(length=100),
+            archive.find_across_tiers("transactions", {"user_id": user_id}, limit=WIDGET_HISTORY_LIMIT,
+                                      projection=WIDGET_HISTORY_FIELDS)
+        )
+        for acc in accounts:
+            acc["_id"] = str(acc["_id"])
+            acc["account_number"] = mask_account(acc["account_number"])
         for contact in contacts:
             contact["_id"] = str(contact["_id"])
         
-        return {"contacts": contacts}
+        return {"accounts": accounts, "contacts": contacts, "transactions": transactions}
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error listing contacts: {e}")
+        print(f"❌ Error loading widget: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============= TRANSACTION ENDPOINTS =============
+async def score_transaction(request: TransactionScoreRequest) -> dict:
+    """Rules plus cascaded ML score for one transaction (score endpoint and WebSocket channel)"""
+    # Calculate derived features
+    sender_balance_after = request.sender_balance - request.amount
+    receiver_balance_after = request.receiver_balance + request.amount
+
+    drain_pct = (request.amount / request.sender_balance * 100) if request.sender_balance > 0 else 0
+
+    # Business rule validation (shared rule table, see rules.py)
+    rule_result = rule_engine.evaluate({
+        "amount": request.amount,
+        "sender_balance": request.sender_balance,
+        "receiver_balance": request.receiver_balance,
+        "payment_type": request.payment_type,
+        "transactions_1h": request.transactions_1h,
+        "transactions_24h": request.transactions_24h,
+        "drain_pct": drain_pct
+    })
+    risk_factors = rule_result["risk_factors"]
+    rule_score = rule_result["rule_score"]
+    high_velocity = "high_velocity" in rule_result["fired_rules"]
+
+    # ML Model prediction (skipped when the rules already settle the decision)
+    ml_score = 0.0
+    ml_stage = None
+
+    # Same 22 features as training; built for every request so the drift monitor
+    # sees this traffic too (the WebSocket channel scores through here as well)
+    model_inputs = build_feature_vector(
+        request.amount, request.sender_balance, request.receiver_balance, request.payment_type,
+        request.transactions_24h, request.transactions_1h,
+        request.amount * request.transactions_24h  # volume_24h approximation
+    )
+
+    if batcher.ready:
+        try:
+            ml_result = await batcher.score(rule_score, rule_result["is_critical"], lambda: model_inputs)
+            ml_score, ml_stage = ml_result["ml_score"], ml_result["ml_stage"]
+            drift_monitor.observe(model_inputs, ml_score if ml_stage == "full" else None)
+
+            print(f"✅ ML Model score: {ml_score:.3f} ({ml_stage} stage)")
+
+        except Exception as e:
+            print(f"⚠️ ML prediction error: {e}")
+            ml_score = 0.0
+
+
+    # ===== FINAL DECISION: HYBRID SCORING =====
+    # Strategy: Trust business rules when they say it's safe, even if ML disagrees
+    final_score = combine_scores(rule_score, ml_score)
+    print(f"⚙️ Hybrid scoring: rule={rule_score:.3f}, ml={ml_score:.3f} → final={final_score:.3f}")
+
+    decision, risk_level = decide(final_score, rule_result["is_critical"])
+
+    if not risk_factors:
+        risk_factors.append("No specific risk factors detected")
+
+    return {
+        "decision": decision,
+        "risk_level": risk_level,
+        "risk_score": final_score,
+        "ml_score": ml_score,
+        "ml_stage": ml_stage,
+        "rule_score": rule_score,
+        "risk_factors": risk_factors,
+        "fired_rules": rule_result["fired_rules"],
+        "rules_version": rule_result["rules_version"],
+        "message": f"Transaction would be {decision.lower()}ed",
+        "features": {
+            "amount": request.amount,
+            "sender_balance": request.sender_balance,
+            "receiver_balance": request.receiver_balance,
+            "amount_to_balance_ratio": request.amount / request.sender_balance if request.sender_balance > 0 else 0,
+            "drain_percentage": drain_pct,
+            "transactions_24h": request.transactions_24h,
+            "transactions_1h": request.transactions_1h,
+            "high_velocity": high_velocity
+        }
+    }
+
+
 @app.post("/api/v1/transactions/score")
 async def calculate_transaction_score(request: TransactionScoreRequest):
     """
@@ -421,166 +687,116 @@ async def calculate_transaction_score(request: TransactionScoreRequest):
     Used by Developer Dashboard to test the ML model
     """
     try:
-        # Calculate derived features
-        sender_balance_after = request.sender_balance - request.amount
-        receiver_balance_after = request.receiver_balance + request.amount
-        
-        drain_pct = (request.amount / request.sender_balance * 100) if request.sender_balance > 0 else 0
-        
-        # Business rule validation
-        risk_factors = []
-        rule_score = 0.0
-        
-        # Rule 1: Insufficient funds
-        if request.amount > request.sender_balance:
-            risk_factors.append(f"Insufficient funds: ${request.sender_balance:.2f} available, ${request.amount:.2f} requested")
-            rule_score = 1.0
-        
-        # Rule 2: High velocity
-        high_velocity = request.transactions_1h > 5 or request.transactions_24h > 20
-        if high_velocity:
-            risk_factors.append(f"High velocity: {request.transactions_1h} txns/hour, {request.transactions_24h} txns/day")
-            rule_score = max(rule_score, 0.65)
-        
-        # Rule 3: Account drain
-        if drain_pct > 90:
-            risk_factors.append(f"Critical account drain: {drain_pct:.1f}%")
-            rule_score = max(rule_score, 0.75)
-        elif drain_pct > 70:
-            risk_factors.append(f"High account drain: {drain_pct:.1f}%")
-            rule_score = max(rule_score, 0.55)
-        
-        # Rule 4: Large transaction
-        if request.amount > 50000:
-            risk_factors.append(f"Large transaction: ${request.amount:,.2f}")
-            rule_score = max(rule_score, 0.4)
-        
-        # Rule 5: Cash-out pattern
-        if request.payment_type == 'CASH_OUT' and request.amount > 10000:
-            risk_factors.append("Large cash-out transaction")
-            rule_score = max(rule_score, 0.5)
-        
-        # ML Model prediction
-        ml_score = 0.0
-        
-        if model and scaler:
-            try:
-                # Prepare features (same 22 features as training)
-                features = np.array([[
-                    request.amount,
-                    request.sender_balance,
-                    sender_balance_after,
-                    request.receiver_balance,
-                    receiver_balance_after,
-                    request.amount / request.sender_balance if request.sender_balance > 0 else 0,
-                    1 if request.payment_type == 'TRANSFER' else 0,
-                    1 if request.payment_type == 'CASH_OUT' else 0,
-                    1 if request.payment_type == 'PAYMENT' else 0,
-                    1 if request.payment_type == 'DEBIT' else 0,
-                    1 if request.payment_type == 'CASH_IN' else 0,
-                    request.transactions_24h,
-                    request.transactions_1h,
-                    request.amount * request.transactions_24h,  # volume_24h approximation
-                    drain_pct / 100,
-                    1 if drain_pct > 90 else 0,
-                    1 if drain_pct > 70 else 0,
-                    1 if request.transactions_1h > 5 else 0,
-                    1 if request.transactions_24h > 20 else 0,
-                    abs(request.sender_balance - request.receiver_balance) / max(request.sender_balance, request.receiver_balance, 1),
-                    1 if request.amount > 50000 else 0,
-                    np.log1p(request.amount)
-                ]])
-                
-                features_scaled = scaler.transform(features)
-                ml_prediction = model.predict_proba(features_scaled)[0]
-                ml_score = float(ml_prediction[1])
-                
-                print(f"✅ ML Model score: {ml_score:.3f}")
-                
-            except Exception as e:
-                print(f"⚠️ ML prediction error: {e}")
-                ml_score = 0.0
-        
-        
-        # ===== FINAL DECISION: HYBRID SCORING =====
-        # Strategy: Trust business rules when they say it's safe, even if ML disagrees
-        
-        if rule_score >= 0.3:
-            # Business rules detected real issues → use maximum (conservative)
-            final_score = max(rule_score, ml_score)
-            print(f"⚙️ Conservative mode: Business rules flagged risk (rule={rule_score:.3f}, ml={ml_score:.3f}) → final={final_score:.3f}")
-        
-        elif ml_score > 0.5:
-            # Business rules say SAFE (< 0.3) but ML suspicious (> 0.5)
-            # Use weighted average: trust business rules MORE (60%) than ML 40%)
-            final_score = (rule_score * 0.6) + (ml_score * 0.4)
-            print(f"⚙️ Weighted scoring: Business rules safe (rule={rule_score:.3f}), ML suspicious (ml={ml_score:.3f}) → final={final_score:.3f}")
-        
-        else:
-            # Both agree it's safe (rule < 0.3, ml <= 0.5)
-            final_score = max(rule_score, ml_score)
-            print(f"✅ Both systems agree: safe transaction (rule={rule_score:.3f}, ml={ml_score:.3f}) → final={final_score:.3f}")
-            
-        '''
-        if rule_score < 0.3 and ml_score > 0.7:
-            # ML thinks it's fraud, but business rules are OK
-            # Use weighted average instead of maximum
-            final_score = (rule_score * 0.75) + (ml_score * 0.25)
-            print(f"⚙️ Applying weighted scoring: Business rules look OK, ML is suspicious")
-        else:
-            # Otherwise use maximum (conservative approach)
-            final_score = max(rule_score, ml_score)
-        '''
-
-        # Determine decision
-        if final_score > 0.7:
-            decision = "BLOCK"
-            risk_level = "CRITICAL"
-        elif final_score > 0.5:
-            decision = "REVIEW"
-            risk_level = "HIGH"
-        elif final_score > 0.3:
-            decision = "REVIEW"
-            risk_level = "MEDIUM"
-        else:
-            decision = "APPROVE"
-            risk_level = "LOW"
-        
-        if not risk_factors:
-            risk_factors.append("No specific risk factors detected")
-        
-        return {
-            "decision": decision,
-            "risk_level": risk_level,
-            "risk_score": final_score,
-            "ml_score": ml_score,
-            "rule_score": rule_score,
-            "risk_factors": risk_factors,
-            "message": f"Transaction would be {decision.lower()}ed",
-            "features": {
-                "amount": request.amount,
-                "sender_balance": request.sender_balance,
-                "receiver_balance": request.receiver_balance,
-                "amount_to_balance_ratio": request.amount / request.sender_balance if request.sender_balance > 0 else 0,
-                "drain_percentage": drain_pct,
-                "transactions_24h": request.transactions_24h,
-                "transactions_1h": request.transactions_1h,
-                "high_velocity": high_velocity
-            }
-        }
-        
+        return await score_transaction(request)
     except Exception as e:
         print(f"❌ Error calculating score: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+# Requests a merchant connection may have scoring at once; further frames stay unread
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "64"))
+
+@app.websocket("/api/v2/ws/score")
+async def score_stream(websocket: WebSocket):
+    """
+    Persistent scoring channel for merchant backends.
+    Send score requests as JSON frames tagged with an "id"; each answer is
+    {"id": ..., "result": {...}} or {"id": ..., "error": "..."}, in completion order.
+    At most WS_MAX_IN_FLIGHT requests per connection are scored at once; beyond that
+    frames are not read, so TCP flow control pushes back on the merchant.
+    """
+    await websocket.accept()
+    in_flight = asyncio.Semaphore(WS_MAX_IN_FLIGHT)
+    send_lock = asyncio.Lock()
+    tasks = set()
+
+    async def send(message: dict):
+        async with send_lock:
+            try:
+                await websocket.send_json(message)
+            except (WebSocketDisconnect, RuntimeError):
+                pass    # merchant went away; the receive loop notices
+
+    async def handle(tag, payload):
+        try:
+            result = await score_transaction(TransactionScoreRequest.model_validate(payload))
+            await send({"id": tag, "result": result})
+        except ValidationError as e:
+            await send({"id": tag, "error": f"Invalid request: {e.errors(include_url=False)}"})
+        except Exception as e:
+            print(f"❌ Error scoring streamed request: {e}")
+            await send({"id": tag, "error": str(e)})
+        finally:
+            in_flight.release()
+
+    await send({"type": "ready", "max_in_flight": WS_MAX_IN_FLIGHT})
+    try:
+        while True:
+            await in_flight.acquire()
+            try:
+                payload = json.loads(await websocket.receive_text())
+            except ValueError:
+                in_flight.release()
+                await send({"id": None, "error": "Frames must be JSON objects"})
+                continue
+            tag = payload.pop("id", None) if isinstance(payload, dict) else None
+            task = asyncio.create_task(handle(tag, payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
     
 @app.post("/api/v2/transactions/process")
 async def process_enhanced_transaction(
     txn: EnhancedTransactionRequest,
+    response: Response,
     authorization: str = Header(None),
-    user_agent: str = Header(None)
+    user_agent: str = Header(None),
+    sec_ch_ua: Optional[str] = Header(None),
+    sec_ch_ua_mobile: Optional[str] = Header(None),
+    sec_ch_ua_platform: Optional[str] = Header(None),
+    x_device_id: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
+    """
+    Process a payment. With an Idempotency-Key header, retries of the same
+    request return the stored decision instead of re-scoring and re-debiting.
+    """
+    device_info = fingerprint(user_agent, sec_ch_ua, sec_ch_ua_mobile, sec_ch_ua_platform, x_device_id)
+    if not idempotency_key:
+        return await execute_transaction(txn, authorization, device_info)
+    
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header required")
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+    
+    # CVV is never hashed or stored, even as part of the fingerprint
+    body_fingerprint = request_fingerprint(txn.model_dump(exclude={"cvv"}))
+    try:
+        result, replayed = await idempotency_store.run(
+            dal.db[IDEMPOTENCY_COLLECTION],
+            f"{authorization}:{idempotency_key}",
+            body_fingerprint,
+            lambda: execute_transaction(txn, authorization, device_info)
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def execute_transaction(txn: EnhancedTransactionRequest, authorization: str, device_info: dict):
+    # The gateway hold is kept for an approved payment and for one sent to review
+    # (an admin may still approve it; reject voids it). Blocks and errors void it
+    # in the finally below
+    authorization_id = None
+    keep_hold = False
     try:
         transaction_id = f"TXN{uuid.uuid4().hex[:12].upper()}"
         timestamp = datetime.utcnow()
@@ -589,7 +805,7 @@ async def process_enhanced_transaction(
             raise HTTPException(status_code=401, detail="Authorization header required")
         
         user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
+        user = await dal.users.find_one({"email": user_email})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -598,7 +814,7 @@ async def process_enhanced_transaction(
         if hasattr(txn, 'sender_account_id') and txn.sender_account_id:
             # User explicitly selected an account
             from bson import ObjectId
-            sender_account = await accounts_collection.find_one({
+            sender_account = await dal.accounts.find_one({
                 "_id": ObjectId(txn.sender_account_id),
                 "user_id": str(user["_id"])
             })
@@ -606,7 +822,7 @@ async def process_enhanced_transaction(
                 raise HTTPException(status_code=404, detail="Selected account not found")
         else:
             # Fallback to primary account (for backward compatibility)
-            sender_account = await accounts_collection.find_one({
+            sender_account = await dal.accounts.find_one({
                 "user_id": str(user["_id"]),
                 "is_primary": True
             })
@@ -618,9 +834,16 @@ async def process_enhanced_transaction(
         payment_validation = await validate_payment_details(
             sender_account["account_number"],
             txn.cvv,
-            sender_account["expiry_date"]
+            sender_account["expiry_date"],
+            amount=txn.amount,
+            reference=transaction_id
         )
         
+        if payment_validation.get("unavailable"):
+            # Not a decline: nothing is recorded and the client may retry with the same Idempotency-Key
+            raise HTTPException(status_code=503, detail="Payment gateway unavailable, please retry")
+        authorization_id = payment_validation.get("authorization_id")
+        
         if not payment_validation["valid"]:
             return {
                 "transaction_id": transaction_id,
@@ -643,109 +866,75 @@ async def process_enhanced_transaction(
             }
         
         # ===== CALCULATE VELOCITY FROM DATABASE =====
-        velocity = await calculate_velocity_features(str(user["_id"]))
-        
-        # Get device info
-        device_info = await get_device_info(user_agent)
+        # A cold known-payee entry loads alongside the velocity queries; warm users hit memory
+        velocity, _ = await asyncio.gather(
+            calculate_velocity_features(str(user["_id"])),
+            known_payees.prefetch(str(user["_id"]))
+        )
         
         # Calculate balances
         sender_balance_before = sender_account["balance"]
         sender_balance_after = sender_balance_before - txn.amount
         
         # Get receiver account
-        receiver_account = await accounts_collection.find_one({
+        receiver_account = await dal.accounts.find_one({
             "account_number": txn.receiver_account
         })
         receiver_balance_before = receiver_account["balance"] if receiver_account else 0
         receiver_balance_after = receiver_balance_before + txn.amount
         
         # ===== BUSINESS RULE VALIDATION =====
-        risk_factors = []
-        rule_score = 0.0
-        is_critical = False
-        
-        # Rule 1: Insufficient funds (CRITICAL)
-        if txn.amount > sender_balance_before:
-            risk_factors.append(f"Insufficient funds: ${sender_balance_before:.2f} available, ${txn.amount:.2f} requested")
-            rule_score = 1.0
-            is_critical = True
-        
-        # Rule 2: High velocity
-        if velocity["high_velocity"]:
-            risk_factors.append(f"High transaction velocity: {velocity['transactions_1h']} txns in last hour, {velocity['transactions_24h']} in last 24h")
-            rule_score = max(rule_score, 0.65)
-        
-        # Rule 3: High account drain
         drain_pct = (txn.amount / sender_balance_before) * 100 if sender_balance_before > 0 else 0
-        if drain_pct > 90:
-            risk_factors.append(f"Critical account drain: {drain_pct:.1f}% of balance")
-            rule_score = max(rule_score, 0.75)
-        elif drain_pct > 70:
-            risk_factors.append(f"High account drain: {drain_pct:.1f}% of balance")
-            rule_score = max(rule_score, 0.55)
-        # 3.3: Moderate drain (>50%) - Warning level
-        elif drain_pct > 50:
-            risk_factors.append(f"Moderate account drain: {drain_pct:.1f}% of balance")
-            rule_score = max(rule_score, 0.35)
-        
-        # Rule 4: Large transaction
-        # 3.4: Large absolute amount (even if percentage is low)
-        if txn.amount > 75000:
-            risk_factors.append(f"Very large transaction amount: ${txn.amount:,.2f}")
-            rule_score = max(rule_score, 0.6)
-        if txn.amount > 50000:
-            risk_factors.append(f"Large transaction amount: ${txn.amount:,.2f}")
-            rule_score = max(rule_score, 0.4)
-        
-        # Rule 5: Unusual transaction pattern
-        if txn.payment_type == 'CASH_OUT' and txn.amount > 10000:
-            risk_factors.append("Large cash-out transaction")
-            rule_score = max(rule_score, 0.5)
+        fan_in = receiver_fanin.features(txn.receiver_account)
+        known_payee = known_payees.is_known(str(user["_id"]), txn.receiver_account)
+        device_signals = device_index.signals(device_info["device_id"], str(user["_id"]))
+        rule_result = rule_engine.evaluate({
+            "amount": txn.amount,
+            "sender_balance": sender_balance_before,
+            "receiver_balance": receiver_balance_before,
+            "payment_type": txn.payment_type,
+            "transactions_1h": velocity["transactions_1h"],
+            "transactions_24h": velocity["transactions_24h"],
+            "drain_pct": drain_pct,
+            # Left out when the payee index couldn't be loaded
+            **({"first_time_payee": not known_payee} if known_payee is not None else {}),
+            **profile_features(user.get("spending_profile"), txn.amount),
+            "device_id_source": device_info["device_id_source"],
+            **device_signals,
+            **fan_in
+        })
+        risk_factors = rule_result["risk_factors"]
+        rule_score = rule_result["rule_score"]
+        is_critical = rule_result["is_critical"]
         
         # ===== ML MODEL PREDICTION =====
+        # Cascaded: skipped when the rules alone settle the decision (see cascade.py)
         ml_score = 0.0
+        ml_stage = None
         ml_features = None
         
-        if model and scaler:
+        # Built for every payment: the drift monitor and alert explanations need them too
+        model_inputs = build_feature_vector(
+            txn.amount, sender_balance_before, receiver_balance_before, txn.payment_type,
+            velocity['transactions_24h'], velocity['transactions_1h'], velocity['volume_24h']
+        )
+        
+        if batcher.ready:
             try:
-                features = np.array([[
-                    txn.amount,
-                    sender_balance_before,
-                    sender_balance_after,
-                    receiver_balance_before,
-                    receiver_balance_after,
-                    txn.amount / sender_balance_before if sender_balance_before > 0 else 0,
-                    1 if txn.payment_type == 'TRANSFER' else 0,
-                    1 if txn.payment_type == 'CASH_OUT' else 0,
-                    1 if txn.payment_type == 'PAYMENT' else 0,
-                    1 if txn.payment_type == 'DEBIT' else 0,
-                    1 if txn.payment_type == 'CASH_IN' else 0,
-                    velocity['transactions_24h'],
-                    velocity['transactions_1h'],
-                    velocity['volume_24h'],
-                    drain_pct / 100,
-                    1 if drain_pct > 90 else 0,
-                    1 if drain_pct > 70 else 0,
-                    1 if velocity['transactions_1h'] > 5 else 0,
-                    1 if velocity['transactions_24h'] > 20 else 0,
-                    abs(sender_balance_before - receiver_balance_before) / max(sender_balance_before, receiver_balance_before, 1),
-                    1 if txn.amount > 50000 else 0,
-                    np.log1p(txn.amount)
-                ]])
-                
-                features_scaled = scaler.transform(features)
-                ml_prediction = model.predict_proba(features_scaled)[0]
-                ml_score = float(ml_prediction[1])
+                ml_result = await batcher.score(rule_score, is_critical, lambda: model_inputs)
+                ml_score, ml_stage = ml_result["ml_score"], ml_result["ml_stage"]
+                drift_monitor.observe(model_inputs, ml_score if ml_stage == "full" else None)
                 
                 ml_features = {
                     "amount": txn.amount,
                     "sender_balance": sender_balance_before,
                     "drain_percentage": drain_pct,
                     "transactions_24h": velocity['transactions_24h'],
-                    "transactions_1h": velocity['transactions_1h']
+                    "transactions_1h": velocity['transactions_1h'],
+                    **fan_in
                 }
                 
-                print(f"✅ ML Model prediction: {ml_score:.3f}")
+                print(f"✅ ML Model prediction: {ml_score:.3f} ({ml_stage} stage)")
                 
             except Exception as e:
                 print(f"⚠️ ML prediction error: {e}")
@@ -754,22 +943,7 @@ async def process_enhanced_transaction(
             print("⚠️ ML Model not loaded, using business rules only")
         
         # ===== FINAL DECISION =====
-        # Business rules override: If rule_score is low and ML is high, be lenient
-        if rule_score >= 0.3:
-            # Business rules detected real issues → use maximum (conservative)
-            final_score = max(rule_score, ml_score)
-            print(f"⚙️ Conservative mode: Business rules flagged risk (rule={rule_score:.3f}, ml={ml_score:.3f}) → final={final_score:.3f}")
-        
-        elif ml_score > 0.5:
-            # Business rules say SAFE (< 0.3) but ML suspicious (> 0.5)
-            # Use weighted average: trust business rules MORE 60%) than ML (40%)
-            final_score = (rule_score * 0.6) + (ml_score * 0.4)
-            print(f"⚙️ Weighted scoring: Business rules safe (rule={rule_score:.3f}), ML suspicious (ml={ml_score:.3f}) → final={final_score:.3f}")
-        
-        else:
-            # Both agree it's safe (rule < 0.3, ml <= 0.5)
-            final_score = max(rule_score, ml_score)
-            print(f"✅ Both systems agree: safe transaction (rule={rule_score:.3f}, ml={ml_score:.3f}) → final={final_score:.3f}")
+        final_score = combine_scores(rule_score, ml_score)
 
         print(f"""
         ╔═══════════════════════════════════════╗
@@ -786,23 +960,16 @@ async def process_enhanced_transaction(
         ╚═══════════════════════════════════════╝
         """)
 
-        if is_critical or final_score > 0.7:
-            decision = "BLOCK"
-            risk_level = "CRITICAL"
-        elif final_score > 0.5:
-            decision = "REVIEW"
-            risk_level = "HIGH"
-        elif final_score > 0.3:
-            decision = "REVIEW"
-            risk_level = "MEDIUM"
-        else:
-            decision = "APPROVE"
-            risk_level = "LOW"
+        decision, risk_level = decide(final_score, is_critical)
         
         if not risk_factors and decision != "APPROVE":
             risk_factors.append("ML model detected suspicious patterns")
         
         # ===== SAVE TRANSACTION =====
+        # Stored before any money moves. An approved payment carries a
+        # "settlement": "PENDING" marker until the ledger steps finish, so a
+        # crash or an ambiguous write in between leaves a record that
+        # settlement.py reconciles against the ledger, never an unexplained debit
         transaction_data = {
             "transaction_id": transaction_id,
             "user_id": str(user["_id"]),
@@ -817,50 +984,124 @@ async def process_enhanced_transaction(
             "risk_score": final_score,
             "rule_score": rule_score,
             "ml_score": ml_score,
+            "ml_stage": ml_stage,
             "risk_factors": risk_factors,
+            "fired_rules": rule_result["fired_rules"],
+            "rules_version": rule_result["rules_version"],
+            "gateway_authorization_id": payment_validation.get("authorization_id"),
             "velocity_features": velocity,
-            "device_info": device_info,
+            "device_info": {**device_info, **device_signals},
             "ml_features": ml_features,
             "timestamp": timestamp
         }
+        if decision == "APPROVE":
+            transaction_data.update(settlement="PENDING", settlement_at=timestamp)
+        
+        # Stored compactly (see txn_codec.py); readers get this shape back from decode_transaction
+        stored_features = {**dict(zip(MODEL_FEATURES, model_inputs[0].tolist())), **fan_in, **device_signals}
+        await dal.transactions.insert_one(
+            encode_transaction(transaction_data, stored_features, rule_result["factors"])
+        )
         
-        await transactions_collection.insert_one(transaction_data)
+        async def block_at_settlement(reason: str):
+            nonlocal decision, risk_level, final_score
+            decision, risk_level = "BLOCK", "CRITICAL"
+            final_score = 1.0
+            risk_factors.append(reason)
+            transaction_data.pop("settlement", None)
+            transaction_data.pop("settlement_at", None)
+            transaction_data.update(decision=decision, risk_level=risk_level, risk_score=final_score)
+            await dal.transactions.replace_one(
+                {"transaction_id": transaction_id},
+                encode_transaction(transaction_data, stored_features, rule_result["factors"])
+            )
         
-        # ===== UPDATE BALANCES IF APPROVED =====
+        # ===== SETTLE IF APPROVED =====
+        # Conditional debit: a concurrent payment may have drained the account
+        # since we read it, in which case the guard refuses and we block instead.
+        # Both writes are tagged with the transaction id (see ledger.py)
+        new_balance = sender_balance_before
         if decision == "APPROVE":
-            from bson import ObjectId
-            await accounts_collection.update_one(
-                {"_id": ObjectId(str(sender_account["_id"]))},
-                {"$inc": {"balance": -txn.amount}}
-            )
-            if receiver_account:
-                await accounts_collection.update_one(
-                    {"_id": receiver_account["_id"]},
-                    {"$inc": {"balance": txn.amount}}
+            try:
+                sender_after = await debit_account(dal.accounts, sender_account["_id"], txn.amount,
+                                                   ref=ledger_ref(transaction_id, "debit"))
+                if sender_after is not None and receiver_account:
+                    await credit_account(dal.accounts, receiver_account["_id"], txn.amount,
+                                         ref=ledger_ref(transaction_id, "credit"))
+            except Exception as e:
+                # The write may have been applied. The reconciler settles the record from the
+                # ledger; until then the hold stays and the answer is stored under the
+                # Idempotency-Key, so a retry can't debit again
+                print(f"⚠️ Settlement of {transaction_id} is ambiguous, left to the reconciler: {e}")
+                keep_hold = True
+                return {
+                    "transaction_id": transaction_id,
+                    "decision": decision,
+                    "settlement": "PENDING",
+                    "risk_level": risk_level,
+                    "risk_score": final_score,
+                    "risk_factors": risk_factors if risk_factors else ["No specific risk factors detected"],
+                    "message": "Transaction recorded, settlement is being confirmed"
+                }
+            if sender_after is None:
+                await block_at_settlement("Insufficient funds at settlement")
+            else:
+                new_balance = sender_after["balance"]
+        keep_hold = decision in ("APPROVE", "REVIEW")
+        
+        # ===== BOOKKEEPING =====
+        # Best effort from here on: the payment is recorded and settled, so a
+        # failure below must not turn it into an error the client would retry
+        try:
+            if decision == "APPROVE":
+                await dal.transactions.update_one(
+                    {"transaction_id": transaction_id}, {"$unset": {"settlement": "", "settlement_at": ""}}
                 )
-        
-        # ===== SAVE CONTACT IF REQUESTED =====
-        if txn.save_contact and decision == "APPROVE":
-            await contacts_collection.insert_one({
-                "user_id": str(user["_id"]),
-                "account_number": txn.receiver_account,
-                "bank_name": txn.receiver_bank,
-                "nickname": txn.contact_nickname or "Saved Contact",
-                "created_at": timestamp
-            })
-        
-        # ===== CREATE ALERT IF NEEDED =====
-        if decision in ["BLOCK", "REVIEW"]:
-            await alerts_collection.insert_one({
-                "transaction_id": transaction_id,
-                "user_id": str(user["_id"]),
-                "decision": decision,
-                "risk_level": risk_level,
-                "risk_score": final_score,
-                "risk_factors": risk_factors,
-                "amount": txn.amount,
-                "timestamp": timestamp
-            })
+            feature_log.append(transaction_id, timestamp, feature_vector(stored_features), ml_score, final_score,
+                               decision, ml_stage)
+            receiver_fanin.record(txn.receiver_account, str(user["_id"]), txn.amount)
+            device_index.record(device_info["device_id"], str(user["_id"]))
+            await rollups.record(str(user["_id"]), timestamp, decision=decision,
+                                 approved_amount=txn.amount if decision == "APPROVE" else 0.0)
+            
+            if decision == "APPROVE":
+                known_payees.add(str(user["_id"]), txn.receiver_account)
+                await record_approved(dal.users, str(user["_id"]), txn.amount, timestamp)
+            
+            # ===== SAVE CONTACT IF REQUESTED =====
+            if txn.save_contact and decision == "APPROVE":
+                await dal.contacts.insert_one({
+                    "user_id": str(user["_id"]),
+                    "account_number": txn.receiver_account,
+                    "bank_name": txn.receiver_bank,
+                    "nickname": txn.contact_nickname or "Saved Contact",
+                    "created_at": timestamp
+                })
+            
+            # ===== NEW LIST VERSIONS (balances, saved contact) =====
+            if decision == "APPROVE":
+                receiver_user = receiver_account.get("user_id") if receiver_account else None
+                await list_cache.bump(dal.users, [str(user["_id"]), receiver_user], ACCOUNTS)
+                if txn.save_contact:
+                    await list_cache.bump(dal.users, [str(user["_id"])], CONTACTS)
+            
+            # ===== CREATE ALERT IF NEEDED =====
+            if decision in ["BLOCK", "REVIEW"]:
+                await dal.alerts.insert_one({
+                    "transaction_id": transaction_id,
+                    "user_id": str(user["_id"]),
+                    "decision": decision,
+                    "risk_level": risk_level,
+                    "risk_score": final_score,
+                    "risk_factors": risk_factors,
+                    "amount": txn.amount,
+                    # Raw model inputs; the explanation is computed later (see explain.py)
+                    "model_inputs": model_inputs[0].tolist(),
+                    "explain_pending": True,
+                    "timestamp": timestamp
+                })
+        except Exception as e:
+            print(f"⚠️ Bookkeeping after {transaction_id} failed: {e}")
         
         return {
             "transaction_id": transaction_id,
@@ -869,9 +1110,10 @@ async def process_enhanced_transaction(
             "risk_score": final_score,
             "rule_score": rule_score,
             "ml_score": ml_score,
+            "ml_stage": ml_stage,
             "risk_factors": risk_factors if risk_factors else ["No specific risk factors detected"],
             "message": f"Transaction {decision.lower()}ed",
-            "new_balance": sender_balance_after if decision == "APPROVE" else sender_balance_before
+            "new_balance": new_balance
         }
         
     except HTTPException:
@@ -881,6 +1123,9 @@ async def process_enhanced_transaction(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if authorization_id and not keep_hold:
+            await void_hold(authorization_id)
     
 # ============= ANALYTICS ENDPOINTS =============
 # Replace the get_dashboard_stats function in backend/app.py (around line 490)
@@ -888,19 +1133,37 @@ async def process_enhanced_transaction(
 @app.get("/api/v2/analytics/dashboard")
 async def get_dashboard_stats():
     try:
-        # Total counts (all transactions are logged for auditing)
-        total_txns = await transactions_collection.count_documents({})
-        blocked = await transactions_collection.count_documents({"decision": "BLOCK"})
-        approved = await transactions_collection.count_documents({"decision": "APPROVE"})
-        review = await transactions_collection.count_documents({"decision": "REVIEW"})
-        
-        # ===== FIX: Only count APPROVED transactions in volume =====
-        pipeline = [
-            {"$match": {"decision": "APPROVE"}},  # ← ADDED THIS LINE
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        volume_result = await transactions_collection.aggregate(pipeline).to_list(1)
-        total_volume = volume_result[0]["total"] if volume_result else 0
+        if analytics_store.ready:
+            # Columnar copy (analytics_store.py): no scans on the operational collections
+            totals = await analytics_store.decision_totals()
+            total_txns = totals["documents"]
+            blocked = totals["counts"].get("BLOCK", 0)
+            approved = totals["counts"].get("APPROVE", 0)
+            review = totals["counts"].get("REVIEW", 0)
+            total_volume = totals["approved_volume"]
+        else:
+            # Total counts (all transactions are logged for auditing)
+            # Collection metadata, not a scan of every transaction
+            total_txns = await dal.analytics.transactions.estimated_document_count()
+            blocked = await dal.analytics.transactions.count_documents({"decision": "BLOCK"})
+            approved = await dal.analytics.transactions.count_documents({"decision": "APPROVE"})
+            review = await dal.analytics.transactions.count_documents({"decision": "REVIEW"})
+            
+            # ===== FIX: Only count APPROVED transactions in volume =====
+            pipeline = [
+                {"$match": {"decision": "APPROVE"}},  # ← ADDED THIS LINE
+                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+            ]
+            volume_result = await dal.analytics.transactions.aggregate(pipeline).to_list(1)
+            total_volume = volume_result[0]["total"] if volume_result else 0
+            
+            # Include transactions that have moved to the monthly archives
+            archived = await archive.archived_totals("transactions")
+            total_txns += archived["documents"]
+            blocked += archived["counts"].get("BLOCK", 0)
+            approved += archived["counts"].get("APPROVE", 0)
+            review += archived["counts"].get("REVIEW", 0)
+            total_volume += archived["approved_volume"]
         
         # Calculate average only from approved transactions
         avg_txn = total_volume / approved if approved > 0 else 0
@@ -908,8 +1171,8 @@ async def get_dashboard_stats():
         # Fraud detection rate (blocked out of total attempts)
         fraud_rate = (blocked / total_txns * 100) if total_txns > 0 else 0
         
-        active_users = await users_collection.count_documents({"status": {"$ne": "suspended"}})
-        total_accounts = await accounts_collection.count_documents({})
+        active_users = await dal.analytics.users.count_documents({"status": {"$ne": "suspended"}})
+        total_accounts = await dal.analytics.accounts.estimated_document_count()
         
         return {
             "overview": {
@@ -930,28 +1193,60 @@ async def get_dashboard_stats():
         print(f"Error getting dashboard stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v2/analytics/merchant/timeseries")
+async def get_merchant_timeseries(
+    authorization: str = Header(None),
+    granularity: str = "day",
+    points: int = 90
+):
+    """Per-bucket decision counts and approved volume for the calling merchant, from the rollups"""
+    try:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="Authorization header required")
+        if granularity not in rollups.LEVELS:
+            raise HTTPException(status_code=400, detail=f"granularity must be one of {list(rollups.LEVELS)}")
+        if not 1 <= points <= rollups.ROLLUP_MAX_POINTS:
+            raise HTTPException(status_code=400, detail=f"points must be between 1 and {rollups.ROLLUP_MAX_POINTS}")
+        
+        user = await dal.users.find_one({"email": authorization}, {"_id": 1})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        return {
+            "granularity": granularity,
+            "series": await rollups.series(str(user["_id"]), granularity, points)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting merchant timeseries: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/v2/transactions/history")
 async def get_user_transactions(
     authorization: str = Header(None),
-    limit: int = 20
+    limit: int = 20,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
 ):
     try:
         if not authorization:
             raise HTTPException(status_code=401, detail="Authorization header required")
         
         user_email = authorization
-        user = await users_collection.find_one({"email": user_email})
+        user = await dal.users.find_one({"email": user_email})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        cursor = transactions_collection.find({
-            "user_id": str(user["_id"])
-        }).sort("timestamp", -1).limit(limit)
-        
-        transactions = await cursor.to_list(length=limit)
+        # History reads tolerate bounded staleness → secondaries; archives only
+        # get queried when the hot tier can't fill the requested range
+        transactions = await archive.find_across_tiers(
+            "transactions", {"user_id": str(user["_id"])}, since=since, until=until, limit=limit
+        )
         for txn in transactions:
             txn["_id"] = str(txn["_id"])
+            decode_transaction(txn)
         
         return {"transactions": transactions}
     except HTTPException:
@@ -961,13 +1256,17 @@ async def get_user_transactions(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/transactions/history")
-async def get_all_transactions_v1(limit: int = 20):
+async def get_all_transactions_v1(
+    limit: int = 20,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
     try:
-        cursor = transactions_collection.find({}).sort("timestamp", -1).limit(limit)
-        transactions = await cursor.to_list(length=limit)
+        transactions = await archive.find_across_tiers("transactions", since=since, until=until, limit=limit)
         
         for txn in transactions:
             txn["_id"] = str(txn["_id"])
+            decode_transaction(txn)
         
         return {"transactions": transactions}
     except Exception as e:
@@ -991,12 +1290,16 @@ async def approve_transaction(
         if not authorization:
             raise HTTPException(status_code=401, detail="Authorization required")
         
-        admin_user = await users_collection.find_one({"email": authorization})
+        admin_user = await dal.users.find_one({"email": authorization})
         if not admin_user or admin_user.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admin access required")
         
+        # Someone else's review lease wins (see review_queue.hold)
+        if await review_queue.hold(authorization, [transaction_id]):
+            raise HTTPException(status_code=409, detail="Transaction is leased to another reviewer")
+        
         # Find the transaction
-        transaction = await transactions_collection.find_one({"transaction_id": transaction_id})
+        transaction = await dal.transactions.find_one({"transaction_id": transaction_id})
         
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
@@ -1022,64 +1325,99 @@ async def approve_transaction(
                 detail=f"Transaction status is {transaction['decision']}, only REVIEW status can be approved"
             )
         
-        # Get sender account
-        sender_account = await accounts_collection.find_one({"_id": ObjectId(transaction["sender_account"])})
-        if not sender_account:
-            raise HTTPException(status_code=404, detail="Sender account not found")
-        
-        # Check if sender still has sufficient balance
-        if sender_account["balance"] < transaction["amount"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient balance. Current balance: ${sender_account['balance']}, Required: ${transaction['amount']}"
-            )
-        
-        # Get receiver account (internal or external)
-        receiver_account = await accounts_collection.find_one({
-            "account_number": transaction["receiver_account"]
-        })
-        
-        # ===== UPDATE BALANCES =====
-        # Deduct from sender
-        await accounts_collection.update_one(
-            {"_id": ObjectId(transaction["sender_account"])},
+        # ===== CLAIM THE TRANSACTION =====
+        # Atomic REVIEW → APPROVE so two admins can't settle the same payment twice
+        approved_at = datetime.utcnow()
+        claimed = await dal.transactions.find_one_and_update(
+            {"transaction_id": transaction_id, **unclaimed_filter()},
             {
-                "$inc": {"balance": -transaction["amount"]},
-                "$set": {"last_transaction": datetime.utcnow()}
+                "$set": {
+                    "decision": "APPROVE",
+                    "risk_level": RISK_LEVEL_CODES["ADMIN_APPROVED"],
+                    "approved_by": authorization,
+                    "approved_at": approved_at,
+                    "original_risk_score": transaction.get("risk_score"),
+                    "approval_note": "Manually approved by admin",
+                    # Until the ledger writes are done (see settlement.py)
+                    "settlement": "PENDING",
+                    "settlement_at": approved_at,
+                    "review_risk_level": transaction.get("risk_level")
+                }
             }
         )
+        if not claimed:
+            return {
+                "success": False,
+                "message": "Transaction already reviewed",
+                "transaction_id": transaction_id
+            }
         
-        # Add to receiver (if internal account exists)
-        if receiver_account:
-            await accounts_collection.update_one(
-                {"_id": receiver_account["_id"]},
+        async def return_to_review():
+            await dal.transactions.update_one(
+                {"transaction_id": transaction_id},
                 {
-                    "$inc": {"balance": transaction["amount"]},
-                    "$set": {"last_transaction": datetime.utcnow()}
+                    "$set": {"decision": "REVIEW", "risk_level": transaction.get("risk_level")},
+                    "$unset": {"approved_by": "", "approved_at": "", "original_risk_score": "", "approval_note": "",
+                               "settlement": "", "settlement_at": "", "review_risk_level": ""}
                 }
             )
         
-        # ===== UPDATE TRANSACTION STATUS =====
-        await transactions_collection.update_one(
-            {"transaction_id": transaction_id},
-            {
-                "$set": {
-                    "decision": "APPROVE",
-                    "risk_level": "ADMIN_APPROVED",
-                    "approved_by": authorization,
-                    "approved_at": datetime.utcnow(),
-                    "original_risk_score": transaction.get("risk_score"),
-                    "approval_note": "Manually approved by admin"
-                }
+        # ===== UPDATE BALANCES =====
+        # Conditional debit: fails instead of overdrawing if the balance dropped.
+        # Both writes are tagged with the transaction id (see ledger.py)
+        sender_id = ObjectId(transaction["sender_account"])
+        receiver_account = None
+        try:
+            sender_after = await debit_account(dal.accounts, sender_id, transaction["amount"],
+                                               ref=ledger_ref(transaction_id, "debit"))
+            # Add to receiver (if internal account exists)
+            if sender_after is not None:
+                receiver_account = await dal.accounts.find_one({
+                    "account_number": transaction["receiver_account"]
+                })
+                if receiver_account:
+                    await credit_account(dal.accounts, receiver_account["_id"], transaction["amount"],
+                                         ref=ledger_ref(transaction_id, "credit"))
+        except Exception as e:
+            # The write may have been applied: the reconciler finishes or reverts the approval
+            print(f"⚠️ Settlement of {transaction_id} is ambiguous, left to the reconciler: {e}")
+            return {
+                "success": False,
+                "settlement": "PENDING",
+                "message": "Approval recorded, settlement is being confirmed",
+                "transaction_id": transaction_id
             }
-        )
         
-        # ===== REMOVE FROM ALERTS =====
-        await alerts_collection.delete_many({"transaction_id": transaction_id})
+        if sender_after is None:
+            await return_to_review()
+            sender_account = await dal.accounts.find_one({"_id": sender_id})
+            if not sender_account:
+                raise HTTPException(status_code=404, detail="Sender account not found")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Insufficient balance. Current balance: ${sender_account['balance']}, Required: ${transaction['amount']}"
+            )
+        
+        # ===== BOOKKEEPING =====
+        # Best effort: the money has moved, so these must not fail the approval
+        try:
+            await dal.transactions.update_one(
+                {"transaction_id": transaction_id},
+                {"$unset": {"settlement": "", "settlement_at": "", "review_risk_level": ""}}
+            )
+            known_payees.add(transaction["user_id"], transaction["receiver_account"])
+            await record_approved(dal.users, transaction["user_id"], transaction["amount"], approved_at)
+            await rollups.record(transaction["user_id"], approved_at, reviewed="APPROVE",
+                                 approved_amount=transaction["amount"])
+            await list_cache.bump(dal.users, [transaction["user_id"], receiver_account and receiver_account.get("user_id")],
+                                  ACCOUNTS)
+            
+            # ===== REMOVE FROM ALERTS =====
+            await dal.alerts.delete_many({"transaction_id": transaction_id})
+        except Exception as e:
+            print(f"⚠️ Bookkeeping after approving {transaction_id} failed: {e}")
         
-        # Get updated balance
-        updated_sender = await accounts_collection.find_one({"_id": ObjectId(transaction["sender_account"])})
-        new_balance = updated_sender["balance"] if updated_sender else 0
+        new_balance = sender_after["balance"]
         
         print(f"""
         ╔═══════════════════════════════════════╗
@@ -1100,7 +1438,7 @@ async def approve_transaction(
             "new_sender_balance": new_balance,
             "receiver_credited": receiver_account is not None,
             "approved_by": authorization,
-            "approved_at": datetime.utcnow().isoformat()
+            "approved_at": approved_at.isoformat()
         }
         
     except HTTPException:
@@ -1112,6 +1450,76 @@ async def approve_transaction(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/v2/transactions/bulk-approve")
+async def bulk_approve_transactions(
+    request: BulkReviewRequest,
+    authorization: str = Header(None)
+):
+    """
+    Admin endpoint to approve many REVIEW transactions at once
+    Returns an outcome per transaction id
+    """
+    try:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="Authorization required")
+        
+        admin_user = await dal.users.find_one({"email": authorization})
+        if not admin_user or admin_user.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Admin access required")
+        
+        leased = await review_queue.hold(authorization, request.transaction_ids)
+        if leased:
+            raise HTTPException(status_code=409, detail={
+                "message": "Transactions are leased to another reviewer", "transaction_ids": leased
+            })
+        
+        result = await bulk_approve(request.transaction_ids, authorization)
+        print(f"✅ Bulk approve by {authorization}: {result['summary']}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error bulk approving transactions: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v2/transactions/bulk-reject")
+async def bulk_reject_transactions(
+    request: BulkReviewRequest,
+    authorization: str = Header(None)
+):
+    """
+    Admin endpoint to reject many REVIEW transactions at once
+    No balance changes occur
+    """
+    try:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="Authorization required")
+        
+        admin_user = await dal.users.find_one({"email": authorization})
+        if not admin_user or admin_user.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Admin access required")
+        
+        leased = await review_queue.hold(authorization, request.transaction_ids)
+        if leased:
+            raise HTTPException(status_code=409, detail={
+                "message": "Transactions are leased to another reviewer", "transaction_ids": leased
+            })
+        
+        result = await bulk_reject(request.transaction_ids, authorization)
+        print(f"✅ Bulk reject by {authorization}: {result['summary']}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error bulk rejecting transactions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/v2/transactions/{transaction_id}/reject")
 async def reject_transaction(
     transaction_id: str,
@@ -1126,12 +1534,16 @@ async def reject_transaction(
         if not authorization:
             raise HTTPException(status_code=401, detail="Authorization required")
         
-        admin_user = await users_collection.find_one({"email": authorization})
+        admin_user = await dal.users.find_one({"email": authorization})
         if not admin_user or admin_user.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Admin access required")
         
+        # Someone else's review lease wins (see review_queue.hold)
+        if await review_queue.hold(authorization, [transaction_id]):
+            raise HTTPException(status_code=409, detail="Transaction is leased to another reviewer")
+        
         # Find the transaction
-        transaction = await transactions_collection.find_one({"transaction_id": transaction_id})
+        transaction = await dal.transactions.find_one({"transaction_id": transaction_id})
         
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
@@ -1142,28 +1554,35 @@ async def reject_transaction(
                 detail=f"Can only reject transactions under REVIEW status"
             )
         
-        # Update transaction to BLOCK
-        await transactions_collection.update_one(
-            {"transaction_id": transaction_id},
+        # Update transaction to BLOCK (only if nobody approved it meanwhile)
+        rejected_at = datetime.utcnow()
+        result = await dal.transactions.update_one(
+            {"transaction_id": transaction_id, **unclaimed_filter()},
             {
                 "$set": {
                     "decision": "BLOCK",
-                    "risk_level": "ADMIN_REJECTED",
+                    "risk_level": RISK_LEVEL_CODES["ADMIN_REJECTED"],
                     "rejected_by": authorization,
-                    "rejected_at": datetime.utcnow(),
+                    "rejected_at": rejected_at,
                     "rejection_note": "Manually rejected by admin"
                 }
             }
         )
         
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail="Transaction was reviewed concurrently")
+        if transaction.get("gateway_authorization_id"):
+            await void_hold(transaction["gateway_authorization_id"])
+        await rollups.record(transaction["user_id"], rejected_at, reviewed="BLOCK")
+        
         # Update alert
-        await alerts_collection.update_one(
+        await dal.alerts.update_one(
             {"transaction_id": transaction_id},
             {
                 "$set": {
                     "decision": "BLOCK",
                     "rejected_by": authorization,
-                    "rejected_at": datetime.utcnow()
+                    "rejected_at": rejected_at
                 }
             }
         )
@@ -1191,10 +1610,82 @@ async def reject_transaction(
         print(f"❌ Error rejecting transaction: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============= REVIEW QUEUE =============
+async def require_admin(authorization: str):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization required")
+    
+    admin_user = await dal.users.find_one({"email": authorization})
+    if not admin_user or admin_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return admin_user
+
+@app.get("/api/v2/review-queue")
+async def get_review_queue(limit: int = 20):
+    """Highest-risk REVIEW alerts that nobody currently holds"""
+    try:
+        return {"alerts": await review_queue.peek(limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v2/review-queue/claim")
+async def claim_review_items(request: ReviewClaimRequest, authorization: str = Header(None)):
+    """Lease a batch of the highest-risk REVIEW alerts to the calling analyst"""
+    await require_admin(authorization)
+    try:
+        alerts = await review_queue.claim(authorization, request.limit, request.lease_seconds)
+        return {"alerts": alerts, "lease_seconds": request.lease_seconds}
+    except Exception as e:
+        print(f"❌ Error claiming review items: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v2/review-queue/renew")
+async def renew_review_leases(request: ReviewLeaseRequest, authorization: str = Header(None)):
+    """Extend the caller's live leases"""
+    await require_admin(authorization)
+    renewed = await review_queue.renew(authorization, request.transaction_ids, request.lease_seconds)
+    return {"renewed": renewed}
+
+@app.post("/api/v2/review-queue/release")
+async def release_review_leases(request: ReviewLeaseRequest, authorization: str = Header(None)):
+    """Hand the caller's leased alerts back to the queue"""
+    await require_admin(authorization)
+    released = await review_queue.release(authorization, request.transaction_ids)
+    return {"released": released}
+
+# ============= BUSINESS RULES =============
+@app.get("/api/v2/rules")
+async def get_business_rules():
+    """Currently loaded business rule table"""
+    return rule_engine.describe_table()
+
+@app.post("/api/v2/rules/reload")
+async def reload_business_rules(authorization: str = Header(None)):
+    """Admin endpoint to hot-reload the business rule table from disk"""
+    await require_admin(authorization)
+    
+    if not rule_engine.reload():
+        raise HTTPException(status_code=400, detail="Rule table invalid, previous rules kept")
+    return {"success": True, "version": rule_engine.version, "rules": len(rule_engine.rules)}
+
+@app.get("/api/v2/alerts/{transaction_id}/explanation")
+async def get_alert_explanation(transaction_id: str):
+    """Per-feature contributions to the alert's ML score, computed on first request and cached"""
+    try:
+        explanation = await explainer.explain(transaction_id)
+        if explanation is None:
+            raise HTTPException(status_code=404, detail="No explanation available for this transaction")
+        return {"transaction_id": transaction_id, "explanation": explanation}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error explaining alert: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/v1/alerts")
 async def get_alerts_v1(limit: int = 10):
     try:
-        cursor = alerts_collection.find({}).sort("timestamp", -1).limit(limit)
+        cursor = dal.analytics.alerts.find({}).sort("timestamp", -1).limit(limit)
         alerts = await cursor.to_list(length=limit)
         
         for alert in alerts:
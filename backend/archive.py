@@ -0,0 +1,285 @@
+import asyncio
+import gzip
+import os
+import time
+from datetime import datetime, timedelta
+from bson import json_util
+from pymongo import ReplaceOne
+from data_access import dal
+from payees import record_archived
+
+# Time-partitioned archival of transactions and alerts.
+#
+# Recent documents stay in the hot ``transactions``/``alerts`` collections.
+# Anything older than ARCHIVE_HOT_DAYS (and no longer under REVIEW) is moved by a
+# rate-limited background job into monthly collections such as
+# ``transactions_archive_202401``, optionally also appended to compressed NDJSON
+# files. ``archive_state`` records the watermark (everything older has been
+# archived) plus running totals so analytics can still count archived documents.
+#
+# find_across_tiers() answers history reads from the hot collection and only fans
+# out to monthly archives when the requested range reaches below the watermark.
+# Receivers of archived approved payments are kept per user for the known-payee
+# signal (payees.record_archived); months archived before that existed are
+# backfilled once by backfill_payees().
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_HOT_DAYS = int(os.getenv("ARCHIVE_HOT_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_MAX_DOCS_PER_SEC = float(os.getenv("ARCHIVE_MAX_DOCS_PER_SEC", "2000"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Directory for compressed NDJSON copies; empty disables them
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+ARCHIVE_STATE_COLLECTION = "archive_state"
+TIERED_COLLECTIONS = ("transactions", "alerts")
+
+# Indexes every monthly archive collection gets (mirrors the hot read shapes)
+ARCHIVE_INDEXES = {
+    "transactions": [
+        [("timestamp", -1)],
+        [("user_id", 1), ("timestamp", -1)],
+        [("transaction_id", 1)],
+    ],
+    "alerts": [
+        [("timestamp", -1)],
+        [("transaction_id", 1)],
+    ],
+}
+
+# Watermarks are re-read at most this often by the query router
+STATE_CACHE_SECONDS = 60
+
+
+def month_key(ts: datetime) -> str:
+    return ts.strftime("%Y%m")
+
+
+def archive_name(base: str, month: str) -> str:
+    return f"{base}_archive_{month}"
+
+
+def months_between(start: datetime, end: datetime) -> list:
+    """Month keys from ``end`` back to ``start`` (newest first)"""
+    months = []
+    year, month = end.year, end.month
+    while (year, month) >= (start.year, start.month):
+        months.append(f"{year:04d}{month:02d}")
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return months
+
+
+class ArchiveState:
+    """Cached view of archive_state for the query router"""
+
+    def __init__(self):
+        self._cache = {}
+        self._loaded_at = 0.0
+
+    async def get(self, base: str) -> dict:
+        if time.monotonic() - self._loaded_at > STATE_CACHE_SECONDS:
+            docs = await dal.db[ARCHIVE_STATE_COLLECTION].find({}).to_list(length=None)
+            self._cache = {doc["_id"]: doc for doc in docs}
+            self._loaded_at = time.monotonic()
+        return self._cache.get(base, {})
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+
+archive_state = ArchiveState()
+
+
+# ===== BACKGROUND ARCHIVER =====
+def _append_ndjson(base: str, month: str, docs: list):
+    directory = os.path.join(ARCHIVE_DIR, base)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{month}.ndjson.gz")
+    # Appending a new gzip member keeps the file a valid gzip stream
+    with gzip.open(path, "ab") as f:
+        for doc in docs:
+            f.write(json_util.dumps(doc).encode())
+            f.write(b"\n")
+
+
+def _archive_filter(cutoff: datetime) -> dict:
+    # Open reviews stay hot until an admin decides them
+    return {"timestamp": {"$lt": cutoff}, "decision": {"$ne": "REVIEW"}}
+
+
+async def archive_collection(base: str, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE,
+                             max_docs_per_sec: float = ARCHIVE_MAX_DOCS_PER_SEC) -> int:
+    """Move documents older than ``cutoff`` into monthly archives; returns how many moved"""
+    hot = dal.db[base]
+    state = dal.db[ARCHIVE_STATE_COLLECTION]
+    indexed_months = set()
+    moved = 0
+
+    while True:
+        started = time.monotonic()
+        batch = await hot.find(_archive_filter(cutoff)).sort("timestamp", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        by_month = {}
+        for doc in batch:
+            by_month.setdefault(month_key(doc["timestamp"]), []).append(doc)
+
+        for month, docs in by_month.items():
+            target = dal.db[archive_name(base, month)]
+            if month not in indexed_months:
+                for keys in ARCHIVE_INDEXES[base]:
+                    await target.create_index(keys)
+                indexed_months.add(month)
+            # Upserts by _id make a re-run after a crash harmless
+            await target.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs], ordered=False)
+            if ARCHIVE_DIR:
+                await asyncio.get_running_loop().run_in_executor(None, _append_ndjson, base, month, docs)
+        if base == "transactions":
+            # Before the delete, so a payee is never in neither place
+            await record_archived(batch)
+
+        # Delete per decision so the archived totals only count what actually left the hot tier
+        totals = {"documents": 0, "volume": 0.0}
+        by_decision = {}
+        for doc in batch:
+            by_decision.setdefault(doc.get("decision"), []).append(doc)
+        for decision, docs in by_decision.items():
+            result = await hot.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+            totals["documents"] += result.deleted_count
+            if decision:
+                totals[f"counts.{decision}"] = result.deleted_count
+            if result.deleted_count == len(docs):
+                volume = sum(d.get("amount", 0) for d in docs)
+                totals["volume"] += volume
+                if decision == "APPROVE":
+                    totals["approved_volume"] = volume
+
+        await state.update_one(
+            {"_id": base},
+            {
+                "$inc": totals,
+                "$addToSet": {"months": {"$each": list(by_month)}},
+                "$min": {"oldest": batch[0]["timestamp"]},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+        moved += len(batch)
+
+        # Rate limit: never exceed max_docs_per_sec on the primary
+        min_duration = len(batch) / max_docs_per_sec if max_docs_per_sec > 0 else 0
+        elapsed = time.monotonic() - started
+        if elapsed < min_duration:
+            await asyncio.sleep(min_duration - elapsed)
+
+    await state.update_one(
+        {"_id": base},
+        {"$max": {"archived_before": cutoff}},
+        upsert=True
+    )
+    archive_state.invalidate()
+    return moved
+
+
+async def backfill_payees() -> int:
+    """Record the payees of months archived before record_archived existed; runs once"""
+    state = dal.db[ARCHIVE_STATE_COLLECTION]
+    doc = await state.find_one({"_id": "transactions"}, {"months": 1, "payees_backfilled": 1})
+    if not doc or doc.get("payees_backfilled"):
+        return 0
+    users = 0
+    for month in doc.get("months", []):
+        pairs = await dal.db[archive_name("transactions", month)].aggregate([
+            {"$match": {"decision": "APPROVE"}},
+            {"$group": {"_id": "$user_id", "accounts": {"$addToSet": "$receiver_account"}}}
+        ]).to_list(length=None)
+        await record_archived([
+            {"user_id": p["_id"], "decision": "APPROVE", "receiver_account": account}
+            for p in pairs for account in p["accounts"]
+        ])
+        users += len(pairs)
+    await state.update_one({"_id": "transactions"}, {"$set": {"payees_backfilled": True}})
+    return users
+
+
+async def archive_once(hot_days: int = ARCHIVE_HOT_DAYS) -> dict:
+    cutoff = datetime.utcnow() - timedelta(days=hot_days)
+    backfilled = await backfill_payees()
+    if backfilled:
+        print(f"✅ Archived payees backfilled for {backfilled} user-months")
+    moved = {}
+    for base in TIERED_COLLECTIONS:
+        moved[base] = await archive_collection(base, cutoff)
+    if any(moved.values()):
+        print(f"✅ Archived documents older than {cutoff:%Y-%m-%d}: {moved}")
+    return moved
+
+
+async def run_archiver(interval: int = ARCHIVE_INTERVAL_SECONDS):
+    """Background loop started from the FastAPI lifespan"""
+    while True:
+        try:
+            await archive_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Archive job error: {e}")
+        await asyncio.sleep(interval)
+
+
+# ===== QUERY ROUTER =====
+async def find_across_tiers(base: str, query: dict = None, since: datetime = None, until: datetime = None,
+                            limit: int = 20, projection: dict = None, handles=None) -> list:
+    """
+    Newest-first documents matching ``query`` within [since, until).
+    Reads the hot collection first and only visits monthly archives when the
+    range reaches below the archive watermark and the hot tier didn't fill ``limit``.
+    """
+    handles = handles or dal.analytics
+    query = dict(query or {})
+    time_range = {}
+    if since:
+        time_range["$gte"] = since
+    if until:
+        time_range["$lt"] = until
+    if time_range:
+        query["timestamp"] = time_range
+
+    results = await handles[base].find(query, projection).sort("timestamp", -1).limit(limit).to_list(length=limit)
+    if len(results) >= limit:
+        return results
+
+    state = await archive_state.get(base)
+    watermark = state.get("archived_before")
+    if not watermark or (since and since >= watermark):
+        return results
+
+    oldest = max(since, state.get("oldest", since)) if since else state.get("oldest")
+    if not oldest:
+        return results
+    newest = min(until, watermark) if until else watermark
+    archived_months = set(state.get("months", []))
+
+    for month in months_between(oldest, newest):
+        if month not in archived_months:
+            continue
+        remaining = limit - len(results)
+        cursor = handles[archive_name(base, month)].find(query, projection).sort("timestamp", -1).limit(remaining)
+        results.extend(await cursor.to_list(length=remaining))
+        if len(results) >= limit:
+            break
+    return results
+
+
+async def archived_totals(base: str = "transactions") -> dict:
+    """Counts and approved volume that have left the hot tier, for analytics"""
+    state = await archive_state.get(base)
+    return {
+        "documents": state.get("documents", 0),
+        "counts": state.get("counts", {}),
+        "volume": state.get("volume", 0.0),
+        "approved_volume": state.get("approved_volume", 0.0)
+    }
@@ -0,0 +1,121 @@
+"""
+Benchmark the payment gateway client against stub_gateway.py.
+
+Starts the stub with a slow tail and a small error rate, then pushes concurrent
+authorizations through GatewayClient with hedging/retries off and on, and
+reports throughput, latency percentiles and failures. A last scenario degrades
+the stub to show the circuit breaker failing fast.
+
+Run from the backend directory:  python bench_gateway.py
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+from gateway import GatewayClient, GatewayUnavailable, CircuitBreaker
+
+PAYLOAD = {"card_number": "4111111111111111", "cvv": "123", "expiry": "12/30", "amount": 125.0}
+
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{base_url}/stats")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("stub gateway did not start")
+
+
+def start_stub(port: int, *stub_args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "stub_gateway.py", "--port", str(port), *map(str, stub_args)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def drive(client: GatewayClient, total: int, concurrency: int) -> dict:
+    latencies = []
+    failures = 0
+    queue = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for _ in queue:
+            started = time.perf_counter()
+            try:
+                await client.authorize(PAYLOAD, uuid.uuid4().hex)
+            except GatewayUnavailable:
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {"rps": total / elapsed, "p50": pct(0.5), "p99": pct(0.99), "p999": pct(0.999),
+            "max": latencies[-1] * 1000, "failures": failures}
+
+
+async def run_scenario(name: str, base_url: str, total: int, concurrency: int, **client_args):
+    client = GatewayClient(base_url, **client_args)
+    await client.start()
+    try:
+        r = await drive(client, total, concurrency)
+    finally:
+        await client.close()
+    s = client.snapshot()
+    print(f"{name:<28} {r['rps']:>7.0f} {r['p50']:>8.1f} {r['p99']:>8.1f} {r['p999']:>8.1f} {r['max']:>8.1f} "
+          f"{r['failures']:>6} {s['hedges']:>6} {s['retries']:>6} {s['fast_fails']:>6} {s['breaker_trips']:>5}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print("=" * 104)
+    print(f"{'scenario':<28} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>8} {'max ms':>8} "
+          f"{'failed':>6} {'hedges':>6} {'retry':>6} {'fast':>6} {'trips':>5}")
+    print("=" * 104)
+
+    # Healthy gateway with a 3% slow tail (1.5s) and 1% errors
+    stub = start_stub(args.port, "--latency-ms", 40, "--tail-prob", 0.03, "--tail-ms", 1500, "--error-rate", 0.01)
+    try:
+        await wait_ready(base_url)
+        await run_scenario("single attempt", base_url, args.requests, args.concurrency,
+                           max_attempts=1, hedge_after_ms=0, breaker=CircuitBreaker(failure_rate=2))
+        await run_scenario("retries, no hedging", base_url, args.requests, args.concurrency,
+                           max_attempts=3, hedge_after_ms=0, breaker=CircuitBreaker(failure_rate=2))
+        await run_scenario("hedged after 150ms", base_url, args.requests, args.concurrency,
+                           max_attempts=3, hedge_after_ms=150, breaker=CircuitBreaker(failure_rate=2))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    # Degraded gateway: 90% errors and slow answers
+    stub = start_stub(args.port, "--latency-ms", 300, "--error-rate", 0.9)
+    try:
+        await wait_ready(base_url)
+        await run_scenario("degraded, no breaker", base_url, args.requests // 3, args.concurrency,
+                           breaker=CircuitBreaker(failure_rate=2))
+        await run_scenario("degraded, breaker", base_url, args.requests // 3, args.concurrency)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
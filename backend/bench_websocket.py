@@ -0,0 +1,132 @@
+"""
+Benchmark the WebSocket scoring channel against per-request HTTP scoring.
+
+Starts server.py with one worker and scores the same request over:
+fresh HTTP connections (Connection: close), keep-alive HTTP, and pipelined
+WebSocket connections. Reports throughput, latency percentiles and the mean
+full-model batch size the shared InferenceBatcher reached
+(/api/v2/metrics/inference).
+
+Run from the backend directory:  python bench_websocket.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import httpx
+import websockets
+from bench_workers import SCORE_PAYLOAD, wait_ready
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+    }
+
+
+async def http_case(base_url: str, total: int, concurrency: int, keep_alive: bool) -> dict:
+    latencies = []
+    queue = iter(range(total))
+    headers = {} if keep_alive else {"Connection": "close"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency if keep_alive else 0)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            for _ in queue:
+                started = time.perf_counter()
+                response = await client.post("/api/v1/transactions/score", json=SCORE_PAYLOAD, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return summarize(latencies, time.perf_counter() - started)
+
+
+async def ws_case(ws_url: str, total: int, connections: int, window: int) -> dict:
+    latencies = []
+    per_connection = total // connections
+
+    async def connection():
+        async with websockets.connect(ws_url, max_queue=None) as ws:
+            ready = json.loads(await ws.recv())
+            limit = min(window, ready["max_in_flight"])
+            sent_at = {}
+            credits = asyncio.Semaphore(limit)
+
+            async def sender():
+                for i in range(per_connection):
+                    await credits.acquire()
+                    sent_at[i] = time.perf_counter()
+                    await ws.send(json.dumps({"id": i, **SCORE_PAYLOAD}))
+
+            async def receiver():
+                for _ in range(per_connection):
+                    answer = json.loads(await ws.recv())
+                    if "error" in answer:
+                        raise RuntimeError(answer["error"])
+                    latencies.append(time.perf_counter() - sent_at.pop(answer["id"]))
+                    credits.release()
+
+            await asyncio.gather(sender(), receiver())
+
+    started = time.perf_counter()
+    await asyncio.gather(*[connection() for _ in range(connections)])
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def batch_stats(base_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        return (await client.get("/api/v2/metrics/inference")).json()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    env = dict(os.environ, MIGRATE_ON_STARTUP="false", FANIN_WARMUP="false", DEVICE_WARMUP="false",
+               ARCHIVE_ENABLED="false", EXPLAIN_ENABLED="false")
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(args.port), "--workers", "1",
+         "--max-requests", "0"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/api/v2/ws/score"
+    cases = [
+        ("HTTP, new connection each", lambda: http_case(base_url, args.requests // 4, 16, keep_alive=False)),
+        ("HTTP keep-alive, 16 conns", lambda: http_case(base_url, args.requests // 4, 16, keep_alive=True)),
+        ("WebSocket, 1 conn x 64", lambda: ws_case(ws_url, args.requests, 1, 64)),
+        ("WebSocket, 8 conns x 32", lambda: ws_case(ws_url, args.requests, 8, 32)),
+    ]
+    try:
+        await wait_ready(base_url)
+        await http_case(base_url, 200, 8, keep_alive=True)     # warm up
+
+        print("=" * 78)
+        print(f"{'scenario':<28} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean batch':>11} {'max batch':>10}")
+        print("=" * 78)
+        for name, case in cases:
+            before = await batch_stats(base_url)
+            r = await case()
+            after = await batch_stats(base_url)
+            batches = after["batches"] - before["batches"]
+            mean_batch = (after["rows"] - before["rows"]) / batches if batches else 0
+            print(f"{name:<28} {r['rps']:>8.0f} {r['p50']:>8.1f} {r['p99']:>8.1f} {mean_batch:>11.1f} "
+                  f"{after['max_batch']:>10}")
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Benchmark server.py: memory per worker and requests/sec versus worker count.
+
+Starts the pre-fork server for each worker count (with and without preloading
+the app in the master), reads RSS / PSS / private memory of every worker from
+/proc (Linux), then drives POST /api/v1/transactions/score with concurrent
+clients. PSS divides shared pages between the processes sharing them, so with
+preloading it drops well below RSS as the model and libraries are shared.
+
+Run from the backend directory:  python bench_workers.py --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import httpx
+
+SCORE_PAYLOAD = {
+    "amount": 2500.0,
+    "sender_balance": 10000.0,
+    "receiver_balance": 5000.0,
+    "payment_type": "TRANSFER",
+    "transactions_24h": 3,
+    "transactions_1h": 1
+}
+
+
+def worker_pids(master_pid: int) -> list:
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_kb(pid: int) -> dict:
+    """rss, pss and private (unshared) memory of a process in KB"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    }
+
+
+def master_pss_kb(pid: int) -> int:
+    try:
+        return memory_kb(pid)["pss"]
+    except OSError:
+        return 0
+
+
+async def wait_ready(base_url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+async def load(base_url: str, duration: float, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=10) as client:
+        async def client_loop():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/v1/transactions/score", json=SCORE_PAYLOAD)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    }
+
+
+async def run_case(workers: int, preload: bool, port: int, duration: float, concurrency: int) -> dict:
+    env = dict(os.environ, MIGRATE_ON_STARTUP="false", FANIN_WARMUP="false", DEVICE_WARMUP="false",
+               ARCHIVE_ENABLED="false")
+    cmd = [sys.executable, "server.py", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--max-requests", "0"]
+    if not preload:
+        cmd.append("--no-preload")
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(base_url)
+        # Let every worker finish its lifespan startup and serve a few requests first
+        await load(base_url, 1.0, concurrency)
+        pids = worker_pids(proc.pid)
+        memory = [memory_kb(pid) for pid in pids]
+        master_pss = master_pss_kb(proc.pid)
+        result = await load(base_url, duration, concurrency)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+
+    result.update({
+        "workers": workers,
+        "preload": preload,
+        "rss_mb": sum(m["rss"] for m in memory) / len(memory) / 1024,
+        "pss_mb": sum(m["pss"] for m in memory) / len(memory) / 1024,
+        "private_mb": sum(m["private"] for m in memory) / len(memory) / 1024,
+        "total_pss_mb": (sum(m["pss"] for m in memory) + master_pss) / 1024
+    })
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print("=" * 96)
+    print(f"{'workers':>7} {'preload':>8} {'RSS/wkr MB':>11} {'PSS/wkr MB':>11} {'priv/wkr MB':>12} "
+          f"{'total PSS MB':>13} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print("=" * 96)
+    for workers in args.workers:
+        for preload in (True, False):
+            r = await run_case(workers, preload, args.port, args.duration, args.concurrency)
+            print(f"{r['workers']:>7} {str(r['preload']):>8} {r['rss_mb']:>11.1f} {r['pss_mb']:>11.1f} "
+                  f"{r['private_mb']:>12.1f} {r['total_pss_mb']:>13.1f} {r['rps']:>9.0f} "
+                  f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}"
+                  + (f"  ({r['errors']} errors)" if r["errors"] else ""))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
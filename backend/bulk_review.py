@@ -0,0 +1,346 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from data_access import dal
+from gateway import void_hold
+from ledger import APPLIED_FIELD, applied, debit_account, ledger_ref, tagged
+from payees import known_payees
+from rollups import record_many, rollup_update
+import list_cache
+from spending_profile import profile_update
+from txn_codec import RISK_LEVEL_CODES
+
+# Bulk admin review of REVIEW transactions.
+#
+# A batch is claimed with one update_many (``review_batch`` marker), loaded with
+# ``$in`` queries, validated in memory, and applied with a handful of bulk writes:
+# one status update, one guarded debit per sender, one credit per receiver and one
+# alert cleanup. Payments leave REVIEW before any money moves (see bulk_approve), so
+# a batch that dies mid-way can't be re-claimed and debited twice. Per-id outcomes
+# are returned so the dashboard can show failures.
+#
+# The ledger writes are tagged with the batch id (or the transaction id for the
+# one-by-one fallback), see ledger.py. A batch that dies after marking its
+# payments APPROVE + settlement PENDING is picked up by resume_batches(), run by
+# the settlement reconciler once CLAIM_TIMEOUT has passed: payments whose sender
+# was debited are credited and completed, the rest go back to REVIEW.
+
+# A claim older than this is assumed to belong to a crashed batch
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+APPROVED = "approved"
+REJECTED = "rejected"
+NOT_FOUND = "not_found"
+INSUFFICIENT_BALANCE = "insufficient_balance"
+SENDER_NOT_FOUND = "sender_account_not_found"
+IN_PROGRESS = "review_in_progress"
+
+APPROVAL_FIELDS = ["approved_by", "approved_at", "original_risk_score", "approval_note",
+                   "settlement", "settlement_at", "review_risk_level"]
+
+
+def unclaimed_filter(now=None):
+    """Filter matching REVIEW transactions that no bulk batch currently holds"""
+    now = now or datetime.utcnow()
+    return {
+        "decision": "REVIEW",
+        "$or": [
+            {"review_batch": {"$exists": False}},
+            {"review_batch_at": {"$lt": now - CLAIM_TIMEOUT}}
+        ]
+    }
+
+
+async def _claim(transaction_ids):
+    """Claim every still-reviewable id; returns (batch_id, claimed docs, outcomes for the rest)"""
+    batch_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    await dal.transactions.update_many(
+        {"transaction_id": {"$in": transaction_ids}, **unclaimed_filter(now)},
+        {"$set": {"review_batch": batch_id, "review_batch_at": now}}
+    )
+    claimed = await dal.transactions.find(
+        {"review_batch": batch_id},
+        {"transaction_id": 1, "sender_account": 1, "receiver_account": 1, "amount": 1,
+         "risk_score": 1, "user_id": 1, "gateway_authorization_id": 1}
+    ).to_list(length=None)
+
+    outcomes = OrderedDict((tid, None) for tid in transaction_ids)
+    claimed_ids = {t["transaction_id"] for t in claimed}
+    rest = [tid for tid in transaction_ids if tid not in claimed_ids]
+    if rest:
+        found = await dal.transactions.find(
+            {"transaction_id": {"$in": rest}},
+            {"transaction_id": 1, "decision": 1}
+        ).to_list(length=None)
+        states = {t["transaction_id"]: t["decision"] for t in found}
+        for tid in rest:
+            if tid not in states:
+                outcomes[tid] = NOT_FOUND
+            elif states[tid] == "REVIEW":
+                outcomes[tid] = IN_PROGRESS
+            else:
+                outcomes[tid] = f"already_{states[tid].lower()}"
+    return batch_id, claimed, outcomes
+
+
+async def _release(batch_id, transaction_ids):
+    if transaction_ids:
+        await dal.transactions.update_many(
+            {"transaction_id": {"$in": list(transaction_ids)}, "review_batch": batch_id},
+            {"$unset": {"review_batch": "", "review_batch_at": ""}}
+        )
+
+
+async def _receivers(txns):
+    return {
+        acc["account_number"]: acc for acc in await dal.accounts.find(
+            {"account_number": {"$in": list({t["receiver_account"] for t in txns})}},
+            {"account_number": 1, "user_id": 1}
+        ).to_list(length=None)
+    }
+
+
+async def _revert(batch_id, txns):
+    """Back to REVIEW for marked payments whose sender was never debited"""
+    await dal.transactions.update_many(
+        {"transaction_id": {"$in": [t["transaction_id"] for t in txns]},
+         "review_batch": batch_id, "settlement": "PENDING"},
+        [{"$set": {"decision": "REVIEW", "risk_level": "$review_risk_level"}},
+         {"$unset": APPROVAL_FIELDS}]
+    )
+
+
+async def _finish(batch_id, settled, receivers, now):
+    """Credit the receivers of debited payments and complete their approval"""
+    credits = {}
+    for t in settled:
+        receiver = receivers.get(t["receiver_account"])
+        if receiver:
+            credits[receiver["_id"]] = credits.get(receiver["_id"], 0) + t["amount"]
+    if credits:
+        await dal.accounts.bulk_write([
+            UpdateOne(*tagged({"_id": rid}, {"$inc": {"balance": total}, "$set": {"last_transaction": now}},
+                              ledger_ref(batch_id, "credit")))
+            for rid, total in credits.items()
+        ], ordered=False)
+
+    approved_ids = [t["transaction_id"] for t in settled]
+    await dal.transactions.update_many(
+        {"transaction_id": {"$in": approved_ids}, "review_batch": batch_id},
+        {"$unset": {"settlement": "", "settlement_at": "", "review_risk_level": "",
+                    "review_batch": "", "review_batch_at": ""}}
+    )
+    await dal.alerts.delete_many({"transaction_id": {"$in": approved_ids}})
+    # Ordered so a user's Welford steps apply in sequence
+    await dal.users.bulk_write([profile_update(t["user_id"], t["amount"], now) for t in settled])
+    await record_many([
+        rollup_update(t["user_id"], now, reviewed="APPROVE", approved_amount=t["amount"]) for t in settled
+    ])
+    for t in settled:
+        known_payees.add(t["user_id"], t["receiver_account"])
+    # Balances changed for every settled sender and internal receiver
+    credited = {receivers[t["receiver_account"]].get("user_id") for t in settled if t["receiver_account"] in receivers}
+    await list_cache.bump(dal.users, [t["user_id"] for t in settled] + list(credited), list_cache.ACCOUNTS)
+
+
+def _summary(batch_id, outcomes):
+    counts = {}
+    for outcome in outcomes.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return {"batch_id": batch_id, "summary": counts, "results": outcomes}
+
+
+async def bulk_approve(transaction_ids, admin_email):
+    transaction_ids = list(OrderedDict.fromkeys(transaction_ids))
+    batch_id, claimed, outcomes = await _claim(transaction_ids)
+    if not claimed:
+        return _summary(batch_id, outcomes)
+
+    # ===== LOAD ACCOUNTS =====
+    sender_ids = list({ObjectId(t["sender_account"]) for t in claimed})
+    senders = {
+        acc["_id"]: acc for acc in await dal.accounts.find(
+            {"_id": {"$in": sender_ids}}, {"balance": 1, "user_id": 1}
+        ).to_list(length=None)
+    }
+    receivers = await _receivers(claimed)
+
+    # ===== VALIDATE BALANCES IN MEMORY =====
+    # Transactions are settled in request order against a running balance per sender
+    remaining = {sid: acc["balance"] for sid, acc in senders.items()}
+    accepted = []
+    for t in claimed:
+        sid = ObjectId(t["sender_account"])
+        if sid not in remaining:
+            outcomes[t["transaction_id"]] = SENDER_NOT_FOUND
+        elif remaining[sid] < t["amount"]:
+            outcomes[t["transaction_id"]] = INSUFFICIENT_BALANCE
+        else:
+            remaining[sid] -= t["amount"]
+            accepted.append(t)
+
+    # ===== MARK APPROVED BEFORE MOVING MONEY =====
+    # Out of REVIEW first, so no later claim can pick these up and debit them again.
+    # "settlement": "PENDING" stays until the ledger writes are done; a crash in
+    # between leaves the marker for resume_batches, never a second debit
+    now = datetime.utcnow()
+    if accepted:
+        await dal.transactions.update_many(
+            {"transaction_id": {"$in": [t["transaction_id"] for t in accepted]},
+             "decision": "REVIEW", "review_batch": batch_id},
+            [{"$set": {
+                "decision": "APPROVE",
+                "risk_level": RISK_LEVEL_CODES["ADMIN_APPROVED"],
+                "approved_by": admin_email,
+                "approved_at": now,
+                "original_risk_score": "$risk_score",
+                "approval_note": "Manually approved by admin (bulk)",
+                "settlement": "PENDING",
+                "settlement_at": now,
+                "review_risk_level": "$risk_level"
+            }}]
+        )
+        marked = {
+            t["transaction_id"] for t in await dal.transactions.find(
+                {"review_batch": batch_id, "settlement": "PENDING"}, {"transaction_id": 1}
+            ).to_list(length=None)
+        }
+        for t in accepted:
+            if t["transaction_id"] not in marked:
+                # Our claim expired and another batch took it over
+                outcomes[t["transaction_id"]] = IN_PROGRESS
+        accepted = [t for t in accepted if t["transaction_id"] in marked]
+
+    # ===== DEBIT SENDERS (one guarded update per sender) =====
+    totals = {}
+    for t in accepted:
+        sid = ObjectId(t["sender_account"])
+        totals[sid] = totals.get(sid, 0) + t["amount"]
+    debit_ref = ledger_ref(batch_id, "debit")
+    if totals:
+        await dal.accounts.bulk_write([
+            UpdateOne(*tagged(
+                {"_id": sid, "balance": {"$gte": total}},
+                {"$inc": {"balance": -total}, "$set": {"last_transaction": now}},
+                debit_ref
+            ))
+            for sid, total in totals.items()
+        ], ordered=False)
+        debited = {
+            acc["_id"] for acc in await dal.accounts.find(
+                {"_id": {"$in": list(totals)}, APPLIED_FIELD: debit_ref}, {"_id": 1}
+            ).to_list(length=None)
+        }
+    else:
+        debited = set()
+
+    # A sender whose balance moved since we read it: settle its payments one by one
+    settled = []
+    refused = []
+    for t in accepted:
+        sid = ObjectId(t["sender_account"])
+        if sid in debited or await debit_account(dal.accounts, sid, t["amount"],
+                                                  ref=ledger_ref(t["transaction_id"], "debit")) is not None:
+            settled.append(t)
+        else:
+            outcomes[t["transaction_id"]] = INSUFFICIENT_BALANCE
+            refused.append(t)
+    if refused:
+        # Nothing was debited for these: back to REVIEW, released below
+        await _revert(batch_id, refused)
+
+    # ===== CREDIT RECEIVERS, CLEAR MARKERS, UPDATE ALERTS =====
+    if settled:
+        await _finish(batch_id, settled, receivers, now)
+        for t in settled:
+            outcomes[t["transaction_id"]] = APPROVED
+
+    await _release(batch_id, [t["transaction_id"] for t in claimed if outcomes[t["transaction_id"]] != APPROVED])
+    return _summary(batch_id, outcomes)
+
+
+def stale_batch_filter(now=None):
+    """Bulk approvals marked PENDING by a batch that should have settled long ago"""
+    now = now or datetime.utcnow()
+    return {
+        "settlement": "PENDING",
+        "settlement_at": {"$lt": now - CLAIM_TIMEOUT},
+        "review_batch": {"$exists": True}
+    }
+
+
+async def resume_batches():
+    """Finish or roll back the payments of dead bulk batches; returns (batches, completed, reverted)"""
+    pending = await dal.transactions.find(
+        stale_batch_filter(),
+        {"transaction_id": 1, "sender_account": 1, "receiver_account": 1, "amount": 1,
+         "user_id": 1, "review_batch": 1}
+    ).to_list(length=None)
+    batches = OrderedDict()
+    for t in pending:
+        batches.setdefault(t["review_batch"], []).append(t)
+
+    completed = reverted = 0
+    now = datetime.utcnow()
+    for batch_id, txns in batches.items():
+        # A sender is debited either for the whole batch or payment by payment
+        debited = {
+            acc["_id"] for acc in await dal.accounts.find(
+                {"_id": {"$in": list({ObjectId(t["sender_account"]) for t in txns})},
+                 APPLIED_FIELD: ledger_ref(batch_id, "debit")}, {"_id": 1}
+            ).to_list(length=None)
+        }
+        settled, undone = [], []
+        for t in txns:
+            sid = ObjectId(t["sender_account"])
+            if sid in debited or await applied(dal.accounts, sid, ledger_ref(t["transaction_id"], "debit")):
+                settled.append(t)
+            else:
+                undone.append(t)
+        if undone:
+            await _revert(batch_id, undone)
+            await _release(batch_id, [t["transaction_id"] for t in undone])
+        if settled:
+            await _finish(batch_id, settled, await _receivers(settled), now)
+        completed += len(settled)
+        reverted += len(undone)
+    return len(batches), completed, reverted
+
+
+async def bulk_reject(transaction_ids, admin_email):
+    transaction_ids = list(OrderedDict.fromkeys(transaction_ids))
+    batch_id, claimed, outcomes = await _claim(transaction_ids)
+    rejected_ids = [t["transaction_id"] for t in claimed]
+    if not rejected_ids:
+        return _summary(batch_id, outcomes)
+
+    now = datetime.utcnow()
+    await dal.transactions.update_many(
+        {"transaction_id": {"$in": rejected_ids}, "review_batch": batch_id},
+        {
+            "$set": {
+                "decision": "BLOCK",
+                "risk_level": RISK_LEVEL_CODES["ADMIN_REJECTED"],
+                "rejected_by": admin_email,
+                "rejected_at": now,
+                "rejection_note": "Manually rejected by admin (bulk)"
+            },
+            "$unset": {"review_batch": "", "review_batch_at": ""}
+        }
+    )
+    await dal.alerts.update_many(
+        {"transaction_id": {"$in": rejected_ids}},
+        {"$set": {"decision": "BLOCK", "rejected_by": admin_email, "rejected_at": now}}
+    )
+    await record_many([rollup_update(t["user_id"], now, reviewed="BLOCK") for t in claimed])
+    # REVIEW payments keep their gateway hold until an admin decides
+    await asyncio.gather(*(
+        void_hold(t["gateway_authorization_id"]) for t in claimed if t.get("gateway_authorization_id")
+    ))
+    for tid in rejected_ids:
+        outcomes[tid] = REJECTED
+    return _summary(batch_id, outcomes)
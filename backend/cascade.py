@@ -0,0 +1,208 @@
+import json
+import os
+import time
+import numpy as np
+from rules import combine_scores, decide, ML_SUSPICIOUS_SCORE
+
+# Cascaded scoring: cheap stages first, the full model only when it can matter.
+#
+# Stage "rules": the rule engine has already run. If the decision comes out the
+# same for every ML score in [0, 1] (a critical rule, or a rule score above the
+# block threshold), the features are never built and the model never runs.
+#
+# Stage "prefix": the first CASCADE_PREFIX_TREES trees of the XGBoost ensemble,
+# compiled into NumPy arrays and walked for all trees at once. Each remaining
+# tree adds one of its leaves to the margin, so the sum of their smallest and
+# largest leaves bounds the full margin. If the decision is the same at both
+# ends of that interval, the full model can't change it. The bound is exact (up
+# to a small slack for float32 summation order), not a learned guess, so no
+# decision ever differs from running the full model. 0 turns the stage off; on
+# the current model the remaining trees' leaf ranges are wide, so a prefix rarely
+# settles a decision (see replay_cascade.py) and the stage is off by default.
+#
+# Stage "full": the whole ensemble via Booster.inplace_predict on features scaled
+# with the scaler's mean_/scale_, which returns exactly what
+# scaler.transform + predict_proba returns without sklearn's per-call overhead.
+#
+# On an early exit the stored ml_score is the lower end of the ML interval (0 for
+# the rules stage) and ml_stage says which stage decided. replay_cascade.py
+# replays a synthetic set through every stage and checks that decisions match.
+
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() == "true"
+CASCADE_PREFIX_TREES = int(os.getenv("CASCADE_PREFIX_TREES", "0"))
+# Margin slack covering float32 vs float64 leaf summation (observed error ~1e-5)
+PREFIX_MARGIN_SLACK = 1e-3
+
+STAGES = ("rules", "prefix", "full")
+
+
+def decision_range(rule_score: float, is_critical: bool, ml_low: float, ml_high: float) -> set:
+    """Every (decision, risk_level) reachable for an ML score in [ml_low, ml_high]"""
+    # combine_scores is non-decreasing in ml_score on either side of the
+    # ML_SUSPICIOUS_SCORE break and decide() is monotone, so the ends of both
+    # pieces cover every outcome
+    points = {ml_low, ml_high}
+    if ml_low <= ML_SUSPICIOUS_SCORE < ml_high:
+        points.update((ML_SUSPICIOUS_SCORE, float(np.nextafter(ML_SUSPICIOUS_SCORE, 1.0))))
+    return {decide(combine_scores(rule_score, ml), is_critical) for ml in points}
+
+
+def _tree_depth(left: list, right: list) -> int:
+    depth, frontier = 0, [0]
+    while True:
+        frontier = [c for n in frontier if left[n] >= 0 for c in (left[n], right[n])]
+        if not frontier:
+            return depth
+        depth += 1
+
+
+def _sigmoid(margin: float) -> float:
+    return float(1.0 / (1.0 + np.exp(-margin)))
+
+
+class TreePrefix:
+    """The first ``n_trees`` trees of a binary:logistic booster as NumPy arrays"""
+
+    def __init__(self, booster, n_trees: int):
+        model = json.loads(booster.save_raw("json"))
+        learner = model["learner"]
+        if learner["objective"]["name"] != "binary:logistic":
+            raise ValueError(f"unsupported objective {learner['objective']['name']}")
+        trees = learner["gradient_booster"]["model"]["trees"]
+        base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+        self.base_margin = float(np.log(base_score / (1 - base_score)))
+        self.n_trees = min(n_trees, len(trees))
+        self.total_trees = len(trees)
+
+        width = max(len(t["left_children"]) for t in trees[:self.n_trees])
+        shape = (self.n_trees, width)
+        self.feature = np.zeros(shape, dtype=np.int64)
+        self.threshold = np.zeros(shape, dtype=np.float32)   # leaf value on leaves
+        self.left = np.zeros(shape, dtype=np.int64)
+        self.right = np.zeros(shape, dtype=np.int64)
+        self.default_left = np.zeros(shape, dtype=bool)
+        self.is_leaf = np.ones(shape, dtype=bool)
+        depth = 0
+        for i, tree in enumerate(trees[:self.n_trees]):
+            if any(tree.get("split_type", [])):
+                raise ValueError("categorical splits are not supported")
+            n = len(tree["left_children"])
+            left = np.asarray(tree["left_children"])
+            self.feature[i, :n] = tree["split_indices"]
+            self.threshold[i, :n] = tree["split_conditions"]
+            self.left[i, :n] = np.maximum(left, 0) + i * width
+            self.right[i, :n] = np.maximum(tree["right_children"], 0) + i * width
+            self.default_left[i, :n] = np.asarray(tree["default_left"], dtype=bool)
+            self.is_leaf[i, :n] = left < 0
+            depth = max(depth, _tree_depth(tree["left_children"], tree["right_children"]))
+        self.depth = depth
+        self._roots = np.arange(self.n_trees) * width
+        for name in ("feature", "threshold", "left", "right", "default_left", "is_leaf"):
+            setattr(self, name, getattr(self, name).ravel())
+
+        # Smallest / largest leaf of every tree after the prefix
+        low = high = 0.0
+        for tree in trees[self.n_trees:]:
+            leaves = np.asarray(tree["split_conditions"], dtype=np.float32)[np.asarray(tree["left_children"]) < 0]
+            low += float(leaves.min())
+            high += float(leaves.max())
+        self.rest_low = low
+        self.rest_high = high
+
+    def margin(self, x: np.ndarray) -> float:
+        """Base margin plus the prefix trees' leaves for one scaled row"""
+        x = np.asarray(x, dtype=np.float32).ravel()
+        # Flat node ids (tree * width + node) so every level is a few 1-D takes
+        node = self._roots
+        for _ in range(self.depth):
+            value = x[self.feature.take(node)]
+            go_left = np.where(np.isnan(value), self.default_left.take(node), value < self.threshold.take(node))
+            child = np.where(go_left, self.left.take(node), self.right.take(node))
+            node = np.where(self.is_leaf.take(node), node, child)
+        return self.base_margin + float(self.threshold.take(node).sum(dtype=np.float64))
+
+    def bounds(self, x: np.ndarray) -> tuple:
+        """(low, high) bounds on the full model's fraud probability for one scaled row"""
+        margin = self.margin(x)
+        return (_sigmoid(margin + self.rest_low - PREFIX_MARGIN_SLACK),
+                _sigmoid(margin + self.rest_high + PREFIX_MARGIN_SLACK))
+
+
+class CascadeScorer:
+    def __init__(self, model=None, scaler=None, prefix_trees: int = CASCADE_PREFIX_TREES,
+                 enabled: bool = CASCADE_ENABLED):
+        self.enabled = enabled
+        self.exits = dict.fromkeys(STAGES, 0)
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.booster = None
+        self.prefix = None
+        if model is None or scaler is None:
+            return
+        self.booster = model.get_booster()
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        if prefix_trees > 0:
+            try:
+                self.prefix = TreePrefix(self.booster, prefix_trees)
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Cascade prefix stage disabled: {e}")
+
+    @property
+    def ready(self) -> bool:
+        return self.booster is not None
+
+    def scale_features(self, features: np.ndarray) -> np.ndarray:
+        return (np.asarray(features, dtype=np.float64) - self.mean) / self.scale
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Full-model fraud probabilities for an (n, 22) feature matrix"""
+        return self.booster.inplace_predict(self.scale_features(features))
+
+    def score(self, rule_score: float, is_critical: bool, build_features) -> dict:
+        """ML score for one transaction, running only the stages the decision needs.
+
+        ``build_features`` returns the (1, 22) feature vector and is only called
+        when the rules alone don't settle the decision.
+        """
+        started = time.perf_counter()
+        result, scaled = self.early_exit(rule_score, is_critical, build_features, started)
+        if result is not None:
+            return result
+        return self.full_exit(float(self.booster.inplace_predict(scaled)[0]), started)
+
+    def early_exit(self, rule_score: float, is_critical: bool, build_features, started: float) -> tuple:
+        """(result, None) when a cheap stage settles the decision, else (None, scaled features)"""
+        if self.enabled and len(decision_range(rule_score, is_critical, 0.0, 1.0)) == 1:
+            return self._exit("rules", 0.0, (0.0, 1.0), started), None
+
+        scaled = self.scale_features(build_features())
+        if self.enabled and self.prefix is not None:
+            low, high = self.prefix.bounds(scaled)
+            if len(decision_range(rule_score, is_critical, low, high)) == 1:
+                return self._exit("prefix", low, (low, high), started), None
+        return None, scaled
+
+    def full_exit(self, ml_score: float, started: float) -> dict:
+        """Result for a score from the full model (run here or by inference.InferenceBatcher)"""
+        return self._exit("full", ml_score, (ml_score, ml_score), started)
+
+    def _exit(self, stage: str, ml_score: float, bounds: tuple, started: float) -> dict:
+        self.exits[stage] += 1
+        self.seconds[stage] += time.perf_counter() - started
+        return {"ml_score": ml_score, "ml_stage": stage, "ml_bounds": bounds}
+
+    def snapshot(self) -> dict:
+        total = sum(self.exits.values())
+        return {
+            "enabled": self.enabled and self.ready,
+            "prefix_trees": self.prefix.n_trees if self.prefix else 0,
+            "scored": total,
+            "stages": {
+                stage: {
+                    "exits": self.exits[stage],
+                    "exit_rate": round(self.exits[stage] / total, 4) if total else 0.0,
+                    "mean_us": round(self.seconds[stage] / self.exits[stage] * 1e6, 1) if self.exits[stage] else 0.0
+                }
+                for stage in STAGES
+            }
+        }
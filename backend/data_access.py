@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Single data-access layer for the whole process.
+#
+# One AsyncIOMotorClient (one connection pool per server) is created in the FastAPI
+# lifespan and shared by every endpoint and helper module. Handles are split by role:
+#   - primary handles (users, accounts, transactions, ...) for the payment hot path,
+#     with a durable write concern on the ledger collections
+#   - ``dal.analytics`` handles for analytics, history and export reads, routed to
+#     secondaries with bounded staleness
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("DB_NAME", "payshield_fraud_detection")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Secondaries may lag at most this much for analytics reads (MongoDB minimum is 90s)
+MONGO_MAX_STALENESS_S = max(90, int(os.getenv("MONGO_MAX_STALENESS_S", "90")))
+
+
+def _write_concern_w(value: str):
+    """A node count ("1", "2") as an int; anything else ("majority", a tag set name) unchanged"""
+    return int(value) if value.isdigit() else value
+
+
+# Ledger writes (balances, transactions) must survive a primary failover
+PAYMENT_WRITE_CONCERN = WriteConcern(
+    w=_write_concern_w(os.getenv("MONGO_PAYMENT_W", "majority").strip()),
+    j=True,
+    wtimeout=int(os.getenv("MONGO_PAYMENT_WTIMEOUT_MS", "5000"))
+)
+# Everything else (alerts, contacts, users) only needs acknowledgement from the primary
+DEFAULT_WRITE_CONCERN = WriteConcern(w=1)
+
+ANALYTICS_READ_PREFERENCE = SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_S)
+
+LEDGER_COLLECTIONS = ("accounts", "transactions")
+COLLECTIONS = ("users", "accounts", "transactions", "alerts", "contacts", "blacklist")
+
+# Histogram bucket upper bounds for pool checkout wait time (milliseconds)
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool listener tracking checkouts, failures and wait time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_open = 0
+            self.checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.pool_clears = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def _record_wait(self, wait_ms):
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                self.wait_histogram[i] += 1
+                break
+        else:
+            self.wait_histogram[-1] += 1
+
+    def _wait_ms(self, event):
+        # Newer drivers report the duration on the event; otherwise checkout
+        # started/finished happen on the same executor thread
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration * 1000
+        started = getattr(self._local, "started", None)
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms(event)
+        with self._lock:
+            self.checkout_failures[str(event.reason)] = self.checkout_failures.get(str(event.reason), 0) + 1
+            self._record_wait(wait_ms)
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms(event)
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self._record_wait(wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + sum(self.checkout_failures.values())
+            buckets = {f"le_{b}ms": n for b, n in zip(WAIT_BUCKETS_MS, self.wait_histogram)}
+            buckets["gt_5000ms"] = self.wait_histogram[-1]
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "connections_open": self.connections_open,
+                "connections_checked_out": self.checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "pool_clears": self.pool_clears,
+                "wait_ms_avg": round(self.wait_ms_total / attempts, 3) if attempts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+                "wait_histogram": buckets,
+            }
+
+
+class _Handles:
+    """Attribute access to a fixed set of collections on one database handle"""
+
+    def __init__(self, database, write_concerns=None):
+        write_concerns = write_concerns or {}
+        for name in COLLECTIONS:
+            setattr(self, name, database.get_collection(name, write_concern=write_concerns.get(name)))
+        self.db = database
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+
+class DataAccess:
+    """Owns the process-wide Mongo client; created and closed by the FastAPI lifespan"""
+
+    def __init__(self):
+        self.client = None
+        self.metrics = PoolMetrics()
+        self._primary = None
+        self._analytics = None
+
+    @property
+    def connected(self) -> bool:
+        return self.client is not None
+
+    async def connect(self, uri: str = MONGODB_URI, db_name: str = DB_NAME):
+        if self.client is not None:
+            return
+        self.client = AsyncIOMotorClient(
+            uri,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            retryWrites=True,
+            retryReads=True,
+            event_listeners=[self.metrics],
+        )
+        primary_db = self.client.get_database(db_name, write_concern=DEFAULT_WRITE_CONCERN)
+        self._primary = _Handles(
+            primary_db,
+            {name: PAYMENT_WRITE_CONCERN for name in LEDGER_COLLECTIONS}
+        )
+        self._analytics = _Handles(
+            self.client.get_database(db_name, read_preference=ANALYTICS_READ_PREFERENCE)
+        )
+        print(f"✅ MongoDB pool ready (maxPoolSize={MONGO_MAX_POOL_SIZE}, minPoolSize={MONGO_MIN_POOL_SIZE})")
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self._primary = None
+        self._analytics = None
+
+    def _require(self, handles):
+        if handles is None:
+            raise RuntimeError("Data access layer not connected (is the FastAPI lifespan running?)")
+        return handles
+
+    @property
+    def db(self):
+        """Primary database handle, for collections without a dedicated attribute"""
+        return self._require(self._primary).db
+
+    @property
+    def analytics(self) -> _Handles:
+        """Secondary-preferred handles for analytics, history and export reads"""
+        return self._require(self._analytics)
+
+    @property
+    def users(self):
+        return self._require(self._primary).users
+
+    @property
+    def accounts(self):
+        return self._require(self._primary).accounts
+
+    @property
+    def transactions(self):
+        return self._require(self._primary).transactions
+
+    @property
+    def alerts(self):
+        return self._require(self._primary).alerts
+
+    @property
+    def contacts(self):
+        return self._require(self._primary).contacts
+
+    @property
+    def blacklist(self):
+        return self._require(self._primary).blacklist
+
+
+dal = DataAccess()
@@ -1,58 +1,22 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
 from datetime import datetime
-
-load_dotenv()
-
-MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-DB_NAME = os.getenv("DB_NAME", "payshield_fraud_detection")
-
-# Async client for FastAPI
-async_client = AsyncIOMotorClient(MONGODB_URI)
-async_db = async_client[DB_NAME]
-
-# Sync client for initialization
-sync_client = MongoClient(MONGODB_URI)
-sync_db = sync_client[DB_NAME]
-
-# Collections - MAKE SURE THESE ARE EXPORTED
-transactions_collection = async_db.transactions
-alerts_collection = async_db.alerts
-users_collection = async_db.users  # This is critical!
-accounts_collection = async_db.accounts
-contacts_collection = async_db.contacts
-blacklist_collection = async_db.blacklist
-
-def init_database():
-    """Initialize database with indexes and sample data"""
+from migrations import run_migrations
+from data_access import dal, MONGODB_URI, DB_NAME
+from archive import find_across_tiers, archived_totals
+from analytics_store import analytics_store
+
+# Async helpers go through the shared data-access layer (data_access.dal), which
+# owns the process-wide connection pool. Only init_database opens its own
+# short-lived client, since it runs as a one-off setup step.
+
+async def init_database():
+    """Initialize database with indexes and sample data (await it, or asyncio.run() from a script)"""
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[DB_NAME]
     try:
-        # Create indexes
-        sync_db.transactions.create_index([("transaction_id", 1)], unique=True)
-        sync_db.transactions.create_index([("timestamp", -1)])
-        sync_db.transactions.create_index([("user_id", 1)])
-        sync_db.transactions.create_index([("decision", 1)])
-        sync_db.transactions.create_index([("risk_level", 1)])
-        
-        sync_db.alerts.create_index([("timestamp", -1)])
-        sync_db.alerts.create_index([("transaction_id", 1)])
-        
-        sync_db.users.create_index([("email", 1)], unique=True)
-        sync_db.users.create_index([("firebase_uid", 1)], unique=True, sparse=True)
-
-        sync_db.accounts.create_index([("user_id", 1)])
-        sync_db.accounts.create_index([("account_number", 1)], unique=True)
-        sync_db.accounts.create_index([("is_primary", 1)])
-
-        sync_db.contacts.create_index([("user_id", 1)])
-        sync_db.contacts.create_index([("account_number", 1)])
-
-        sync_db.blacklist.create_index([("account_number", 1)], unique=True)
-
-
-        
-        print("✅ Database indexes created successfully")
+        # Create indexes (versioned, see migrations.py)
+        await run_migrations(db)
         
         # Create sample users if not exist
         sample_users = [
@@ -80,7 +44,7 @@ def init_database():
         ]
         
         for user in sample_users:
-            sync_db.users.update_one(
+            await db.users.update_one(
                 {"email": user["email"]},
                 {"$setOnInsert": user},
                 upsert=True
@@ -90,12 +54,14 @@ def init_database():
         
     except Exception as e:
         print(f"⚠️  Database initialization error: {e}")
+    finally:
+        client.close()
 
 async def save_transaction(transaction_data):
     """Save transaction to MongoDB"""
     try:
         transaction_data["timestamp"] = datetime.utcnow()
-        result = await transactions_collection.insert_one(transaction_data)
+        result = await dal.transactions.insert_one(transaction_data)
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error saving transaction: {e}")
@@ -105,7 +71,7 @@ async def save_alert(alert_data):
     """Save fraud alert to MongoDB"""
     try:
         alert_data["timestamp"] = datetime.utcnow()
-        result = await alerts_collection.insert_one(alert_data)
+        result = await dal.alerts.insert_one(alert_data)
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error saving alert: {e}")
@@ -114,9 +80,9 @@ async def save_alert(alert_data):
 async def get_transaction_history(limit=10, skip=0, filters=None):
     """Get transaction history with optional filters"""
     try:
-        query = filters or {}
-        cursor = transactions_collection.find(query).sort("timestamp", -1).skip(skip).limit(limit)
-        transactions = await cursor.to_list(length=limit)
+        # Fetch skip+limit across hot and archive tiers, then drop the skipped prefix
+        transactions = await find_across_tiers("transactions", filters or {}, limit=skip + limit)
+        transactions = transactions[skip:]
         
         # Convert ObjectId to string
         for txn in transactions:
@@ -130,7 +96,7 @@ async def get_transaction_history(limit=10, skip=0, filters=None):
 async def get_alerts(limit=5, skip=0):
     """Get recent alerts"""
     try:
-        cursor = alerts_collection.find({}).sort("timestamp", -1).skip(skip).limit(limit)
+        cursor = dal.analytics.alerts.find({}).sort("timestamp", -1).skip(skip).limit(limit)
         alerts = await cursor.to_list(length=limit)
         
         for alert in alerts:
@@ -144,18 +110,34 @@ async def get_alerts(limit=5, skip=0):
 async def get_analytics_stats():
     """Get analytics statistics"""
     try:
-        total = await transactions_collection.count_documents({})
-        
-        blocked = await transactions_collection.count_documents({"decision": "BLOCK"})
-        approved = await transactions_collection.count_documents({"decision": "APPROVE"})
-        review = await transactions_collection.count_documents({"decision": "REVIEW"})
-        
-        # Calculate total volume
-        pipeline = [
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        volume_result = await transactions_collection.aggregate(pipeline).to_list(1)
-        total_volume = volume_result[0]["total"] if volume_result else 0
+        if analytics_store.ready:
+            totals = await analytics_store.decision_totals()
+            total = totals["documents"]
+            blocked = totals["counts"].get("BLOCK", 0)
+            approved = totals["counts"].get("APPROVE", 0)
+            review = totals["counts"].get("REVIEW", 0)
+            total_volume = totals["volume"]
+        else:
+            total = await dal.analytics.transactions.estimated_document_count()
+            
+            blocked = await dal.analytics.transactions.count_documents({"decision": "BLOCK"})
+            approved = await dal.analytics.transactions.count_documents({"decision": "APPROVE"})
+            review = await dal.analytics.transactions.count_documents({"decision": "REVIEW"})
+            
+            # Calculate total volume
+            pipeline = [
+                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+            ]
+            volume_result = await dal.analytics.transactions.aggregate(pipeline).to_list(1)
+            total_volume = volume_result[0]["total"] if volume_result else 0
+            
+            # Include transactions that have moved to the monthly archives
+            archived = await archived_totals("transactions")
+            total += archived["documents"]
+            blocked += archived["counts"].get("BLOCK", 0)
+            approved += archived["counts"].get("APPROVE", 0)
+            review += archived["counts"].get("REVIEW", 0)
+            total_volume += archived["volume"]
         
         # Calculate fraud detection rate
         fraud_rate = (blocked / total * 100) if total > 0 else 0
@@ -182,10 +164,13 @@ async def get_analytics_stats():
 async def get_user_by_email(email):
     """Get user by email"""
     try:
-        user = await users_collection.find_one({"email": email})
+        user = await dal.users.find_one({"email": email})
         if user:
             user["_id"] = str(user["_id"])
         return user
     except Exception as e:
         print(f"Error fetching user: {e}")
-        return None
\ No newline at end of file
+        return None
+
+if __name__ == "__main__":
+    asyncio.run(init_database())
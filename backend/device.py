@@ -0,0 +1,212 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+# Device fingerprinting and per-device velocity.
+#
+# fingerprint() turns the request's User-Agent, client hints (Sec-CH-UA*) and the
+# optional X-Device-Id the web widget keeps in localStorage into a parsed device
+# description and a stable device id. User-Agents repeat heavily, so the parsers
+# are LRU-memoized. Without X-Device-Id the id is derived from the parsed UA and
+# hints (``device_id_source: "ua"``); many people share such ids, so the
+# shared-device signal only applies to client ids.
+#
+# DeviceIndex keeps, per device, hourly transaction counts for 24h and the set of
+# users seen on it, and per user the devices they have used, both in bounded LRUs.
+# signals() answers "new device for this user" and "device shared across many
+# users" with a few dict lookups.
+
+DEVICE_MAX_DEVICES = int(os.getenv("DEVICE_MAX_DEVICES", "100000"))
+DEVICE_MAX_USERS = int(os.getenv("DEVICE_MAX_USERS", "100000"))
+# Distinct users tracked per device / devices tracked per user; counts saturate there
+DEVICE_MAX_USERS_PER_DEVICE = 32
+DEVICE_MAX_DEVICES_PER_USER = 16
+DEVICE_WARMUP_DAYS = int(os.getenv("DEVICE_WARMUP_DAYS", "30"))
+
+HOUR_BUCKET_SECONDS = 3600
+HOUR_BUCKETS = 24
+
+# The fields signals() returns
+DEVICE_SIGNALS = ("new_device_for_user", "device_transactions_24h", "device_distinct_users", "user_known_devices")
+
+_BROWSERS = [
+    # Order matters: Edge and Opera UAs also contain "Chrome", Chrome UAs contain "Safari"
+    ("edge", re.compile(r"Edg(?:e|A|iOS)?/(\d+)")),
+    ("opera", re.compile(r"(?:OPR|Opera)/(\d+)")),
+    ("samsung", re.compile(r"SamsungBrowser/(\d+)")),
+    ("firefox", re.compile(r"(?:Firefox|FxiOS)/(\d+)")),
+    ("chrome", re.compile(r"(?:Chrome|CriOS)/(\d+)")),
+    ("safari", re.compile(r"Version/(\d+).*Safari/")),
+]
+_OS = [
+    ("ios", re.compile(r"iPhone|iPad|iPod")),
+    ("android", re.compile(r"Android")),
+    ("windows", re.compile(r"Windows")),
+    ("macos", re.compile(r"Mac OS X|Macintosh")),
+    ("chromeos", re.compile(r"CrOS")),
+    ("linux", re.compile(r"Linux")),
+]
+_BOT = re.compile(r"bot|crawler|spider|curl|python-requests|httpx|okhttp|postman", re.IGNORECASE)
+_CH_BRAND = re.compile(r'"([^"]+)"\s*;\s*v="(\d+)')
+
+
+@lru_cache(maxsize=4096)
+def parse_user_agent(user_agent: str) -> tuple:
+    """(browser, browser_major, os, device_type) for a User-Agent string"""
+    if not user_agent:
+        return ("unknown", "", "unknown", "unknown")
+    browser, major = "other", ""
+    for name, pattern in _BROWSERS:
+        match = pattern.search(user_agent)
+        if match:
+            browser, major = name, match.group(1)
+            break
+    os_name = next((name for name, pattern in _OS if pattern.search(user_agent)), "other")
+    if _BOT.search(user_agent):
+        device_type = "bot"
+    elif "iPad" in user_agent or "Tablet" in user_agent:
+        device_type = "tablet"
+    elif "Mobile" in user_agent or "iPhone" in user_agent:
+        device_type = "mobile"
+    else:
+        device_type = "desktop"
+    return (browser, major, os_name, device_type)
+
+
+@lru_cache(maxsize=1024)
+def parse_client_hints(sec_ch_ua: str, mobile: str, platform: str) -> tuple:
+    """(brand, major, platform, is_mobile) from Sec-CH-UA headers; brand is None without hints"""
+    brand, major = None, ""
+    for name, version in _CH_BRAND.findall(sec_ch_ua or ""):
+        if "Brand" in name:     # GREASE entries like "Not=A?Brand"
+            continue
+        # Prefer the product over the engine ("Google Chrome" over "Chromium")
+        if brand is None or name != "Chromium":
+            brand, major = name, version
+    return (brand, major, (platform or "").strip('"').lower(), (mobile or "").strip() == "?1")
+
+
+def _hash(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=8).hexdigest()
+
+
+def fingerprint(user_agent: str = None, sec_ch_ua: str = None, sec_ch_ua_mobile: str = None,
+                sec_ch_ua_platform: str = None, client_device_id: str = None) -> dict:
+    """Parsed device description plus a stable ``device_id`` for one request"""
+    browser, major, os_name, device_type = parse_user_agent(user_agent or "")
+    if sec_ch_ua or sec_ch_ua_platform:
+        brand, ch_major, platform, is_mobile = parse_client_hints(sec_ch_ua, sec_ch_ua_mobile, sec_ch_ua_platform)
+        if platform:
+            os_name = {"chrome os": "chromeos", "chromium os": "chromeos"}.get(platform, platform)
+        if is_mobile and device_type == "desktop":
+            device_type = "mobile"
+        if brand and not major:
+            major = ch_major
+
+    if client_device_id:
+        device_id, source = _hash(f"client:{client_device_id[:128]}"), "client"
+    else:
+        # A device class only: versions are left out so browser updates don't look like a new device
+        device_id, source = _hash(f"ua:{browser}:{os_name}:{device_type}"), "ua"
+    return {
+        "device_id": device_id,
+        "device_id_source": source,
+        "user_agent": user_agent or "Unknown",
+        "device_type": device_type,
+        "browser": browser,
+        "browser_version": major,
+        "os": os_name
+    }
+
+
+class _DeviceState:
+    __slots__ = ("hourly", "users", "total")
+
+    def __init__(self):
+        self.hourly = {}    # hour bucket -> transaction count
+        self.users = set()
+        self.total = 0
+
+
+class DeviceIndex:
+    def __init__(self, max_devices: int = DEVICE_MAX_DEVICES, max_users: int = DEVICE_MAX_USERS):
+        self.max_devices = max_devices
+        self.max_users = max_users
+        self._devices = OrderedDict()   # device_id -> _DeviceState
+        self._users = OrderedDict()     # user_id -> set of device ids
+
+    def record(self, device_id: str, user_id: str, ts: float = None):
+        """Fold one transaction from ``device_id`` by ``user_id`` in; ``ts`` is a Unix timestamp"""
+        ts = time.time() if ts is None else ts
+        state = self._devices.get(device_id)
+        if state is None:
+            state = self._devices[device_id] = _DeviceState()
+            if len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(device_id)
+
+        bucket = int(ts // HOUR_BUCKET_SECONDS)
+        oldest = int(time.time() // HOUR_BUCKET_SECONDS) - HOUR_BUCKETS
+        for old in [b for b in state.hourly if b <= oldest]:
+            del state.hourly[old]
+        if bucket > oldest:
+            state.hourly[bucket] = state.hourly.get(bucket, 0) + 1
+        state.total += 1
+        if len(state.users) < DEVICE_MAX_USERS_PER_DEVICE:
+            state.users.add(user_id)
+
+        devices = self._users.get(user_id)
+        if devices is None:
+            devices = self._users[user_id] = set()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        if len(devices) < DEVICE_MAX_DEVICES_PER_USER:
+            devices.add(device_id)
+
+    def signals(self, device_id: str, user_id: str, now: float = None) -> dict:
+        """Scorer fields for a payment from ``device_id`` by ``user_id``"""
+        now = time.time() if now is None else now
+        state = self._devices.get(device_id)
+        known = self._users.get(user_id)
+        oldest = int(now // HOUR_BUCKET_SECONDS) - HOUR_BUCKETS
+        other_users = len(state.users - {user_id}) if state else 0
+        return {
+            # Only meaningful once we've seen the user on some device
+            "new_device_for_user": bool(known) and device_id not in known,
+            "device_transactions_24h": sum(c for b, c in state.hourly.items() if b > oldest) if state else 0,
+            "device_distinct_users": other_users + 1,
+            "user_known_devices": len(known) if known else 0
+        }
+
+    def __len__(self):
+        return len(self._devices)
+
+
+device_index = DeviceIndex()
+
+
+async def warm_up(transactions, days: int = DEVICE_WARMUP_DAYS) -> int:
+    """Rebuild the index after a restart from the last ``days`` of transactions"""
+    since = datetime.utcnow() - timedelta(days=days)
+    cursor = transactions.find(
+        {"timestamp": {"$gte": since}, "device_info.device_id": {"$exists": True}},
+        {"_id": 0, "user_id": 1, "device_info.device_id": 1, "timestamp": 1}
+    ).sort("timestamp", 1)
+    count = 0
+    try:
+        async for txn in cursor:
+            ts = txn["timestamp"].replace(tzinfo=timezone.utc).timestamp()
+            device_index.record(txn["device_info"]["device_id"], txn["user_id"], ts)
+            count += 1
+    except Exception as e:
+        print(f"⚠️ Device index warm-up stopped after {count} transactions: {e}")
+        return count
+    print(f"✅ Device index warmed up from {count} transactions")
+    return count
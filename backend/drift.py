@@ -0,0 +1,196 @@
+import json
+import math
+import os
+import time
+import numpy as np
+from features import MODEL_FEATURES
+
+# Streaming feature-drift monitor.
+#
+# Every scored payment adds its 22 model inputs (standardized with the training
+# scaler) and, when the full model ran, its ml_score to fixed-bin histograms:
+# one searchsorted over a shared bin grid and one scatter-add, a few
+# microseconds and no allocation that grows with traffic. Histograms live in
+# time windows of DRIFT_WINDOW_SECONDS; the current window and the last complete
+# one are kept, so memory is constant.
+#
+# report() compares each window with the reference profile, per feature and for
+# ml_score: PSI over the bins and KS (largest gap between the binned CDFs).
+# The reference is a JSON profile exported at training time (DRIFT_REFERENCE_PATH,
+# same bin grid). Without one it falls back to what the scaler implies, a
+# standard normal per standardized feature, and says so in the report
+# ("reference": "scaler"); that approximation is rough for skewed inputs.
+#
+# Like the other in-memory signals, each worker process monitors its own traffic.
+
+DRIFT_ENABLED = os.getenv("DRIFT_ENABLED", "true").lower() == "true"
+DRIFT_WINDOW_SECONDS = int(os.getenv("DRIFT_WINDOW_SECONDS", "3600"))
+DRIFT_REFERENCE_PATH = os.getenv("DRIFT_REFERENCE_PATH", "drift_reference.json")
+# Windows with fewer observations report counts but no PSI/KS
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "200"))
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+
+# Interior bin edges in standardized units, shared by every feature; the outer
+# bins are open-ended
+FEATURE_EDGES = np.array([-3, -2, -1.5, -1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10])
+SCORE_EDGES = np.linspace(0.05, 0.95, 19)
+# Empty bins are floored at this share so PSI stays finite
+PSI_EPSILON = 1e-4
+
+
+def _normal_cdf(x: float) -> float:
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+
+def scaler_reference() -> dict:
+    """Reference bin shares assuming standard normal standardized features"""
+    cdf = np.array([0.0] + [_normal_cdf(e) for e in FEATURE_EDGES] + [1.0])
+    shares = np.diff(cdf)
+    return {"source": "scaler", "features": {name: shares.tolist() for name in MODEL_FEATURES}, "ml_score": None}
+
+
+def load_reference(path: str = DRIFT_REFERENCE_PATH) -> dict:
+    """Training-time reference profile, or the scaler-derived fallback"""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+        if profile.get("feature_edges") != FEATURE_EDGES.tolist():
+            raise ValueError("bin grid differs from drift.FEATURE_EDGES")
+        features = {name: _shares(profile["features"][name]).tolist() for name in MODEL_FEATURES}
+        score = profile.get("ml_score")
+        if score and profile.get("score_edges") != SCORE_EDGES.tolist():
+            raise ValueError("score bins differ from drift.SCORE_EDGES")
+        return {"source": path, "features": features, "ml_score": _shares(score).tolist() if score else None}
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ Drift reference {path} not usable: {e}")
+    return scaler_reference()
+
+
+def _shares(counts) -> np.ndarray:
+    counts = np.asarray(counts, dtype=np.float64)
+    return counts / counts.sum() if counts.sum() else counts
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population stability index between two vectors of bin shares"""
+    e = np.maximum(expected, PSI_EPSILON)
+    a = np.maximum(actual, PSI_EPSILON)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Largest gap between the two binned CDFs"""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+def histogram_counts(values: np.ndarray, edges: np.ndarray = FEATURE_EDGES) -> np.ndarray:
+    """(n_features, n_bins) counts for an (n, n_features) matrix of standardized values"""
+    values = np.atleast_2d(values)
+    bins = np.searchsorted(edges, values, side="right")
+    counts = np.zeros((values.shape[1], len(edges) + 1), dtype=np.int64)
+    np.add.at(counts, (np.broadcast_to(np.arange(values.shape[1]), values.shape), bins), 1)
+    return counts
+
+
+def reference_profile(feature_counts: np.ndarray, score_counts: np.ndarray = None) -> dict:
+    """Reference profile from (22, n_bins) feature bin counts (see histogram_counts) and score bin counts"""
+    profile = {
+        "feature_edges": FEATURE_EDGES.tolist(),
+        "features": {name: np.asarray(feature_counts[i]).tolist() for i, name in enumerate(MODEL_FEATURES)},
+        "samples": int(np.asarray(feature_counts[0]).sum())
+    }
+    if score_counts is not None:
+        profile["score_edges"] = SCORE_EDGES.tolist()
+        profile["ml_score"] = np.asarray(score_counts).tolist()
+    return profile
+
+
+class _Window:
+    __slots__ = ("started", "features", "scores", "n", "n_scores")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.features = np.zeros((len(MODEL_FEATURES), len(FEATURE_EDGES) + 1), dtype=np.int64)
+        self.scores = np.zeros(len(SCORE_EDGES) + 1, dtype=np.int64)
+        self.n = 0
+        self.n_scores = 0
+
+
+class DriftMonitor:
+    def __init__(self, scaler=None, reference: dict = None, window_seconds: int = DRIFT_WINDOW_SECONDS,
+                 enabled: bool = DRIFT_ENABLED):
+        self.enabled = enabled and scaler is not None
+        self.window_seconds = window_seconds
+        if scaler is not None:
+            self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+            self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self.reference = reference or load_reference()
+        # Offset of each feature's first bin in the flattened histogram
+        self._offsets = np.arange(len(MODEL_FEATURES)) * (len(FEATURE_EDGES) + 1)
+        self.current = _Window(time.time())
+        self.previous = None
+
+    def _rotate(self, now: float):
+        if now - self.current.started >= self.window_seconds:
+            # A quiet gap longer than a window leaves nothing to compare against
+            stale = now - self.current.started >= 2 * self.window_seconds
+            self.previous = None if stale else self.current
+            self.current = _Window(now - (now - self.current.started) % self.window_seconds)
+
+    def observe(self, features: np.ndarray, ml_score: float = None, now: float = None):
+        """Add one payment's (1, 22) raw model inputs and, if the full model ran, its score"""
+        if not self.enabled:
+            return
+        self._rotate(time.time() if now is None else now)
+        window = self.current
+        scaled = (np.ravel(features) - self.mean) / self.scale
+        window.features.ravel()[self._offsets + FEATURE_EDGES.searchsorted(scaled, side="right")] += 1
+        window.n += 1
+        if ml_score is not None:
+            window.scores[SCORE_EDGES.searchsorted(ml_score, side="right")] += 1
+            window.n_scores += 1
+
+    def _compare(self, window: _Window) -> dict:
+        result = {
+            "window_start": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(window.started)),
+            "observations": window.n,
+            "scored": window.n_scores,
+            "features": {},
+            "ml_score": None
+        }
+        if window.n >= DRIFT_MIN_SAMPLES:
+            for i, name in enumerate(MODEL_FEATURES):
+                expected = np.asarray(self.reference["features"][name])
+                actual = window.features[i] / window.n
+                value = psi(expected, actual)
+                result["features"][name] = {"psi": round(value, 4), "ks": round(ks(expected, actual), 4),
+                                            "status": _status(value)}
+        if self.reference["ml_score"] and window.n_scores >= DRIFT_MIN_SAMPLES:
+            expected = np.asarray(self.reference["ml_score"])
+            actual = window.scores / window.n_scores
+            value = psi(expected, actual)
+            result["ml_score"] = {"psi": round(value, 4), "ks": round(ks(expected, actual), 4),
+                                  "status": _status(value)}
+        return result
+
+    def report(self) -> dict:
+        self._rotate(time.time())
+        return {
+            "enabled": self.enabled,
+            "reference": self.reference["source"],
+            "window_seconds": self.window_seconds,
+            "min_samples": DRIFT_MIN_SAMPLES,
+            "current": self._compare(self.current),
+            "previous": self._compare(self.previous) if self.previous else None
+        }
+
+
+def _status(value: float) -> str:
+    if value >= PSI_ALERT:
+        return "drift"
+    if value >= PSI_WARN:
+        return "warn"
+    return "stable"
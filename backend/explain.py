@@ -0,0 +1,146 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import xgboost as xgb
+from pymongo import UpdateOne
+from data_access import dal
+from features import MODEL_FEATURES
+
+# Per-feature explanations of the ML score for alerted transactions.
+#
+# BLOCK/REVIEW alerts store the model's 22 raw inputs (``model_inputs``) and an
+# ``explain_pending`` flag; APPROVE transactions never pay for an explanation.
+# Explanations are the booster's exact TreeSHAP contributions
+# (``pred_contribs``): one margin contribution per feature plus the bias, summing
+# to the model's log-odds. The model sees standardized inputs, so each feature is
+# reported with its value in original units (the scaler's inverse) next to its
+# contribution.
+#
+# TreeSHAP costs around a millisecond per row and holds no GIL, so it runs on a
+# small thread pool, many rows per call. Two paths feed it:
+#   - on demand: GET /api/v2/alerts/{id}/explanation queues the alert and waits;
+#     requests arriving within EXPLAIN_BATCH_WINDOW_MS share one call, and
+#     concurrent requests for the same alert share one result.
+#   - background: run_explainer() sweeps pending alerts in batches of
+#     EXPLAIN_BATCH_SIZE, newest first, so most are ready before anyone asks.
+# Results are cached on the alert (``explanation``) and the pending flag is
+# removed, so asking twice costs one indexed read.
+
+EXPLAIN_ENABLED = os.getenv("EXPLAIN_ENABLED", "true").lower() == "true"
+EXPLAIN_WORKERS = int(os.getenv("EXPLAIN_WORKERS", "1"))
+EXPLAIN_BATCH_SIZE = int(os.getenv("EXPLAIN_BATCH_SIZE", "200"))
+EXPLAIN_BATCH_WINDOW_MS = float(os.getenv("EXPLAIN_BATCH_WINDOW_MS", "5"))
+EXPLAIN_INTERVAL_SECONDS = int(os.getenv("EXPLAIN_INTERVAL_SECONDS", "30"))
+# Features listed per explanation, by absolute contribution
+EXPLAIN_TOP_FEATURES = int(os.getenv("EXPLAIN_TOP_FEATURES", "8"))
+
+
+class AlertExplainer:
+    def __init__(self, model=None, scaler=None, workers: int = EXPLAIN_WORKERS):
+        self.booster = model.get_booster() if model is not None and scaler is not None else None
+        if self.booster is not None:
+            self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+            self.scale = np.asarray(scaler.scale_, dtype=np.float64)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="explain")
+        self._queue = {}        # transaction_id -> (model_inputs, future) for the next batch
+        self._flush = None
+        self.stats = {"explained": 0, "batches": 0, "cache_hits": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self.booster is not None
+
+    def explain_matrix(self, inputs: np.ndarray) -> list:
+        """Explanations for an (n, 22) matrix of raw model inputs"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        scaled = (inputs - self.mean) / self.scale
+        contribs = self.booster.predict(xgb.DMatrix(scaled), pred_contribs=True)
+        explanations = []
+        for raw, row in zip(inputs, contribs):
+            margin = float(row.sum())
+            order = np.argsort(-np.abs(row[:-1]))[:EXPLAIN_TOP_FEATURES]
+            explanations.append({
+                "ml_score": float(1.0 / (1.0 + np.exp(-margin))),
+                "margin": margin,
+                "bias": float(row[-1]),
+                "contributions": [
+                    {"feature": MODEL_FEATURES[i], "value": float(raw[i]), "contribution": float(row[i])}
+                    for i in order
+                ]
+            })
+        return explanations
+
+    async def _explain_and_store(self, transaction_ids: list, inputs: list) -> list:
+        loop = asyncio.get_running_loop()
+        explanations = await loop.run_in_executor(self._executor, self.explain_matrix, np.array(inputs))
+        await dal.alerts.bulk_write([
+            UpdateOne({"transaction_id": txn_id},
+                      {"$set": {"explanation": explanation}, "$unset": {"explain_pending": ""}})
+            for txn_id, explanation in zip(transaction_ids, explanations)
+        ], ordered=False)
+        self.stats["explained"] += len(explanations)
+        self.stats["batches"] += 1
+        return explanations
+
+    async def _flush_queue(self):
+        await asyncio.sleep(EXPLAIN_BATCH_WINDOW_MS / 1000)
+        queue, self._queue, self._flush = self._queue, {}, None
+        transaction_ids = list(queue)
+        try:
+            explanations = await self._explain_and_store(transaction_ids, [queue[t][0] for t in transaction_ids])
+        except Exception as e:
+            for _, future in queue.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for txn_id, explanation in zip(transaction_ids, explanations):
+            queue[txn_id][1].set_result(explanation)
+
+    async def explain(self, transaction_id: str):
+        """The alert's explanation, computed on first request; None if the alert has no model inputs"""
+        alert = await dal.alerts.find_one(
+            {"transaction_id": transaction_id}, {"_id": 0, "explanation": 1, "model_inputs": 1}
+        )
+        if alert is None or not self.ready:
+            return None
+        if "explanation" in alert:
+            self.stats["cache_hits"] += 1
+            return alert["explanation"]
+        if not alert.get("model_inputs"):
+            return None
+
+        queued = self._queue.get(transaction_id)
+        if queued is None:
+            queued = self._queue[transaction_id] = (alert["model_inputs"], asyncio.get_running_loop().create_future())
+            if self._flush is None:
+                self._flush = asyncio.create_task(self._flush_queue())
+        # shield: one caller disconnecting must not cancel the batch for the others
+        return await asyncio.shield(queued[1])
+
+    async def explain_pending(self, limit: int = EXPLAIN_BATCH_SIZE) -> int:
+        """Explain one batch of pending alerts, newest first; returns how many"""
+        alerts = await dal.alerts.find(
+            {"explain_pending": True}, {"_id": 0, "transaction_id": 1, "model_inputs": 1}
+        ).sort("timestamp", -1).limit(limit).to_list(length=limit)
+        alerts = [a for a in alerts if a.get("model_inputs")]
+        if not alerts:
+            return 0
+        await self._explain_and_store([a["transaction_id"] for a in alerts], [a["model_inputs"] for a in alerts])
+        return len(alerts)
+
+    async def run(self, interval: int = EXPLAIN_INTERVAL_SECONDS):
+        """Background loop started from the FastAPI lifespan"""
+        while True:
+            try:
+                # Drain the backlog batch by batch, then wait for new alerts
+                while await self.explain_pending() == EXPLAIN_BATCH_SIZE:
+                    await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Explanation job error: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
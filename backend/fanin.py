@@ -0,0 +1,158 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Incremental receiver fan-in aggregates for mule-account detection.
+#
+# For every receiver we keep time-bucketed HyperLogLog sketches of distinct
+# senders (10-minute buckets for the 1h window, hourly buckets for the 24h
+# window) plus inbound count/volume per hourly bucket. Recording a transaction
+# touches two buckets and reading the features merges at most 30 small register
+# arrays, so both are O(1) per transaction. Buckets are allocated lazily, so a
+# receiver with a handful of payments costs a few hundred bytes. Receivers are
+# kept in an LRU bounded by FANIN_MAX_RECEIVERS.
+
+FANIN_MAX_RECEIVERS = int(os.getenv("FANIN_MAX_RECEIVERS", "50000"))
+# 2^7 = 128 one-byte registers per bucket: ~9% standard error
+HLL_PRECISION = int(os.getenv("FANIN_HLL_PRECISION", "7"))
+
+FINE_BUCKET_SECONDS = 600
+FINE_BUCKETS = 6            # 6 × 10 min = 1h
+HOUR_BUCKET_SECONDS = 3600
+HOUR_BUCKETS = 24           # 24 × 1h = 24h
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """Register operations on plain uint8 arrays so buckets can be merged with NumPy"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def empty(self) -> np.ndarray:
+        return np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, registers: np.ndarray, item_hash: int):
+        index = item_hash & (self.m - 1)
+        w = item_hash >> self.p
+        rank = (64 - self.p) - w.bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+
+    def count(self, registers: np.ndarray) -> int:
+        estimate = self.alpha * self.m * self.m / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+        if estimate <= 2.5 * self.m:
+            zeros = int(np.count_nonzero(registers == 0))
+            if zeros:
+                estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+    def count_union(self, sketches: list) -> int:
+        if not sketches:
+            return 0
+        return self.count(np.maximum.reduce(sketches) if len(sketches) > 1 else sketches[0])
+
+
+class _ReceiverState:
+    __slots__ = ("fine", "hourly", "inbound")
+
+    def __init__(self):
+        self.fine = {}      # 10-minute bucket -> registers
+        self.hourly = {}    # hour bucket -> registers
+        self.inbound = {}   # hour bucket -> [count, volume]
+
+    def prune(self, fine_now: int, hour_now: int):
+        for bucket in [b for b in self.fine if b <= fine_now - FINE_BUCKETS]:
+            del self.fine[bucket]
+        for bucket in [b for b in self.hourly if b <= hour_now - HOUR_BUCKETS]:
+            del self.hourly[bucket]
+            self.inbound.pop(bucket, None)
+
+
+class ReceiverFanIn:
+    def __init__(self, max_receivers: int = FANIN_MAX_RECEIVERS, precision: int = HLL_PRECISION):
+        self.max_receivers = max_receivers
+        self.hll = HyperLogLog(precision)
+        self._receivers = OrderedDict()
+
+    def __len__(self):
+        return len(self._receivers)
+
+    def record(self, receiver: str, sender: str, amount: float, ts: float = None):
+        """Fold one transaction into the receiver's sketches; ``ts`` is a Unix timestamp"""
+        now = time.time()
+        ts = now if ts is None else ts
+        fine_now, hour_now = int(now // FINE_BUCKET_SECONDS), int(now // HOUR_BUCKET_SECONDS)
+        fine_bucket, hour_bucket = int(ts // FINE_BUCKET_SECONDS), int(ts // HOUR_BUCKET_SECONDS)
+        if hour_bucket <= hour_now - HOUR_BUCKETS:
+            return
+
+        state = self._receivers.get(receiver)
+        if state is None:
+            state = _ReceiverState()
+            self._receivers[receiver] = state
+            if len(self._receivers) > self.max_receivers:
+                self._receivers.popitem(last=False)
+        else:
+            self._receivers.move_to_end(receiver)
+            state.prune(fine_now, hour_now)
+
+        sender_hash = hash64(sender)
+        if fine_bucket > fine_now - FINE_BUCKETS:
+            self.hll.add(state.fine.setdefault(fine_bucket, self.hll.empty()), sender_hash)
+        self.hll.add(state.hourly.setdefault(hour_bucket, self.hll.empty()), sender_hash)
+        inbound = state.inbound.setdefault(hour_bucket, [0, 0.0])
+        inbound[0] += 1
+        inbound[1] += amount
+
+    def features(self, receiver: str, now: float = None) -> dict:
+        """Fan-in features for a receiver as of ``now``"""
+        now = time.time() if now is None else now
+        state = self._receivers.get(receiver)
+        if state is None:
+            return {
+                "receiver_distinct_senders_1h": 0,
+                "receiver_distinct_senders_24h": 0,
+                "receiver_inbound_volume_24h": 0.0,
+                "receiver_inbound_count_24h": 0
+            }
+        state.prune(int(now // FINE_BUCKET_SECONDS), int(now // HOUR_BUCKET_SECONDS))
+        return {
+            "receiver_distinct_senders_1h": self.hll.count_union(list(state.fine.values())),
+            "receiver_distinct_senders_24h": self.hll.count_union(list(state.hourly.values())),
+            "receiver_inbound_volume_24h": round(sum(v for _, v in state.inbound.values()), 2),
+            "receiver_inbound_count_24h": sum(c for c, _ in state.inbound.values())
+        }
+
+
+receiver_fanin = ReceiverFanIn()
+
+
+async def warm_up(transactions, hours: int = 24) -> int:
+    """Rebuild the sketches after a restart from the last ``hours`` of transactions"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    cursor = transactions.find(
+        {"timestamp": {"$gte": since}},
+        {"_id": 0, "receiver_account": 1, "user_id": 1, "amount": 1, "timestamp": 1}
+    ).sort("timestamp", 1)
+    count = 0
+    try:
+        async for txn in cursor:
+            if not txn.get("receiver_account") or not txn.get("user_id"):
+                continue
+            ts = txn["timestamp"].replace(tzinfo=timezone.utc).timestamp()
+            receiver_fanin.record(txn["receiver_account"], txn["user_id"], txn.get("amount", 0.0), ts)
+            count += 1
+    except Exception as e:
+        print(f"⚠️ Receiver fan-in warm-up stopped after {count} transactions: {e}")
+        return count
+    print(f"✅ Receiver fan-in warmed up from {count} transactions")
+    return count
@@ -0,0 +1,306 @@
+import argparse
+import calendar
+import json
+import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+from numpy.lib.format import dtype_to_descr, descr_to_dtype
+from features import MODEL_FEATURES
+from txn_codec import STORED_FEATURES, ML_STAGES, ML_STAGE_CODES
+
+# Append-only log of the exact feature vectors payments were scored with.
+#
+# Every payment appends one fixed-size record: transaction id, timestamp, the
+# float32 feature vector (txn_codec.STORED_FEATURES: the model's 22 inputs first,
+# then fan-in and device signals), the ML and final scores, the decision and the
+# cascade stage. append() only puts a tuple on a bounded queue. A background
+# thread per process drains it in batches and writes them sequentially to the
+# current segment. When the queue is full, records are dropped and counted; a
+# payment never waits on the log.
+#
+# Segments are files with a HEADER_SIZE JSON header (feature names and record
+# dtype) followed by packed records. The file being written ends in ``.open``.
+# It is renamed to ``.flog`` after FEATURE_LOG_SEGMENT_ROWS rows or at shutdown.
+# A process that died leaves its ``.open`` file behind; the next writer trims any
+# partial record and seals it. Each process writes its own segments, so workers
+# never share a file.
+#
+# open_segment() maps a segment with np.memmap: no copy and no parsing, so
+# offline tools (retraining, replay) scan it at disk speed and the page cache
+# keeps recent segments warm. ``python feature_log.py`` scans the whole log and
+# reports rows per decision and the scan rate.
+
+FEATURE_LOG_DIR = os.getenv("FEATURE_LOG_DIR", "")
+FEATURE_LOG_SEGMENT_ROWS = int(os.getenv("FEATURE_LOG_SEGMENT_ROWS", "1000000"))
+FEATURE_LOG_QUEUE_SIZE = int(os.getenv("FEATURE_LOG_QUEUE_SIZE", "100000"))
+# Records written per write() call at most
+FEATURE_LOG_WRITE_BATCH = 4096
+
+MAGIC = b"PAYSHIELD-FEATURE-LOG\n"
+HEADER_SIZE = 4096
+SEALED_SUFFIX = ".flog"
+OPEN_SUFFIX = ".flog.open"
+# features-<first record ms>-w<worker>-<pid>-<sequence in that process>
+_SEGMENT_NAME = re.compile(r"features-(\d+)-w(\w+)-(\d+)-(\d+)\.flog(\.open)?$")
+
+DECISIONS = ("APPROVE", "BLOCK", "REVIEW")
+DECISION_CODES = {name: code for code, name in enumerate(DECISIONS)}
+UNKNOWN_DECISION = 255
+NO_ML_STAGE = -1
+
+RECORD = np.dtype([
+    ("transaction_id", "S16"),
+    ("timestamp_ms", "<i8"),
+    ("features", "<f4", (len(STORED_FEATURES),)),
+    ("ml_score", "<f4"),
+    ("risk_score", "<f4"),
+    ("decision", "u1"),             # DECISIONS code
+    ("ml_stage", "i1"),             # txn_codec.ML_STAGES code, NO_ML_STAGE when the model didn't run
+])
+
+_STOP = object()
+
+
+def _header() -> bytes:
+    meta = json.dumps({
+        "version": 1,
+        "features": STORED_FEATURES,
+        "model_features": len(MODEL_FEATURES),
+        "decisions": DECISIONS,
+        "ml_stages": ML_STAGES,
+        "dtype": dtype_to_descr(RECORD),
+    }).encode()
+    header = MAGIC + meta + b"\n"
+    if len(header) > HEADER_SIZE:
+        raise ValueError("Feature log header does not fit in HEADER_SIZE")
+    return header.ljust(HEADER_SIZE, b" ")
+
+
+def _to_ms(ts) -> int:
+    return calendar.timegm(ts.utctimetuple()) * 1000 + ts.microsecond // 1000
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ===== READER =====
+def read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a feature log segment")
+    meta = json.loads(header[len(MAGIC):].decode().strip())
+    meta["dtype"] = descr_to_dtype([
+        (field[0], field[1], tuple(field[2])) if len(field) > 2 else tuple(field) for field in meta["dtype"]
+    ])
+    return meta
+
+
+def open_segment(path: str) -> np.ndarray:
+    """Read-only zero-copy view of a segment's records (a trailing partial record is left out)"""
+    dtype = read_header(path)["dtype"]
+    rows = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if rows <= 0:
+        # np.memmap can't map zero bytes
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(rows,))
+
+
+def segment_paths(directory: str = FEATURE_LOG_DIR, include_open: bool = False) -> list:
+    """Segment files, oldest first"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_NAME.match(name)
+        if match and (include_open or not match.group(5)):
+            found.append((int(match.group(1)), name))
+    return [os.path.join(directory, name) for _, name in sorted(found)]
+
+
+def iter_segments(directory: str = FEATURE_LOG_DIR, include_open: bool = False):
+    """(path, records) per segment; records are np.memmap views"""
+    for path in segment_paths(directory, include_open):
+        yield path, open_segment(path)
+
+
+def model_inputs(records: np.ndarray) -> np.ndarray:
+    """The model's 22 inputs of each record, shape (n, 22), as a view"""
+    return records["features"][:, :len(MODEL_FEATURES)]
+
+
+def seal_orphans(directory: str) -> int:
+    """Seal ``.open`` segments whose writer process is gone; returns how many"""
+    sealed = 0
+    for path in segment_paths(directory, include_open=True):
+        match = _SEGMENT_NAME.match(os.path.basename(path))
+        if not match.group(5) or _pid_alive(int(match.group(3))):
+            continue
+        dtype = read_header(path)["dtype"]
+        rows = max((os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize, 0)
+        os.truncate(path, HEADER_SIZE + rows * dtype.itemsize)
+        os.rename(path, path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        sealed += 1
+    return sealed
+
+
+# ===== WRITER =====
+class FeatureLog:
+    def __init__(self, directory: str = FEATURE_LOG_DIR, segment_rows: int = FEATURE_LOG_SEGMENT_ROWS,
+                 queue_size: int = FEATURE_LOG_QUEUE_SIZE):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.segment_rows = segment_rows
+        self.worker = "0"
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._file = None
+        self._path = None
+        self._rows = 0
+        self._sequence = 0
+        self.stats = {"appended": 0, "written": 0, "dropped": 0, "segments_sealed": 0, "write_errors": 0}
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        # Set by server.py in each worker before the app starts
+        self.worker = os.getenv("WORKER_ID", "0")
+        os.makedirs(self.directory, exist_ok=True)
+        orphans = seal_orphans(self.directory)
+        if orphans:
+            print(f"⚠️ Feature log: sealed {orphans} segment(s) left open by a stopped worker")
+        self._thread = threading.Thread(target=self._run, name="feature-log", daemon=True)
+        self._thread.start()
+
+    def append(self, transaction_id: str, timestamp, features: np.ndarray, ml_score: float,
+               risk_score: float, decision: str, ml_stage: str = None):
+        """Queue one record; never blocks"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait((transaction_id, _to_ms(timestamp), features,
+                                    ml_score, risk_score, decision, ml_stage))
+            self.stats["appended"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def close(self, timeout: float = 10.0):
+        """Write what is queued and seal the current segment"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ Feature log queue still full at shutdown")
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < FEATURE_LOG_WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            try:
+                self._write([item for item in batch if item is not _STOP])
+                if stop:
+                    self._seal()
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                print(f"❌ Feature log write error: {e}")
+            if stop:
+                return
+
+    def _write(self, items: list):
+        if not items:
+            return
+        records = np.zeros(len(items), dtype=RECORD)
+        records["transaction_id"] = [item[0].encode() for item in items]
+        records["timestamp_ms"] = [item[1] for item in items]
+        records["features"] = np.stack([item[2] for item in items])
+        records["ml_score"] = [item[3] or 0.0 for item in items]
+        records["risk_score"] = [item[4] for item in items]
+        records["decision"] = [DECISION_CODES.get(item[5], UNKNOWN_DECISION) for item in items]
+        records["ml_stage"] = [ML_STAGE_CODES.get(item[6], NO_ML_STAGE) for item in items]
+
+        offset = 0
+        while offset < len(records):
+            if self._file is None:
+                self._open_segment(int(records["timestamp_ms"][offset]))
+            chunk = records[offset:offset + self.segment_rows - self._rows]
+            self._file.write(chunk.tobytes())
+            self._rows += len(chunk)
+            offset += len(chunk)
+            if self._rows >= self.segment_rows:
+                self._seal()
+        if self._file is not None:
+            # Into the page cache, where readers of open segments see it
+            self._file.flush()
+        self.stats["written"] += len(records)
+
+    def _open_segment(self, start_ms: int):
+        self._sequence += 1
+        name = f"features-{start_ms:013d}-w{self.worker}-{os.getpid()}-{self._sequence:06d}{OPEN_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._file = open(self._path, "wb")
+        self._file.write(_header())
+        self._rows = 0
+
+    def _seal(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.rename(self._path, self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._file = None
+        self._path = None
+        self.stats["segments_sealed"] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "queued": self._queue.qsize(),
+            "segment": os.path.basename(self._path) if self._path else None,
+            "segment_rows": self._rows,
+        }
+
+
+feature_log = FeatureLog()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan the feature log and report rows per decision")
+    parser.add_argument("directory", nargs="?", default=FEATURE_LOG_DIR)
+    parser.add_argument("--include-open", action="store_true", help="also read segments still being written")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows, size = 0, 0
+    counts = np.zeros(256, dtype=np.int64)
+    score_sum = 0.0
+    for path, records in iter_segments(args.directory, args.include_open):
+        rows += len(records)
+        size += os.path.getsize(path)
+        counts += np.bincount(records["decision"], minlength=256)
+        score_sum += float(records["ml_score"].sum(dtype=np.float64))
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ {rows:,} records, {size / 1e9:.2f} GB in {elapsed:.2f}s "
+          f"({rows / elapsed if elapsed else 0:,.0f} rows/s, {size / 1e9 / elapsed if elapsed else 0:.2f} GB/s)")
+    for code, name in enumerate(DECISIONS):
+        print(f"   {name:<8} {counts[code]:>14,}")
+    if rows:
+        print(f"   mean ml_score {score_sum / rows:.4f}")
@@ -0,0 +1,112 @@
+import numpy as np
+
+# Serving feature schema.
+#
+# MODEL_FEATURES are the 22 inputs the XGBoost model was trained on, in order.
+# Both scoring endpoints build them here so the layout can't drift between them.
+# EXTENDED_FEATURES are online signals computed at decision time (receiver
+# fan-in, ...); they feed the rule engine and are stored with the transaction for
+# retraining, but are not model inputs until a model is trained on them.
+
+PAYMENT_TYPES = ("TRANSFER", "CASH_OUT", "PAYMENT", "DEBIT", "CASH_IN")
+
+MODEL_FEATURES = [
+    "amount",
+    "sender_balance",
+    "sender_balance_after",
+    "receiver_balance",
+    "receiver_balance_after",
+    "amount_to_balance_ratio",
+    "type_transfer",
+    "type_cash_out",
+    "type_payment",
+    "type_debit",
+    "type_cash_in",
+    "transactions_24h",
+    "transactions_1h",
+    "volume_24h",
+    "drain_ratio",
+    "critical_drain",
+    "high_drain",
+    "high_velocity_1h",
+    "high_velocity_24h",
+    "balance_disparity",
+    "large_amount",
+    "log_amount",
+]
+
+EXTENDED_FEATURES = [
+    "receiver_distinct_senders_1h",
+    "receiver_distinct_senders_24h",
+    "receiver_inbound_volume_24h",
+    "receiver_inbound_count_24h",
+]
+
+
+def build_feature_vector(amount: float, sender_balance: float, receiver_balance: float, payment_type: str,
+                         transactions_24h: int, transactions_1h: int, volume_24h: float) -> np.ndarray:
+    """The model's 22 inputs for one transaction, shape (1, 22)"""
+    drain_pct = (amount / sender_balance * 100) if sender_balance > 0 else 0
+    return np.array([[
+        amount,
+        sender_balance,
+        sender_balance - amount,
+        receiver_balance,
+        receiver_balance + amount,
+        amount / sender_balance if sender_balance > 0 else 0,
+        1 if payment_type == 'TRANSFER' else 0,
+        1 if payment_type == 'CASH_OUT' else 0,
+        1 if payment_type == 'PAYMENT' else 0,
+        1 if payment_type == 'DEBIT' else 0,
+        1 if payment_type == 'CASH_IN' else 0,
+        transactions_24h,
+        transactions_1h,
+        volume_24h,
+        drain_pct / 100,
+        1 if drain_pct > 90 else 0,
+        1 if drain_pct > 70 else 0,
+        1 if transactions_1h > 5 else 0,
+        1 if transactions_24h > 20 else 0,
+        abs(sender_balance - receiver_balance) / max(sender_balance, receiver_balance, 1),
+        1 if amount > 50000 else 0,
+        np.log1p(amount)
+    ]], dtype=float)
+
+
+def build_feature_matrix(amount, sender_balance, receiver_balance, payment_type,
+                         transactions_24h, transactions_1h, volume_24h) -> np.ndarray:
+    """Vectorized build_feature_vector over equal-length arrays, shape (n, 22)"""
+    amount = np.asarray(amount, dtype=float)
+    sender_balance = np.asarray(sender_balance, dtype=float)
+    receiver_balance = np.asarray(receiver_balance, dtype=float)
+    payment_type = np.asarray(payment_type)
+    transactions_24h = np.asarray(transactions_24h, dtype=float)
+    transactions_1h = np.asarray(transactions_1h, dtype=float)
+    volume_24h = np.asarray(volume_24h, dtype=float)
+
+    positive = sender_balance > 0
+    ratio = np.where(positive, amount / np.where(positive, sender_balance, 1), 0.0)
+    drain_pct = ratio * 100
+    disparity = np.abs(sender_balance - receiver_balance) / np.maximum(np.maximum(sender_balance, receiver_balance), 1)
+
+    columns = [
+        amount,
+        sender_balance,
+        sender_balance - amount,
+        receiver_balance,
+        receiver_balance + amount,
+        ratio,
+        *[(payment_type == t).astype(float) for t in PAYMENT_TYPES],
+        transactions_24h,
+        transactions_1h,
+        volume_24h,
+        drain_pct / 100,
+        (drain_pct > 90).astype(float),
+        (drain_pct > 70).astype(float),
+        (transactions_1h > 5).astype(float),
+        (transactions_24h > 20).astype(float),
+        disparity,
+        (amount > 50000).astype(float),
+        np.log1p(amount),
+    ]
+    return np.column_stack(columns)
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import time
+from collections import deque
+import httpx
+
+# Outbound payment-gateway client.
+#
+# One pooled httpx.AsyncClient per process (opened in the FastAPI lifespan, after
+# any pre-fork). Every authorization runs under a total deadline. If the first
+# attempt hasn't answered after GATEWAY_HEDGE_AFTER_MS a second, identical
+# attempt is sent and the first answer wins; failed attempts are retried while
+# the deadline allows. All attempts carry the same Idempotency-Key, so the
+# gateway settles at most one of them. A circuit breaker fails calls fast once
+# too many of the recent calls failed, and lets a single probe through after a
+# cooldown.
+#
+# An authorization is a hold on the customer's card. void() releases it for a
+# payment we end up not approving (blocked, sent to review, or failed); voids are
+# retried within the deadline but bypass hedging and the breaker.
+#
+# Without PAYMENT_GATEWAY_URL the client is disabled and payments keep the local
+# format checks only (development mode). stub_gateway.py is a local gateway with
+# configurable latency and errors for offline benchmarks (bench_gateway.py).
+
+PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL", "")
+GATEWAY_API_KEY = os.getenv("GATEWAY_API_KEY", "")
+GATEWAY_DEADLINE_MS = int(os.getenv("GATEWAY_DEADLINE_MS", "2000"))
+# Roughly the gateway's p95: slower first attempts get a hedge
+GATEWAY_HEDGE_AFTER_MS = int(os.getenv("GATEWAY_HEDGE_AFTER_MS", "300"))
+GATEWAY_MAX_ATTEMPTS = int(os.getenv("GATEWAY_MAX_ATTEMPTS", "3"))
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+GATEWAY_MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+GATEWAY_CONNECT_TIMEOUT_MS = int(os.getenv("GATEWAY_CONNECT_TIMEOUT_MS", "500"))
+# Open the breaker when at least this share of the last BREAKER_WINDOW calls failed
+BREAKER_FAILURE_RATE = float(os.getenv("GATEWAY_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("GATEWAY_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("GATEWAY_BREAKER_MIN_CALLS", "10"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("GATEWAY_BREAKER_COOLDOWN_S", "30"))
+
+AUTHORIZE_PATH = "/v1/authorize"
+VOID_PATH = "/v1/void"
+
+
+class GatewayError(Exception):
+    """A failed attempt (transport error, 5xx, 429, malformed reply); retried within the deadline"""
+
+
+class GatewayUnavailable(GatewayError):
+    """Breaker open or deadline exhausted: the payment can't be authorized right now"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_rate: float = BREAKER_FAILURE_RATE, window: int = BREAKER_WINDOW,
+                 min_calls: int = BREAKER_MIN_CALLS, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=window)    # True = failed
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.trips = 0
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise GatewayUnavailable("Payment gateway circuit open")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.probe_in_flight:
+                raise GatewayUnavailable("Payment gateway circuit half-open, probe in flight")
+            self.probe_in_flight = True
+
+    def record_success(self):
+        if self.state == self.HALF_OPEN:
+            self.state = self.CLOSED
+            self.outcomes.clear()
+        self.probe_in_flight = False
+        self.outcomes.append(False)
+
+    def record_failure(self):
+        self.probe_in_flight = False
+        self.outcomes.append(True)
+        failing = (len(self.outcomes) >= self.min_calls
+                   and sum(self.outcomes) / len(self.outcomes) >= self.failure_rate)
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and failing):
+            self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class GatewayClient:
+    def __init__(self, base_url: str = PAYMENT_GATEWAY_URL, deadline_ms: int = GATEWAY_DEADLINE_MS,
+                 hedge_after_ms: int = GATEWAY_HEDGE_AFTER_MS, max_attempts: int = GATEWAY_MAX_ATTEMPTS,
+                 breaker: CircuitBreaker = None):
+        self.base_url = base_url
+        self.deadline = deadline_ms / 1000
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms > 0 else None
+        self.max_attempts = max(1, max_attempts)
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {"calls": 0, "attempts": 0, "hedges": 0, "retries": 0, "failures": 0, "fast_fails": 0,
+                      "voids": 0, "void_failures": 0}
+        self._client = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.base_url)
+
+    async def start(self):
+        if not self.enabled or self._client is not None:
+            return
+        headers = {"Authorization": f"Bearer {GATEWAY_API_KEY}"} if GATEWAY_API_KEY else {}
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            limits=httpx.Limits(max_connections=GATEWAY_MAX_CONNECTIONS, max_keepalive_connections=GATEWAY_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(self.deadline, connect=GATEWAY_CONNECT_TIMEOUT_MS / 1000)
+        )
+        print(f"✅ Payment gateway client ready ({self.base_url})")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _attempt(self, payload: dict, idempotency_key: str, deadline: float, path: str = AUTHORIZE_PATH) -> dict:
+        remaining = deadline - asyncio.get_running_loop().time()
+        self.stats["attempts"] += 1
+        try:
+            response = await self._client.post(
+                path, json=payload,
+                headers={"Idempotency-Key": idempotency_key},
+                timeout=max(remaining, 0.001)
+            )
+        except httpx.TransportError as e:
+            raise GatewayError(f"Gateway transport error: {e.__class__.__name__}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GatewayError(f"Gateway returned {response.status_code}")
+        try:
+            body = response.json()
+        except ValueError:
+            raise GatewayError("Gateway returned an invalid response")
+        if response.status_code >= 400:
+            # A decline (or a request the gateway rejects) is an answer, not an outage
+            return {"approved": False, "reason": body.get("reason", "Payment declined by gateway")}
+        return body
+
+    async def authorize(self, payload: dict, idempotency_key: str, deadline_ms: int = None) -> dict:
+        """POST one authorization with hedging and retries; raises GatewayUnavailable"""
+        if self._client is None:
+            raise GatewayUnavailable("Payment gateway client not started")
+        try:
+            self.breaker.before_call()
+        except GatewayUnavailable:
+            self.stats["fast_fails"] += 1
+            raise
+
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (deadline_ms / 1000 if deadline_ms else self.deadline)
+        tasks = set()
+        attempts = 0
+        last_error = None
+
+        def launch():
+            nonlocal attempts
+            attempts += 1
+            task = asyncio.create_task(self._attempt(payload, idempotency_key, deadline))
+            # Attempts that lose the race may still fail later; nobody awaits those
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            tasks.add(task)
+
+        launch()
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if not tasks:
+                    if attempts >= self.max_attempts:
+                        break
+                    self.stats["retries"] += 1
+                    launch()
+                can_hedge = self.hedge_after is not None and attempts < self.max_attempts
+                done, _ = await asyncio.wait(
+                    tasks, timeout=min(remaining, self.hedge_after) if can_hedge else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if can_hedge and deadline - loop.time() > 0:
+                        self.stats["hedges"] += 1
+                        launch()
+                    continue
+                for task in done:
+                    tasks.discard(task)
+                    error = task.exception()
+                    if error is None:
+                        self.breaker.record_success()
+                        return task.result()
+                    last_error = error
+        except asyncio.CancelledError:
+            # Caller went away: don't leave a half-open breaker waiting on a probe forever
+            self.breaker.probe_in_flight = False
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.stats["failures"] += 1
+        self.breaker.record_failure()
+        reason = str(last_error) if last_error else "deadline exceeded"
+        raise GatewayUnavailable(f"Payment gateway unavailable: {reason}")
+
+    async def void(self, authorization_id: str, deadline_ms: int = None) -> dict:
+        """Release an authorization hold, retrying within the deadline; raises GatewayUnavailable"""
+        if self._client is None:
+            raise GatewayUnavailable("Payment gateway client not started")
+        self.stats["voids"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (deadline_ms / 1000 if deadline_ms else self.deadline)
+        last_error = None
+        for _ in range(self.max_attempts):
+            if deadline - loop.time() <= 0:
+                break
+            try:
+                # Same key on every attempt: the gateway voids at most once
+                return await self._attempt({"authorization_id": authorization_id}, f"void-{authorization_id}",
+                                           deadline, VOID_PATH)
+            except GatewayError as e:
+                last_error = e
+        self.stats["void_failures"] += 1
+        reason = str(last_error) if last_error else "deadline exceeded"
+        raise GatewayUnavailable(f"Payment gateway void failed: {reason}")
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            **self.stats
+        }
+
+
+gateway = GatewayClient()
+
+
+async def void_hold(authorization_id: str):
+    """Release the hold of a payment we didn't approve; a failure is logged (the hold expires at the gateway)"""
+    try:
+        await gateway.void(authorization_id)
+    except Exception as e:
+        print(f"⚠️ Could not void gateway authorization {authorization_id}: {e}")
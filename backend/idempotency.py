@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+
+# Idempotency-Key support for payment processing.
+#
+# The first request for a key claims it with an IN_PROGRESS document in the
+# TTL-indexed ``idempotency_keys`` collection, runs, and stores its response.
+# Retries are answered from a local LRU (no database round trip) or from the
+# stored document. Concurrent duplicates in this process await the first
+# execution's future; duplicates in other processes poll the claim document.
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_LRU_SIZE = int(os.getenv("IDEMPOTENCY_LRU_SIZE", "10000"))
+# How long another process may hold a claim before duplicates give up waiting
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+class IdempotencyConflict(Exception):
+    """Key reused with a different request, or still running elsewhere"""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_fingerprint(payload: dict) -> str:
+    """Stable hash of the request body so a key cannot be replayed for a different payment"""
+    canonical = repr(sorted(payload.items())).encode()
+    return hashlib.sha256(canonical).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, max_entries=IDEMPOTENCY_LRU_SIZE, ttl_hours=IDEMPOTENCY_TTL_HOURS,
+                 wait_seconds=IDEMPOTENCY_WAIT_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 3600
+        self.wait_seconds = wait_seconds
+        self._cache = OrderedDict()    # key -> (expires_monotonic, fingerprint, response)
+        self._inflight = {}            # key -> asyncio.Future
+        self.stats = {"executed": 0, "replayed_local": 0, "replayed_db": 0, "joined_inflight": 0}
+
+    # ===== LOCAL LRU =====
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key, fingerprint, response):
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _check_fingerprint(stored, fingerprint):
+        if stored != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+
+    # ===== MAIN ENTRY POINT =====
+    async def run(self, collection, key: str, fingerprint: str, execute):
+        """
+        Run ``execute()`` at most once per key. Returns (response, replayed).
+        Failures (exceptions) release the key so the client can retry.
+        """
+        cached = self._cache_get(key)
+        if cached:
+            self._check_fingerprint(cached[1], fingerprint)
+            self.stats["replayed_local"] += 1
+            return cached[2], True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["joined_inflight"] += 1
+            stored_fingerprint, response = await asyncio.shield(inflight)
+            self._check_fingerprint(stored_fingerprint, fingerprint)
+            return response, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response, replayed = await self._claim_and_execute(collection, key, fingerprint, execute)
+            future.set_result((fingerprint, response))
+            return response, replayed
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be awaiting the future; mark its exception as retrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _claim_and_execute(self, collection, key, fingerprint, execute):
+        now = datetime.utcnow()
+        try:
+            await collection.insert_one({
+                "_id": key,
+                "status": IN_PROGRESS,
+                "fingerprint": fingerprint,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds)
+            })
+        except DuplicateKeyError:
+            doc = await self._wait_for_completion(collection, key)
+            self._check_fingerprint(doc["fingerprint"], fingerprint)
+            self._cache_put(key, doc["fingerprint"], doc["response"])
+            self.stats["replayed_db"] += 1
+            return doc["response"], True
+
+        try:
+            response = await execute()
+        except BaseException:
+            await asyncio.shield(collection.delete_one({"_id": key, "status": IN_PROGRESS}))
+            raise
+
+        await collection.update_one(
+            {"_id": key},
+            {"$set": {"status": COMPLETED, "response": response, "completed_at": datetime.utcnow()}}
+        )
+        self._cache_put(key, fingerprint, response)
+        self.stats["executed"] += 1
+        return response, False
+
+    async def _wait_for_completion(self, collection, key):
+        deadline = time.monotonic() + self.wait_seconds
+        delay = 0.05
+        while True:
+            doc = await collection.find_one({"_id": key})
+            if doc is None:
+                raise IdempotencyConflict("Previous request with this Idempotency-Key failed, retry it")
+            if doc["status"] == COMPLETED:
+                return doc
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict("A request with this Idempotency-Key is still being processed")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+import numpy as np
+
+# Shared micro-batching front end for the full model.
+#
+# The HTTP score endpoint, payments and the WebSocket channel all score through
+# InferenceBatcher.score(). Cheap cascade stages (cascade.py) still answer
+# inline. Requests that need the full model are queued, and the queue is
+# flushed as one inplace_predict call: on the next event-loop iteration by
+# default, so every request that arrived in the same tick (many merchants, many
+# pipelined WebSocket messages) shares one call without waiting, or after
+# INFERENCE_BATCH_WINDOW_MS to trade a little latency for larger batches.
+# A full queue (INFERENCE_MAX_BATCH) flushes immediately.
+#
+# One row costs ~0.18 ms and 64 rows ~0.65 ms here, and calls that short can run
+# on the event loop itself.
+
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "0"))
+
+
+class InferenceBatcher:
+    def __init__(self, cascade, max_batch: int = INFERENCE_MAX_BATCH, window_ms: float = INFERENCE_BATCH_WINDOW_MS):
+        self.cascade = cascade
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._pending = []          # (scaled row, future)
+        self._timer = None
+        self.stats = {"batches": 0, "rows": 0, "max_batch": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self.cascade.ready
+
+    async def score(self, rule_score: float, is_critical: bool, build_features) -> dict:
+        """Same contract as CascadeScorer.score, with the full model batched across callers"""
+        started = time.perf_counter()
+        result, scaled = self.cascade.early_exit(rule_score, is_critical, build_features, started)
+        if result is not None:
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((scaled, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.window, self.flush) if self.window else loop.call_soon(self.flush)
+        return self.cascade.full_exit(await future, started)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            scores = self.cascade.booster.inplace_predict(np.vstack([row for row, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), score in zip(batch, scores):
+            # The caller may have gone away (cancelled) while queued
+            if not future.done():
+                future.set_result(float(score))
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "mean_batch": round(self.stats["rows"] / self.stats["batches"], 2) if self.stats["batches"] else 0.0,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch
+        }
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import random
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import AutoReconnect, OperationFailure, WriteConcernError
+
+# Atomic balance updates.
+#
+# A debit is a single find_one_and_update guarded by ``balance >= amount``: the
+# check and the decrement happen in one server-side operation, so any number of
+# workers can debit the same account concurrently without overdraft and without
+# external locks. Both primitives return the post-image so callers never need a
+# second read for the new balance.
+#
+# ``$inc`` is not idempotent, and the driver (retryWrites) already retries once,
+# so an error reaching us may come from a write the server applied. A write
+# without ``ref`` is therefore never retried here. With ``ref`` (e.g.
+# "TXN...:debit") the update is guarded by ``applied != ref`` and pushes ``ref``
+# onto the account's ``applied`` list in the same operation: retrying it is
+# safe, and applied() tells the settlement reconciler whether it happened. The
+# list keeps the last LEDGER_APPLIED_KEEP refs per account, far more than an
+# account moves in one reconciliation window.
+
+LEDGER_RETRIES = int(os.getenv("LEDGER_RETRIES", "5"))
+LEDGER_RETRY_BASE_MS = float(os.getenv("LEDGER_RETRY_BASE_MS", "5"))
+LEDGER_APPLIED_KEEP = int(os.getenv("LEDGER_APPLIED_KEEP", "1000"))
+
+APPLIED_FIELD = "applied"
+
+
+def ledger_ref(transaction_id: str, step: str) -> str:
+    return f"{transaction_id}:{step}"
+
+
+def tagged(query: dict, update: dict, ref: str):
+    """Guard a ledger update with ``ref`` so it applies at most once (also used for bulk writes)"""
+    return (
+        {**query, APPLIED_FIELD: {"$ne": ref}},
+        {**update, "$push": {APPLIED_FIELD: {"$each": [ref], "$slice": -LEDGER_APPLIED_KEEP}}}
+    )
+
+
+def _is_retryable(error) -> bool:
+    if isinstance(error, (AutoReconnect, WriteConcernError)):
+        return True
+    return isinstance(error, OperationFailure) and error.has_error_label("RetryableWriteError")
+
+
+async def _apply(accounts, query: dict, update: dict, ref: str = None, retries: int = LEDGER_RETRIES):
+    if ref is None:
+        return await accounts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+    query, update = tagged(query, update, ref)
+    for attempt in range(retries + 1):
+        try:
+            after = await accounts.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        except (AutoReconnect, OperationFailure) as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            # Full jitter so conflicting workers don't retry in lockstep
+            await asyncio.sleep(random.uniform(0, LEDGER_RETRY_BASE_MS * (2 ** attempt)) / 1000)
+            continue
+        if after is None:
+            # Refused by the guard, or already applied by an earlier attempt or caller
+            return await accounts.find_one({"_id": query["_id"], APPLIED_FIELD: ref})
+        return after
+
+
+async def applied(accounts, account_id, ref: str) -> bool:
+    """Whether the ledger write tagged ``ref`` was applied to the account"""
+    return await accounts.count_documents({"_id": account_id, APPLIED_FIELD: ref}, limit=1) > 0
+
+
+async def debit_account(accounts, account_id, amount: float, ref: str = None, retries: int = LEDGER_RETRIES):
+    """
+    Atomically debit ``amount`` if the balance covers it.
+    Returns the updated account, or None if funds were insufficient (or the account is gone).
+    """
+    return await _apply(accounts, {"_id": account_id, "balance": {"$gte": amount}}, {
+        "$inc": {"balance": -amount},
+        "$set": {"last_transaction": datetime.utcnow()}
+    }, ref, retries)
+
+
+async def credit_account(accounts, account_id, amount: float, ref: str = None, retries: int = LEDGER_RETRIES):
+    """Atomically credit ``amount``; returns the updated account or None if it doesn't exist"""
+    return await _apply(accounts, {"_id": account_id}, {
+        "$inc": {"balance": amount},
+        "$set": {"last_transaction": datetime.utcnow()}
+    }, ref, retries)
+
+
+async def transfer(accounts, sender_id, receiver_id, amount: float):
+    """
+    Debit the sender and, if that succeeded, credit the receiver (which may be
+    external, i.e. None). Returns (sender_after, receiver_after); sender_after is
+    None when the debit was refused.
+    """
+    sender_after = await debit_account(accounts, sender_id, amount)
+    if sender_after is None:
+        return None, None
+    receiver_after = None
+    if receiver_id is not None:
+        receiver_after = await credit_account(accounts, receiver_id, amount)
+    return sender_after, receiver_after
@@ -0,0 +1,108 @@
+import os
+import time
+from collections import OrderedDict
+from bson import ObjectId
+
+# Conditional GET for the per-user account and contact lists.
+#
+# Each user document carries ``list_versions`` = {accounts, contacts}, bumped
+# with ``$inc`` after every write that changes what a list returns: account or
+# contact creation and every balance change. The ETag is the user id plus that
+# version, so it can be checked without reading the list.
+#
+# A small per-process LRU keeps (user id, version, ETag, body) per (email, list):
+#   - in a declared single-process deployment, a fresh entry
+#     (LIST_CACHE_TTL_SECONDS) whose ETag matches If-None-Match answers 304
+#     without touching Mongo
+#   - otherwise one projected read of the user's version decides between 304,
+#     the cached body, or loading the list again
+# Writes in this process invalidate the entry at once. A write handled by another
+# worker only bumps the version in Mongo, so unless WORKER_COUNT is exactly 1
+# every request reads the version before answering 304. server.py sets it from
+# --workers; ``uvicorn --workers N`` does not, and stays on the safe path.
+
+LIST_CACHE_TTL_SECONDS = float(os.getenv("LIST_CACHE_TTL_SECONDS", "5"))
+LIST_CACHE_SIZE = int(os.getenv("LIST_CACHE_SIZE", "10000"))
+LOCAL_FAST_PATH = os.getenv("WORKER_COUNT") == "1"
+
+VERSIONS_FIELD = "list_versions"
+ACCOUNTS = "accounts"
+CONTACTS = "contacts"
+# Browsers keep the body but revalidate with If-None-Match every time
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(user_id: str, kind: str, version: int) -> str:
+    return f'"{kind}-{user_id}-{version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+async def bump(users, user_ids, *kinds):
+    """Advance the list versions of ``user_ids`` after a write (call it after the write)"""
+    user_ids = [uid for uid in dict.fromkeys(user_ids) if uid and ObjectId.is_valid(uid)]
+    if not user_ids:
+        return
+    await users.update_many(
+        {"_id": {"$in": [ObjectId(uid) for uid in user_ids]}},
+        {"$inc": {f"{VERSIONS_FIELD}.{kind}": 1 for kind in kinds}}
+    )
+    list_cache.invalidate(user_ids)
+
+
+class ListCache:
+    def __init__(self, max_entries: int = LIST_CACHE_SIZE, ttl_seconds: float = LIST_CACHE_TTL_SECONDS,
+                 local_fast_path: bool = LOCAL_FAST_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.local_fast_path = local_fast_path
+        self._entries = OrderedDict()    # (email, kind) -> [expires_monotonic, user_id, version, etag, body]
+        self._keys_by_user = {}          # user_id -> {(email, kind)}
+        self.stats = {"not_modified_local": 0, "not_modified_version": 0, "body_cached": 0, "loaded": 0}
+
+    def fresh(self, email: str, kind: str):
+        """The entry if it is still within its TTL (never, when other workers may have bumped it)"""
+        if not self.local_fast_path:
+            return None
+        entry = self._entries.get((email, kind))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._entries.move_to_end((email, kind))
+        return entry
+
+    def get(self, email: str, kind: str):
+        return self._entries.get((email, kind))
+
+    def put(self, email: str, kind: str, user_id: str, version: int, body: dict) -> list:
+        entry = [time.monotonic() + self.ttl_seconds, user_id, version, make_etag(user_id, kind, version), body]
+        self._entries[(email, kind)] = entry
+        self._entries.move_to_end((email, kind))
+        self._keys_by_user.setdefault(user_id, set()).add((email, kind))
+        while len(self._entries) > self.max_entries:
+            (old_email, old_kind), old = self._entries.popitem(last=False)
+            keys = self._keys_by_user.get(old[1])
+            if keys:
+                keys.discard((old_email, old_kind))
+                if not keys:
+                    del self._keys_by_user[old[1]]
+        return entry
+
+    def touch(self, entry: list):
+        entry[0] = time.monotonic() + self.ttl_seconds
+
+    def invalidate(self, user_ids):
+        for user_id in user_ids:
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "ttl_seconds": self.ttl_seconds,
+                "local_fast_path": self.local_fast_path}
+
+
+list_cache = ListCache()
@@ -0,0 +1,305 @@
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+# Versioned index migrations.
+#
+# Every query the service issues is registered in QUERY_SHAPES, and every index
+# exists because some shape needs it. Migrations are applied in version order and
+# recorded in the ``schema_migrations`` collection, so each one runs exactly once
+# per database. test_query_plans.py runs explain() for every registered shape
+# against a local mongod and fails on any COLLSCAN or in-memory SORT.
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# MongoDB error code for dropping an index that does not exist
+INDEX_NOT_FOUND = 27
+
+
+class Migration:
+    def __init__(self, version, description, create=(), drop=()):
+        self.version = version
+        self.description = description
+        # (collection, keys, options)
+        self.create = list(create)
+        # (collection, index name)
+        self.drop = list(drop)
+
+    async def apply(self, db):
+        for collection, keys, options in self.create:
+            await db[collection].create_index(keys, **options)
+        for collection, name in self.drop:
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+
+
+MIGRATIONS = [
+    Migration(1, "Baseline single-field indexes", create=[
+        ("transactions", [("transaction_id", 1)], {"unique": True}),
+        ("transactions", [("timestamp", -1)], {}),
+        ("transactions", [("user_id", 1)], {}),
+        ("transactions", [("decision", 1)], {}),
+        ("transactions", [("risk_level", 1)], {}),
+        ("alerts", [("timestamp", -1)], {}),
+        ("alerts", [("transaction_id", 1)], {}),
+        ("users", [("email", 1)], {"unique": True}),
+        ("users", [("firebase_uid", 1)], {"unique": True, "sparse": True}),
+        ("accounts", [("user_id", 1)], {}),
+        ("accounts", [("account_number", 1)], {"unique": True}),
+        ("accounts", [("is_primary", 1)], {}),
+        ("contacts", [("user_id", 1)], {}),
+        ("contacts", [("account_number", 1)], {}),
+        ("blacklist", [("account_number", 1)], {"unique": True}),
+    ]),
+    Migration(2, "Compound indexes matching the hot query shapes", create=[
+        # velocity counts/volume and per-user history
+        ("transactions", [("user_id", 1), ("timestamp", -1)], {"name": "user_id_1_timestamp_-1"}),
+        # dashboard counts and decision queues sorted by time
+        ("transactions", [("decision", 1), ("timestamp", -1)], {"name": "decision_1_timestamp_-1"}),
+        # sender primary account lookup and duplicate-account check
+        ("accounts", [("user_id", 1), ("is_primary", 1)], {"name": "user_id_1_is_primary_1"}),
+        ("accounts", [("user_id", 1), ("account_number", 1)], {"name": "user_id_1_account_number_1"}),
+    ], drop=[
+        # prefixes of the compound indexes above, or too unselective to use
+        ("transactions", "user_id_1"),
+        ("transactions", "decision_1"),
+        ("transactions", "risk_level_1"),
+        ("accounts", "user_id_1"),
+        ("accounts", "is_primary_1"),
+    ]),
+    Migration(3, "TTL index for idempotency keys", create=[
+        ("idempotency_keys", [("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ]),
+    Migration(4, "Sparse index on in-flight bulk review batches", create=[
+        ("transactions", [("review_batch", 1)], {"sparse": True}),
+    ]),
+    Migration(5, "Risk-ordered review queue index on alerts", create=[
+        ("alerts", [("decision", 1), ("risk_score", -1), ("timestamp", 1)], {"name": "review_queue"}),
+    ]),
+    Migration(6, "Sparse index on alerts awaiting an explanation", create=[
+        ("alerts", [("explain_pending", 1), ("timestamp", -1)], {"sparse": True}),
+    ]),
+    Migration(7, "Merchant rollup indexes", create=[
+        # per-merchant series reads
+        ("merchant_rollups", [("user_id", 1), ("granularity", 1), ("bucket", 1)], {"name": "merchant_series"}),
+        # compaction scans and retention deletes by level
+        ("merchant_rollups", [("granularity", 1), ("bucket", 1)], {"name": "rollup_level"}),
+    ]),
+    Migration(8, "Review outcome times for the analytics capture", create=[
+        ("transactions", [("approved_at", 1)], {"sparse": True}),
+        ("transactions", [("rejected_at", 1)], {"sparse": True}),
+    ]),
+    Migration(9, "Sparse index on payments awaiting settlement", create=[
+        ("transactions", [("settlement", 1), ("settlement_at", 1)], {"sparse": True, "name": "settlement_pending"}),
+    ]),
+    Migration(10, "User status for the dashboard's active-user count", create=[
+        ("users", [("status", 1)], {}),
+    ]),
+]
+
+
+async def applied_versions(db) -> set:
+    docs = await db[MIGRATIONS_COLLECTION].find({}, {"_id": 1}).to_list(length=None)
+    return {doc["_id"] for doc in docs}
+
+
+async def run_migrations(db, target=None) -> list:
+    """Apply pending migrations in order; returns the versions applied"""
+    done = await applied_versions(db)
+    applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if target is not None and migration.version > target:
+            break
+        if migration.version in done:
+            continue
+        print(f"⚙️ Applying migration {migration.version}: {migration.description}")
+        await migration.apply(db)
+        try:
+            await db[MIGRATIONS_COLLECTION].insert_one({
+                "_id": migration.version,
+                "description": migration.description,
+                "applied_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            # Another worker applied it concurrently; index builds are idempotent
+            continue
+        applied.append(migration.version)
+    if applied:
+        print(f"✅ Migrations applied: {applied}")
+    return applied
+
+
+# ===== QUERY SHAPES =====
+# Representative values only; the plan, not the result, is what matters.
+def _since(hours):
+    return datetime.utcnow() - timedelta(hours=hours)
+
+
+QUERY_SHAPES = [
+    # calculate_velocity_features
+    {"name": "velocity_count", "collection": "transactions", "kind": "count",
+     "filter": {"user_id": "u1", "timestamp": {"$gte": _since(24)}}},
+    {"name": "velocity_volume", "collection": "transactions", "kind": "aggregate",
+     "pipeline": [{"$match": {"user_id": "u1", "timestamp": {"$gte": _since(24)}}},
+                  {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]},
+    # get_user_transactions
+    {"name": "user_history", "collection": "transactions", "kind": "find",
+     "filter": {"user_id": "u1"}, "sort": [("timestamp", -1)], "limit": 20},
+    # get_all_transactions_v1
+    {"name": "global_history", "collection": "transactions", "kind": "find",
+     "filter": {}, "sort": [("timestamp", -1)], "limit": 20},
+    # dashboard counts and volume
+    {"name": "decision_count", "collection": "transactions", "kind": "count",
+     "filter": {"decision": "BLOCK"}},
+    {"name": "transactions_total", "collection": "transactions", "kind": "estimated_count"},
+    {"name": "accounts_total", "collection": "accounts", "kind": "estimated_count"},
+    {"name": "users_active_count", "collection": "users", "kind": "count",
+     "filter": {"status": {"$ne": "suspended"}}},
+    {"name": "approved_volume", "collection": "transactions", "kind": "aggregate",
+     "pipeline": [{"$match": {"decision": "APPROVE"}},
+                  {"$group": {"_id": None, "total": {"$sum": "$amount"}}}]},
+    {"name": "decision_by_time", "collection": "transactions", "kind": "find",
+     "filter": {"decision": "REVIEW"}, "sort": [("timestamp", -1)], "limit": 50},
+    # approve/reject lookup
+    {"name": "transaction_by_id", "collection": "transactions", "kind": "find",
+     "filter": {"transaction_id": "TXN000000000000"}},
+    # bulk review claims
+    {"name": "review_batch", "collection": "transactions", "kind": "find",
+     "filter": {"review_batch": "0" * 32}},
+    # settlement.reconcile_once
+    {"name": "settlement_pending", "collection": "transactions", "kind": "find",
+     "filter": {"settlement": "PENDING", "settlement_at": {"$lt": _since(0)}, "review_batch": {"$exists": False}},
+     "limit": 200},
+    # bulk_review.resume_batches
+    {"name": "review_batch_stale", "collection": "transactions", "kind": "find",
+     "filter": {"settlement": "PENDING", "settlement_at": {"$lt": _since(0)}, "review_batch": {"$exists": True}}},
+    # sender/receiver account resolution
+    {"name": "primary_account", "collection": "accounts", "kind": "find",
+     "filter": {"user_id": "u1", "is_primary": True}},
+    {"name": "user_accounts", "collection": "accounts", "kind": "find",
+     "filter": {"user_id": "u1"}},
+    {"name": "duplicate_account", "collection": "accounts", "kind": "find",
+     "filter": {"user_id": "u1", "account_number": "1234567890"}},
+    {"name": "account_by_number", "collection": "accounts", "kind": "find",
+     "filter": {"account_number": "1234567890"}},
+    # ledger.applied
+    {"name": "ledger_applied", "collection": "accounts", "kind": "count",
+     "filter": {"_id": ObjectId("000000000000000000000000"), "applied": "TXN000000000000:debit"}},
+    # users, contacts, blacklist
+    {"name": "user_by_email", "collection": "users", "kind": "find",
+     "filter": {"email": "customer@test.com"}},
+    {"name": "user_contacts", "collection": "contacts", "kind": "find",
+     "filter": {"user_id": "u1"}},
+    {"name": "blacklist_lookup", "collection": "blacklist", "kind": "find",
+     "filter": {"account_number": "1234567890"}},
+    # alerts
+    {"name": "recent_alerts", "collection": "alerts", "kind": "find",
+     "filter": {}, "sort": [("timestamp", -1)], "limit": 10},
+    {"name": "alert_by_transaction", "collection": "alerts", "kind": "find",
+     "filter": {"transaction_id": "TXN000000000000"}},
+    # archive.archive_collection batch scan
+    {"name": "archive_scan", "collection": "transactions", "kind": "find",
+     "filter": {"timestamp": {"$lt": _since(24 * 90)}, "decision": {"$ne": "REVIEW"}},
+     "sort": [("timestamp", 1)], "limit": 500},
+    # review_queue.claim / peek
+    {"name": "review_queue_claim", "collection": "alerts", "kind": "find",
+     "filter": {"decision": "REVIEW", "lease_until": {"$not": {"$gt": _since(0)}}},
+     "sort": [("risk_score", -1), ("timestamp", 1)], "limit": 1},
+    # explain.AlertExplainer.explain_pending
+    {"name": "explain_pending", "collection": "alerts", "kind": "find",
+     "filter": {"explain_pending": True}, "sort": [("timestamp", -1)], "limit": 200},
+    # rollups.series (one $or clause per level)
+    {"name": "merchant_series", "collection": "merchant_rollups", "kind": "find",
+     "filter": {"user_id": "u1", "$or": [
+         {"granularity": "day", "bucket": {"$gte": _since(24 * 90), "$lt": _since(24)}},
+         {"granularity": "hour", "bucket": {"$gte": _since(24), "$lt": _since(1)}},
+         {"granularity": "minute", "bucket": {"$gte": _since(1)}}]}},
+    # rollups.compact_level
+    {"name": "rollup_first_child", "collection": "merchant_rollups", "kind": "find",
+     "filter": {"granularity": "minute"}, "sort": [("bucket", 1)], "limit": 1},
+    {"name": "rollup_compact_scan", "collection": "merchant_rollups", "kind": "find",
+     "filter": {"granularity": "minute", "bucket": {"$gte": _since(48), "$lt": _since(24)}}},
+    # analytics_store.read_window
+    {"name": "capture_scored", "collection": "transactions", "kind": "find",
+     "filter": {"timestamp": {"$gt": _since(2), "$lte": _since(1)}}},
+    {"name": "capture_approved", "collection": "transactions", "kind": "find",
+     "filter": {"approved_at": {"$gt": _since(2), "$lte": _since(1)}}},
+    {"name": "capture_rejected", "collection": "transactions", "kind": "find",
+     "filter": {"rejected_at": {"$gt": _since(2), "$lte": _since(1)}}},
+    # payees.KnownPayees._load (distinct over the same filters)
+    {"name": "known_payees_contacts", "collection": "contacts", "kind": "find",
+     "filter": {"user_id": "u1"}},
+    {"name": "known_payees_approved", "collection": "transactions", "kind": "find",
+     "filter": {"user_id": "u1", "decision": "APPROVE"}},
+    {"name": "known_payees_archived", "collection": "archived_payees", "kind": "find",
+     "filter": {"_id": "u1"}},
+    # device.warm_up
+    {"name": "device_warmup", "collection": "transactions", "kind": "find",
+     "filter": {"timestamp": {"$gte": _since(24 * 30)}, "device_info.device_id": {"$exists": True}},
+     "sort": [("timestamp", 1)]},
+    # txn_codec.rewrite_collection
+    {"name": "codec_rewrite_scan", "collection": "transactions", "kind": "find",
+     "filter": {"_id": {"$gt": ObjectId("000000000000000000000000")}}, "sort": [("_id", 1)], "limit": 500},
+    # fanin.warm_up
+    {"name": "fanin_warmup", "collection": "transactions", "kind": "find",
+     "filter": {"timestamp": {"$gte": _since(24)}},
+     "sort": [("timestamp", 1)]},
+]
+
+
+def explain_command(shape: dict) -> dict:
+    """Build the explain command document for a registered query shape"""
+    if shape["kind"] == "count":
+        # count_documents runs this aggregate, not the count command
+        return {"aggregate": shape["collection"], "cursor": {}, "pipeline": [
+            {"$match": shape["filter"]}, {"$group": {"_id": 1, "n": {"$sum": 1}}}
+        ]}
+    if shape["kind"] == "estimated_count":
+        # estimated_document_count: the count command with no query reads collection metadata
+        return {"count": shape["collection"]}
+    if shape["kind"] == "aggregate":
+        return {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    command = {"find": shape["collection"], "filter": shape["filter"]}
+    if shape.get("sort"):
+        command["sort"] = dict(shape["sort"])
+    if shape.get("limit"):
+        command["limit"] = shape["limit"]
+    return command
+
+
+def plan_stages(explain: dict) -> list:
+    """Flatten every stage name in the winning plan(s) of an explain result"""
+    stages = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                stages.append(node["stage"])
+            for key in ("winningPlan", "queryPlan", "inputStage", "inputStages",
+                        "queryPlanner", "$cursor", "shards", "stages"):
+                if key in node:
+                    walk(node[key])
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain)
+    return stages
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from data_access import MONGODB_URI, DB_NAME
+
+    async def main():
+        client = AsyncIOMotorClient(MONGODB_URI)
+        try:
+            await run_migrations(client[DB_NAME])
+        finally:
+            client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import numpy as np
+import xgboost as xgb
+from sklearn.preprocessing import StandardScaler
+from features import MODEL_FEATURES
+
+# Versioned model bundles written by train.py.
+#
+#   <MODEL_BUNDLE_DIR>/LATEST                 name of the current version
+#   <MODEL_BUNDLE_DIR>/<version>/manifest.json   version, data hash, params, metrics, file hashes
+#   <MODEL_BUNDLE_DIR>/<version>/model.json      XGBoost native model (no pickle)
+#   <MODEL_BUNDLE_DIR>/<version>/scaler.json     StandardScaler mean/scale/var
+#   <MODEL_BUNDLE_DIR>/<version>/drift_reference.json   training profile for drift.py
+#
+# load_bundle() checks the files against the manifest's hashes and the feature
+# list against features.MODEL_FEATURES, and returns objects with the same
+# interface as the legacy pickles (an XGBClassifier and a StandardScaler).
+
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR", "")
+LATEST_FILE = "LATEST"
+MANIFEST_FILE = "manifest.json"
+MODEL_FILE = "model.json"
+SCALER_FILE = "scaler.json"
+DRIFT_REFERENCE_FILE = "drift_reference.json"
+
+
+class BundleError(ValueError):
+    """Raised when a model bundle is missing, incomplete or doesn't match the serving schema"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resolve(path: str) -> str:
+    """The version directory for ``path``: a bundle root (via LATEST) or a version directory"""
+    if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return path
+    try:
+        with open(os.path.join(path, LATEST_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        raise BundleError(f"{path} is neither a model bundle nor a bundle root with {LATEST_FILE}")
+    return os.path.join(path, version)
+
+
+def load_bundle(path: str = MODEL_BUNDLE_DIR) -> tuple:
+    """(model, scaler, manifest) for a bundle; ``manifest["path"]`` is the version directory"""
+    path = resolve(path)
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("features") != MODEL_FEATURES:
+        raise BundleError(f"bundle {manifest.get('version')} was trained on a different feature schema")
+    for name, expected in manifest.get("files", {}).items():
+        if file_sha256(os.path.join(path, name)) != expected:
+            raise BundleError(f"bundle {manifest['version']}: {name} does not match its manifest hash")
+
+    model = xgb.XGBClassifier()
+    model.load_model(os.path.join(path, MODEL_FILE))
+
+    with open(os.path.join(path, SCALER_FILE)) as f:
+        stats = json.load(f)
+    scaler = StandardScaler()
+    scaler.mean_ = np.asarray(stats["mean"], dtype=np.float64)
+    scaler.scale_ = np.asarray(stats["scale"], dtype=np.float64)
+    scaler.var_ = np.asarray(stats["var"], dtype=np.float64)
+    scaler.n_samples_seen_ = stats["n_samples_seen"]
+    scaler.n_features_in_ = len(MODEL_FEATURES)
+
+    manifest["path"] = path
+    return model, scaler, manifest
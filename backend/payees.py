@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+from pymongo import UpdateOne
+from data_access import dal
+from fanin import hash64
+
+# Per-user known-payee index.
+#
+# For every user we keep the 64-bit hashes of the receiver accounts they have
+# saved as contacts or paid in an APPROVE transaction, as a sorted uint64 array
+# (8 bytes per payee, membership by binary search). Users live in an LRU bounded
+# by KNOWN_PAYEES_MAX_USERS. The index is updated incrementally on approval and on
+# save_contact, so a warm lookup costs no database round trip. A cold user is
+# loaded once (contacts + distinct approved receivers) and the result is shared by
+# concurrent callers. Each worker process keeps its own index, so entries are
+# reloaded after KNOWN_PAYEES_TTL_SECONDS to pick up payees learnt elsewhere.
+#
+# Approved payments that the archiver moves out of the hot tier leave their
+# receivers behind in ``archived_payees`` (one document per user, see
+# record_archived), so a load is still three indexed reads however old the
+# history is.
+
+KNOWN_PAYEES_MAX_USERS = int(os.getenv("KNOWN_PAYEES_MAX_USERS", "100000"))
+# Payees beyond this many per user are not tracked
+KNOWN_PAYEES_MAX_PER_USER = int(os.getenv("KNOWN_PAYEES_MAX_PER_USER", "5000"))
+KNOWN_PAYEES_TTL_SECONDS = int(os.getenv("KNOWN_PAYEES_TTL_SECONDS", "900"))
+
+ARCHIVED_PAYEES_COLLECTION = "archived_payees"
+
+
+def payee_hash(account_number: str) -> int:
+    return hash64(account_number.replace(" ", "").strip())
+
+
+async def record_archived(transactions: list):
+    """Keep the receivers of approved payments that are leaving the hot tier"""
+    by_user = {}
+    for txn in transactions:
+        if txn.get("decision") == "APPROVE" and txn.get("receiver_account"):
+            by_user.setdefault(txn["user_id"], set()).add(txn["receiver_account"])
+    if by_user:
+        await dal.db[ARCHIVED_PAYEES_COLLECTION].bulk_write([
+            UpdateOne({"_id": user_id}, {"$addToSet": {"accounts": {"$each": sorted(accounts)}}}, upsert=True)
+            for user_id, accounts in by_user.items()
+        ], ordered=False)
+
+
+class KnownPayees:
+    def __init__(self, max_users: int = KNOWN_PAYEES_MAX_USERS, max_per_user: int = KNOWN_PAYEES_MAX_PER_USER,
+                 ttl: float = KNOWN_PAYEES_TTL_SECONDS):
+        self.max_users = max_users
+        self.max_per_user = max_per_user
+        self.ttl = ttl
+        self._users = OrderedDict()     # user_id -> sorted np.uint64 array
+        self._loaded_at = {}            # user_id -> time.monotonic() of the load
+        self._loading = {}              # user_id -> asyncio.Future
+        self._pending = {}              # user_id -> hashes added while loading
+
+    def __len__(self):
+        return len(self._users)
+
+    def _store(self, user_id: str, hashes: np.ndarray):
+        self._users[user_id] = hashes
+        self._users.move_to_end(user_id)
+        self._loaded_at[user_id] = time.monotonic()
+        if len(self._users) > self.max_users:
+            evicted, _ = self._users.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+
+    def _fresh(self, user_id: str) -> bool:
+        return user_id in self._users and time.monotonic() - self._loaded_at[user_id] < self.ttl
+
+    def is_known(self, user_id: str, account_number: str):
+        """True/False for a loaded user, None when the user isn't in memory"""
+        hashes = self._users.get(user_id)
+        if hashes is None:
+            return None
+        self._users.move_to_end(user_id)
+        h = np.uint64(payee_hash(account_number))
+        i = np.searchsorted(hashes, h)
+        return bool(i < len(hashes) and hashes[i] == h)
+
+    def add(self, user_id: str, account_number: str):
+        """Record a new known payee; users not in memory pick it up on their next load"""
+        h = np.uint64(payee_hash(account_number))
+        if user_id in self._loading:
+            self._pending.setdefault(user_id, set()).add(int(h))
+        hashes = self._users.get(user_id)
+        if hashes is None:
+            return
+        i = np.searchsorted(hashes, h)
+        if i < len(hashes) and hashes[i] == h:
+            return
+        if len(hashes) >= self.max_per_user:
+            return
+        self._users[user_id] = np.insert(hashes, i, h)
+
+    def invalidate(self, user_id: str = None):
+        if user_id is None:
+            self._users.clear()
+            self._loaded_at.clear()
+        else:
+            self._users.pop(user_id, None)
+            self._loaded_at.pop(user_id, None)
+
+    async def _load(self, user_id: str) -> np.ndarray:
+        contacts, receivers, archived = await asyncio.gather(
+            dal.contacts.distinct("account_number", {"user_id": user_id}),
+            dal.transactions.distinct("receiver_account", {"user_id": user_id, "decision": "APPROVE"}),
+            dal.db[ARCHIVED_PAYEES_COLLECTION].find_one({"_id": user_id}, {"accounts": 1})
+        )
+        receivers += (archived or {}).get("accounts", [])
+        accounts = [a for a in contacts + receivers if a][:self.max_per_user]
+        return np.unique(np.array([payee_hash(a) for a in accounts], dtype=np.uint64))
+
+    async def ensure_loaded(self, user_id: str):
+        """Load a user's payees unless a fresh copy is in memory (coalesces concurrent loads)"""
+        if self._fresh(user_id):
+            return
+        future = self._loading.get(user_id)
+        if future is not None:
+            await asyncio.shield(future)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            hashes = await self._load(user_id)
+            pending = self._pending.pop(user_id, None)
+            if pending:
+                hashes = np.union1d(hashes, np.array(list(pending), dtype=np.uint64))
+            self._store(user_id, hashes)
+            future.set_result(None)
+        except BaseException as e:
+            self._pending.pop(user_id, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            del self._loading[user_id]
+
+    async def prefetch(self, user_id: str):
+        """ensure_loaded for the payment path: a failed load only disables the signal"""
+        try:
+            await self.ensure_loaded(user_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Known-payee load failed for {user_id}: {e}")
+
+
+known_payees = KnownPayees()
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from data_access import dal
+
+# Risk-prioritized review queue over REVIEW alerts.
+#
+# Analysts claim the highest-risk unleased alerts under a time-limited lease.
+# Each claim is one find_one_and_update walking the (decision, risk_score desc,
+# timestamp) index, so two analysts can never receive the same alert and a claim
+# stays an index range scan however large the alerts collection grows. Expired
+# leases fall back into the queue automatically because the filter only excludes
+# leases that are still live. Approve and reject go through hold(): a decision
+# on an alert someone else has leased is refused.
+
+DEFAULT_LEASE_SECONDS = 300
+MAX_LEASE_SECONDS = 3600
+MAX_CLAIM = 100
+
+QUEUE_SORT = [("risk_score", -1), ("timestamp", 1)]
+
+QUEUE_PROJECTION = {
+    "_id": 0, "transaction_id": 1, "user_id": 1, "decision": 1, "risk_level": 1,
+    "risk_score": 1, "risk_factors": 1, "amount": 1, "timestamp": 1,
+    "lease_owner": 1, "lease_until": 1
+}
+
+
+def available_filter(now=None):
+    """REVIEW alerts with no live lease (never leased, released or expired)"""
+    now = now or datetime.utcnow()
+    return {"decision": "REVIEW", "lease_until": {"$not": {"$gt": now}}}
+
+
+async def claim(reviewer: str, limit: int = 10, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> list:
+    """Lease up to ``limit`` of the highest-risk available alerts to ``reviewer``"""
+    limit = max(1, min(limit, MAX_CLAIM))
+    lease_seconds = max(1, min(lease_seconds, MAX_LEASE_SECONDS))
+    claimed = []
+    for _ in range(limit):
+        now = datetime.utcnow()
+        alert = await dal.alerts.find_one_and_update(
+            available_filter(now),
+            {
+                "$set": {
+                    "lease_owner": reviewer,
+                    "leased_at": now,
+                    "lease_until": now + timedelta(seconds=lease_seconds)
+                },
+                "$inc": {"lease_count": 1}
+            },
+            sort=QUEUE_SORT,
+            projection=QUEUE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if alert is None:
+            break
+        claimed.append(alert)
+    return claimed
+
+
+async def renew(reviewer: str, transaction_ids: list, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> int:
+    """Extend the reviewer's live leases; returns how many were renewed"""
+    now = datetime.utcnow()
+    lease_seconds = max(1, min(lease_seconds, MAX_LEASE_SECONDS))
+    result = await dal.alerts.update_many(
+        {"transaction_id": {"$in": transaction_ids}, "lease_owner": reviewer, "lease_until": {"$gt": now}},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds)}}
+    )
+    return result.modified_count
+
+
+async def release(reviewer: str, transaction_ids: list) -> int:
+    """Hand leased alerts back to the queue; returns how many were released"""
+    result = await dal.alerts.update_many(
+        {"transaction_id": {"$in": transaction_ids}, "lease_owner": reviewer},
+        {"$unset": {"lease_owner": "", "leased_at": "", "lease_until": ""}}
+    )
+    return result.modified_count
+
+
+async def hold(reviewer: str, transaction_ids: list, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> list:
+    """
+    Lease the available ones of ``transaction_ids`` to ``reviewer`` before a decision.
+    Returns the ids under someone else's live lease; the caller must not decide those.
+    """
+    now = datetime.utcnow()
+    await dal.alerts.update_many(
+        {"transaction_id": {"$in": transaction_ids}, **available_filter(now)},
+        {
+            "$set": {"lease_owner": reviewer, "leased_at": now, "lease_until": now + timedelta(seconds=lease_seconds)},
+            "$inc": {"lease_count": 1}
+        }
+    )
+    held_by_others = await dal.alerts.find(
+        {"transaction_id": {"$in": transaction_ids}, "lease_until": {"$gt": now}, "lease_owner": {"$ne": reviewer}},
+        {"_id": 0, "transaction_id": 1}
+    ).to_list(length=None)
+    return [alert["transaction_id"] for alert in held_by_others]
+
+
+async def peek(limit: int = 20) -> list:
+    """Highest-risk available alerts, without leasing them"""
+    limit = max(1, min(limit, MAX_CLAIM))
+    cursor = dal.analytics.alerts.find(available_filter(), QUEUE_PROJECTION).sort(QUEUE_SORT).limit(limit)
+    return await cursor.to_list(length=limit)
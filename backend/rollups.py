@@ -0,0 +1,293 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from data_access import dal
+
+# Per-merchant time-bucketed analytics rollups.
+#
+# ``merchant_rollups`` holds one small document per (user_id, granularity, bucket):
+#
+#   {_id: "<user_id>|minute|202401011230", user_id, granularity, bucket,
+#    counts: {APPROVE, BLOCK, REVIEW},     decisions made when the payment was scored
+#    reviewed: {APPROVE, BLOCK},           manual review outcomes
+#    approved_volume}                      settled amount (automatic + manual approvals)
+#
+# Every event is one ``$inc`` upsert on the minute bucket of the time it happened,
+# so buckets only ever grow in the current minute. Recording is best effort: a
+# failed write is logged and dropped, never raised into a payment or review;
+# ``python rollups.py`` rebuilds the counts from transactions. A background job
+# folds closed minutes into hours and closed hours into days. Parents are
+# recomputed from all their children with ``$set`` and a watermark per level in
+# ``rollup_state`` is moved past them, so a crashed or repeated run changes
+# nothing. Children are deleted once they are older than their retention.
+#
+# series() reads the requested level up to its watermark and the finer levels
+# after it, so a 90-day chart is about 90 day documents plus the current day's
+# hours and minutes, all from the (user_id, granularity, bucket) index.
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_COMPACT_INTERVAL_SECONDS = int(os.getenv("ROLLUP_COMPACT_INTERVAL_SECONDS", "300"))
+# A bucket is only compacted once it closed this long ago (payments in flight)
+ROLLUP_GRACE_SECONDS = int(os.getenv("ROLLUP_GRACE_SECONDS", "300"))
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+ROLLUP_HOUR_RETENTION_DAYS = int(os.getenv("ROLLUP_HOUR_RETENTION_DAYS", "30"))
+ROLLUP_MAX_POINTS = 1500
+
+ROLLUPS_COLLECTION = "merchant_rollups"
+ROLLUP_STATE_COLLECTION = "rollup_state"
+
+LEVELS = ("minute", "hour", "day")
+STEP = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+RETENTION = {
+    "minute": timedelta(hours=ROLLUP_MINUTE_RETENTION_HOURS),
+    "hour": timedelta(days=ROLLUP_HOUR_RETENTION_DAYS),
+    "day": None
+}
+DECISIONS = ("APPROVE", "BLOCK", "REVIEW")
+REVIEW_OUTCOMES = ("APPROVE", "BLOCK")
+# Compaction reads at most this many parent periods per query
+COMPACT_PERIODS_PER_PASS = {"hour": 24, "day": 7}
+
+
+def truncate(ts: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_id(user_id: str, granularity: str, bucket: datetime) -> str:
+    return f"{user_id}|{granularity}|{bucket:%Y%m%d%H%M}"
+
+
+def event_inc(decision: str = None, reviewed: str = None, approved_amount: float = 0.0) -> dict:
+    """The ``$inc`` document for one event"""
+    inc = {}
+    if decision:
+        inc[f"counts.{decision}"] = 1
+    if reviewed:
+        inc[f"reviewed.{reviewed}"] = 1
+    if approved_amount:
+        inc["approved_volume"] = approved_amount
+    return inc
+
+
+def rollup_update(user_id: str, at: datetime, **event) -> UpdateOne:
+    """``$inc`` upsert of one event on its minute bucket, as a bulk_write operation"""
+    bucket = truncate(at, "minute")
+    return UpdateOne(
+        {"_id": bucket_id(user_id, "minute", bucket)},
+        {"$inc": event_inc(**event), "$setOnInsert": {"user_id": user_id, "granularity": "minute", "bucket": bucket}},
+        upsert=True
+    )
+
+
+async def record(user_id: str, at: datetime, **event):
+    """Count one decision, review outcome or settlement for ``user_id`` at ``at``; never raises"""
+    await record_many([rollup_update(user_id, at, **event)])
+
+
+async def record_many(ops: list):
+    # Callers have already moved money: a lost count is fixed by rebuild_rollups(), a raised error is not
+    if not ROLLUPS_ENABLED or not ops:
+        return
+    try:
+        await dal.db[ROLLUPS_COLLECTION].bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"⚠️ Rollup write failed ({len(ops)} events dropped): {e}")
+
+
+# ===== FOLDING =====
+def _empty() -> dict:
+    return {"counts": {d: 0 for d in DECISIONS}, "reviewed": {d: 0 for d in REVIEW_OUTCOMES},
+            "approved_volume": 0.0}
+
+
+def _fold(into: dict, doc: dict):
+    for decision, n in doc.get("counts", {}).items():
+        into["counts"][decision] = into["counts"].get(decision, 0) + n
+    for outcome, n in doc.get("reviewed", {}).items():
+        into["reviewed"][outcome] = into["reviewed"].get(outcome, 0) + n
+    into["approved_volume"] += doc.get("approved_volume", 0.0)
+
+
+# ===== COMPACTION =====
+async def _watermarks(handles=None) -> dict:
+    handles = handles or dal
+    docs = await handles.db[ROLLUP_STATE_COLLECTION].find({}).to_list(length=None)
+    return {doc["_id"]: doc["until"] for doc in docs}
+
+
+async def compact_level(parent: str, closed_before: datetime) -> tuple:
+    """Fold child buckets below ``closed_before`` into ``parent`` buckets; returns (parents written, new watermark)"""
+    child = LEVELS[LEVELS.index(parent) - 1]
+    rollups = dal.db[ROLLUPS_COLLECTION]
+    state = dal.db[ROLLUP_STATE_COLLECTION]
+    end = truncate(closed_before, parent)
+
+    start = (await _watermarks()).get(parent)
+    if start is None:
+        first = await rollups.find({"granularity": child}, {"bucket": 1}).sort("bucket", 1).limit(1).to_list(1)
+        if not first:
+            return 0, None
+        start = truncate(first[0]["bucket"], parent)
+
+    written = 0
+    while start < end:
+        stop = min(start + COMPACT_PERIODS_PER_PASS[parent] * STEP[parent], end)
+        parents = {}
+        cursor = rollups.find({"granularity": child, "bucket": {"$gte": start, "$lt": stop}})
+        async for doc in cursor:
+            key = (doc["user_id"], truncate(doc["bucket"], parent))
+            _fold(parents.setdefault(key, _empty()), doc)
+        if parents:
+            await rollups.bulk_write([
+                UpdateOne(
+                    {"_id": bucket_id(user_id, parent, bucket)},
+                    {"$set": {"user_id": user_id, "granularity": parent, "bucket": bucket, **totals}},
+                    upsert=True
+                )
+                for (user_id, bucket), totals in parents.items()
+            ], ordered=False)
+            written += len(parents)
+        # Only after the parents are written, so a crash just recomputes them
+        await state.update_one({"_id": parent}, {"$set": {"until": stop, "updated_at": datetime.utcnow()}},
+                               upsert=True)
+        start = stop
+    return written, start
+
+
+async def compact_once(now: datetime = None) -> dict:
+    now = now or datetime.utcnow()
+    closed_before = now - timedelta(seconds=ROLLUP_GRACE_SECONDS)
+    written = {}
+    for parent in LEVELS[1:]:
+        written[parent], until = await compact_level(parent, closed_before)
+        if until is None:
+            break
+        # Days are built from hours, so they can't get ahead of the hour watermark
+        closed_before = until
+
+    # Drop children that have been folded and aged out
+    watermarks = await _watermarks()
+    deleted = 0
+    for child, parent in zip(LEVELS, LEVELS[1:]):
+        if parent in watermarks:
+            cutoff = min(watermarks[parent], now - RETENTION[child])
+            result = await dal.db[ROLLUPS_COLLECTION].delete_many(
+                {"granularity": child, "bucket": {"$lt": cutoff}}
+            )
+            deleted += result.deleted_count
+    if any(written.values()) or deleted:
+        print(f"✅ Rollups compacted: {written} written, {deleted} expired")
+    return {"written": written, "deleted": deleted}
+
+
+async def run_compactor(interval: int = ROLLUP_COMPACT_INTERVAL_SECONDS):
+    """Background loop started from the FastAPI lifespan"""
+    while True:
+        try:
+            await compact_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Rollup compaction error: {e}")
+        await asyncio.sleep(interval)
+
+
+# ===== READS =====
+async def series(user_id: str, granularity: str = "day", points: int = 90, now: datetime = None,
+                 handles=None) -> list:
+    """The last ``points`` buckets for one merchant, oldest first and zero-filled"""
+    handles = handles or dal.analytics
+    now = now or datetime.utcnow()
+    step = STEP[granularity]
+    since = truncate(now, granularity) - (points - 1) * step
+    watermarks = await _watermarks(handles)
+
+    # Each level covers [lower, its watermark); finer levels fill the rest up to now
+    clauses = []
+    lower = since
+    for level in reversed(LEVELS[:LEVELS.index(granularity) + 1]):
+        upper = watermarks.get(level) if level != "minute" else None
+        if level != "minute" and (upper is None or upper <= lower):
+            continue
+        bucket_range = {"$gte": lower}
+        if upper is not None:
+            bucket_range["$lt"] = upper
+        clauses.append({"granularity": level, "bucket": bucket_range})
+        if upper is None:
+            break
+        lower = upper
+
+    totals = {}
+    if clauses:
+        cursor = handles[ROLLUPS_COLLECTION].find(
+            {"user_id": user_id, "$or": clauses}, {"_id": 0, "user_id": 0, "granularity": 0}
+        )
+        async for doc in cursor:
+            _fold(totals.setdefault(truncate(doc["bucket"], granularity), _empty()), doc)
+
+    return [
+        {"bucket": bucket.isoformat(), **totals.get(bucket, _empty())}
+        for bucket in (since + i * step for i in range(points))
+    ]
+
+
+# ===== BACKFILL =====
+async def rebuild_rollups(db) -> int:
+    """Recompute every merchant's minute buckets from the transactions in the hot tier, then compact"""
+    minutes = {}
+
+    def add(user_id, at, **event):
+        bucket = truncate(at, "minute")
+        doc = minutes.setdefault(bucket_id(user_id, "minute", bucket), {
+            "user_id": user_id, "granularity": "minute", "bucket": bucket, **_empty()
+        })
+        for key, n in event_inc(**event).items():
+            if key == "approved_volume":
+                doc["approved_volume"] += n
+            else:
+                group, name = key.split(".")
+                doc[group][name] += n
+
+    cursor = db.transactions.find({}, {
+        "_id": 0, "user_id": 1, "amount": 1, "decision": 1, "timestamp": 1, "approved_at": 1, "rejected_at": 1
+    })
+    async for txn in cursor:
+        user_id = txn.get("user_id")
+        if not user_id or txn.get("decision") not in DECISIONS:
+            continue
+        if txn.get("approved_at"):
+            add(user_id, txn["timestamp"], decision="REVIEW")
+            add(user_id, txn["approved_at"], reviewed="APPROVE", approved_amount=txn["amount"])
+        elif txn.get("rejected_at"):
+            add(user_id, txn["timestamp"], decision="REVIEW")
+            add(user_id, txn["rejected_at"], reviewed="BLOCK")
+        else:
+            approved = txn["decision"] == "APPROVE"
+            add(user_id, txn["timestamp"], decision=txn["decision"], approved_amount=txn["amount"] if approved else 0.0)
+
+    await db[ROLLUPS_COLLECTION].delete_many({})
+    await db[ROLLUP_STATE_COLLECTION].delete_many({})
+    docs = [{"_id": key, **doc} for key, doc in minutes.items()]
+    for i in range(0, len(docs), 1000):
+        await db[ROLLUPS_COLLECTION].insert_many(docs[i:i + 1000], ordered=False)
+    print(f"✅ Rebuilt {len(docs)} minute rollups")
+    return len(docs)
+
+
+if __name__ == "__main__":
+    from data_access import MONGODB_URI, DB_NAME
+
+    async def main():
+        await dal.connect(MONGODB_URI, DB_NAME)
+        try:
+            await rebuild_rollups(dal.db)
+            await compact_once()
+        finally:
+            dal.close()
+
+    asyncio.run(main())
@@ -0,0 +1,302 @@
+import json
+import operator
+import os
+import string
+import time
+import numpy as np
+
+# Declarative business rule engine.
+#
+# Rules live in a versioned JSON table (business_rules.json by default) instead of
+# hard-coded if-chains, so the score endpoint, the payment endpoint and offline
+# batch/backtest jobs all evaluate exactly the same rules. A rule is a list of
+# conditions ``[field, op, operand]`` combined with ``all``/``any``. The operand is
+# a literal or ``{"field": name}`` to compare two context fields. Rules sharing a
+# ``group`` are exclusive tiers: only the first matching rule of the group fires.
+#
+# The same compiled table evaluates a single transaction (dict of scalars) or a
+# batch (dict of NumPy arrays, one mask per rule).
+#
+# A fired rule is also reported as a factor ``[rule id, *params]``: the values of
+# the fields its message template uses, so stored transactions can keep the
+# factor instead of the rendered sentence and render it again on read.
+
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "business_rules.json"))
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "5"))
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# ===== HYBRID SCORING THRESHOLDS =====
+CONSERVATIVE_RULE_SCORE = 0.3   # rules flagged something -> max(rule, ml)
+ML_SUSPICIOUS_SCORE = 0.5       # rules safe but ML suspicious -> weighted
+RULE_WEIGHT = 0.6
+ML_WEIGHT = 0.4
+BLOCK_THRESHOLD = 0.7
+REVIEW_HIGH_THRESHOLD = 0.5
+REVIEW_THRESHOLD = 0.3
+
+
+class RuleError(ValueError):
+    """Raised when the rule table is malformed"""
+
+
+class Rule:
+    def __init__(self, spec: dict):
+        try:
+            self.id = spec["id"]
+            self.score = float(spec["score"])
+            self.message = spec.get("message", self.id)
+            self.fields = [name for _, name, _, _ in string.Formatter().parse(self.message) if name]
+            self.critical = bool(spec.get("critical", False))
+            self.group = spec.get("group")
+            self.match = spec.get("match", "all")
+            self.conditions = []
+            for field, op, operand in spec["conditions"]:
+                if op not in OPERATORS:
+                    raise RuleError(f"Rule {self.id}: unknown operator {op!r}")
+                ref = operand.get("field") if isinstance(operand, dict) else None
+                self.conditions.append((field, OPERATORS[op], operand, ref))
+        except (KeyError, TypeError, ValueError) as e:
+            if isinstance(e, RuleError):
+                raise
+            raise RuleError(f"Invalid rule spec {spec!r}: {e}")
+        if self.match not in ("all", "any"):
+            raise RuleError(f"Rule {self.id}: match must be 'all' or 'any'")
+
+    def test(self, ctx: dict) -> bool:
+        """Evaluate against a single transaction context"""
+        results = []
+        for field, op, operand, ref in self.conditions:
+            value = ctx.get(field)
+            other = ctx.get(ref) if ref else operand
+            results.append(value is not None and other is not None and bool(op(value, other)))
+        return all(results) if self.match == "all" else any(results)
+
+    def mask(self, columns: dict, size: int) -> np.ndarray:
+        """Evaluate against a batch of transactions (dict of equal-length arrays)"""
+        masks = []
+        for field, op, operand, ref in self.conditions:
+            if field not in columns or (ref and ref not in columns):
+                masks.append(np.zeros(size, dtype=bool))
+                continue
+            other = columns[ref] if ref else operand
+            masks.append(np.asarray(op(columns[field], other), dtype=bool))
+        reduce = np.logical_and if self.match == "all" else np.logical_or
+        return reduce.reduce(masks) if masks else np.zeros(size, dtype=bool)
+
+    def describe(self, ctx: dict) -> str:
+        try:
+            return self.message.format_map(ctx)
+        except (KeyError, ValueError, TypeError):
+            return self.message
+
+    def factor(self, ctx: dict) -> list:
+        """``[id, *params]``: the message fields' values, enough to render the message again"""
+        params = [ctx.get(name) for name in self.fields]
+        return [self.id, *(p.item() if isinstance(p, np.generic) else p for p in params)]
+
+    def render(self, params: list) -> str:
+        return self.describe(dict(zip(self.fields, params)))
+
+
+def derive_context(ctx: dict) -> dict:
+    """Add derived fields (drain_pct) the rules reference; works on scalars or arrays"""
+    ctx = dict(ctx)
+    if "drain_pct" not in ctx and "amount" in ctx and "sender_balance" in ctx:
+        amount, balance = ctx["amount"], ctx["sender_balance"]
+        if isinstance(amount, np.ndarray) or isinstance(balance, np.ndarray):
+            amount = np.asarray(amount, dtype=float)
+            balance = np.asarray(balance, dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ctx["drain_pct"] = np.where(balance > 0, amount / np.where(balance > 0, balance, 1) * 100, 0.0)
+        else:
+            ctx["drain_pct"] = (amount / balance) * 100 if balance > 0 else 0
+    return ctx
+
+
+class RuleEngine:
+    """Loads the rule table and evaluates it per transaction or per batch"""
+
+    def __init__(self, path: str = RULES_PATH, reload_interval: float = RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.version = None
+        self.rules = []
+        self._by_id = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def load_table(self, table: dict):
+        """Compile a rule table; the running table is only swapped if it is valid"""
+        rules = [Rule(spec) for spec in table.get("rules", [])]
+        ids = [r.id for r in rules]
+        if len(ids) != len(set(ids)):
+            raise RuleError("Duplicate rule ids in rule table")
+        self.rules = rules
+        self._by_id = dict(zip(ids, rules))
+        self.version = table.get("version")
+
+    def reload(self) -> bool:
+        """(Re)load the rule table from disk; keeps the previous table on error"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path) as f:
+                table = json.load(f)
+            self.load_table(table)
+            self._mtime = mtime
+            print(f"✅ Business rules v{self.version} loaded ({len(self.rules)} rules)")
+            return True
+        except Exception as e:
+            print(f"⚠️ Business rules not reloaded: {e}")
+            return False
+        finally:
+            self._checked_at = time.monotonic()
+
+    def maybe_reload(self):
+        """Hot-reload the table if the file changed (checked at most every reload_interval)"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def evaluate(self, ctx: dict) -> dict:
+        """Evaluate one transaction; returns rule score, criticality and contributing factors"""
+        self.maybe_reload()
+        ctx = derive_context(ctx)
+        rule_score = 0.0
+        is_critical = False
+        fired = []
+        risk_factors = []
+        factors = []
+        matched_groups = set()
+
+        for rule in self.rules:
+            if rule.group and rule.group in matched_groups:
+                continue
+            if not rule.test(ctx):
+                continue
+            if rule.group:
+                matched_groups.add(rule.group)
+            fired.append(rule.id)
+            risk_factors.append(rule.describe(ctx))
+            factors.append(rule.factor(ctx))
+            rule_score = max(rule_score, rule.score)
+            is_critical = is_critical or rule.critical
+
+        return {
+            "rule_score": rule_score,
+            "is_critical": is_critical,
+            "fired_rules": fired,
+            "risk_factors": risk_factors,
+            "factors": factors,
+            "rules_version": self.version,
+        }
+
+    def evaluate_batch(self, columns: dict) -> dict:
+        """Evaluate a batch given as a dict of equal-length arrays, one boolean mask per rule"""
+        self.maybe_reload()
+        columns = {k: np.asarray(v) for k, v in columns.items()}
+        size = len(next(iter(columns.values()))) if columns else 0
+        columns = derive_context(columns)
+
+        rule_score = np.zeros(size, dtype=float)
+        is_critical = np.zeros(size, dtype=bool)
+        masks = {}
+        group_taken = {}
+
+        for rule in self.rules:
+            mask = rule.mask(columns, size)
+            if rule.group:
+                taken = group_taken.setdefault(rule.group, np.zeros(size, dtype=bool))
+                mask = mask & ~taken
+                taken |= mask
+            masks[rule.id] = mask
+            rule_score = np.where(mask, np.maximum(rule_score, rule.score), rule_score)
+            if rule.critical:
+                is_critical |= mask
+
+        return {
+            "rule_score": rule_score,
+            "is_critical": is_critical,
+            "masks": masks,
+            "rules_version": self.version,
+        }
+
+    def factors_for_row(self, batch_result: dict, columns: dict, i: int) -> list:
+        """Contributing factor messages for row ``i`` of an evaluate_batch result"""
+        ctx = derive_context({k: np.asarray(v)[i].item() for k, v in columns.items()})
+        rules = {r.id: r for r in self.rules}
+        return [rules[rid].describe(ctx) for rid, mask in batch_result["masks"].items() if mask[i] and rid in rules]
+
+    def rule(self, rule_id: str):
+        return self._by_id.get(rule_id)
+
+    def describe_table(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "rules": [
+                {"id": r.id, "score": r.score, "critical": r.critical, "group": r.group, "match": r.match}
+                for r in self.rules
+            ],
+        }
+
+
+# ===== HYBRID DECISION =====
+def combine_scores(rule_score: float, ml_score: float) -> float:
+    """Hybrid scoring: trust business rules when they say it's safe, even if ML disagrees"""
+    if rule_score >= CONSERVATIVE_RULE_SCORE:
+        # Business rules detected real issues → use maximum (conservative)
+        return max(rule_score, ml_score)
+    if ml_score > ML_SUSPICIOUS_SCORE:
+        # Business rules say SAFE but ML suspicious → trust business rules more
+        return (rule_score * RULE_WEIGHT) + (ml_score * ML_WEIGHT)
+    # Both agree it's safe
+    return max(rule_score, ml_score)
+
+
+def decide(final_score: float, is_critical: bool = False) -> tuple:
+    """Map a final score to (decision, risk_level)"""
+    if is_critical or final_score > BLOCK_THRESHOLD:
+        return "BLOCK", "CRITICAL"
+    if final_score > REVIEW_HIGH_THRESHOLD:
+        return "REVIEW", "HIGH"
+    if final_score > REVIEW_THRESHOLD:
+        return "REVIEW", "MEDIUM"
+    return "APPROVE", "LOW"
+
+
+def combine_scores_batch(rule_score: np.ndarray, ml_score: np.ndarray) -> np.ndarray:
+    """Vectorized combine_scores"""
+    rule_score = np.asarray(rule_score, dtype=float)
+    ml_score = np.asarray(ml_score, dtype=float)
+    weighted = rule_score * RULE_WEIGHT + ml_score * ML_WEIGHT
+    conservative = rule_score >= CONSERVATIVE_RULE_SCORE
+    suspicious = ~conservative & (ml_score > ML_SUSPICIOUS_SCORE)
+    return np.where(suspicious, weighted, np.maximum(rule_score, ml_score))
+
+
+def decide_batch(final_score: np.ndarray, is_critical: np.ndarray = None) -> np.ndarray:
+    """Vectorized decide; returns an array of decision strings"""
+    final_score = np.asarray(final_score, dtype=float)
+    block = final_score > BLOCK_THRESHOLD
+    if is_critical is not None:
+        block = block | np.asarray(is_critical, dtype=bool)
+    return np.where(block, "BLOCK", np.where(final_score > REVIEW_THRESHOLD, "REVIEW", "APPROVE"))
+
+
+rule_engine = RuleEngine()
@@ -0,0 +1,209 @@
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+# Pre-fork production server.
+#
+# The master imports app.py once, which unpickles the XGBoost model and scaler,
+# loads the rule table and pulls in numpy/sklearn/xgboost. It then freezes the
+# GC, binds the listening socket and forks N uvicorn workers that share all of
+# that memory copy-on-write and accept on the same socket. Mongo clients and
+# background tasks are created per worker in the FastAPI lifespan, after the fork.
+#
+# Workers are recycled gracefully after --max-requests (plus jitter so they don't
+# all restart together) and respawned by the master; SIGHUP replaces them one at
+# a time, SIGTERM/SIGINT drains and stops everything.
+#
+# One worker by default. The fraud signals kept in memory (receiver fan-in,
+# device index, known payees) only see the payments their own worker handled,
+# so with N workers each one sees roughly 1/N of the traffic: fan-in and shared-
+# device counts read low and first-time-payee fires on payees paid through
+# another worker until KNOWN_PAYEES_TTL_SECONDS reloads them. Ledger, idempotency
+# and list versions live in Mongo and stay exact. Scale out only if that loss
+# is acceptable:
+#
+#   python server.py --port 8000 --workers 4
+
+# Single-row inference per request: one OpenMP thread per worker avoids
+# oversubscribing the cores. Must be set before xgboost is imported.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+WORKER_MIN_UPTIME = 2.0   # a worker dying sooner than this is crash-looping; back off
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PayShield pre-fork server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="more than one splits the in-memory fraud signals between workers")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("WORKER_MAX_REQUESTS", "10000")),
+                        help="recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-requests-jitter", type=int, default=int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000")))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds a stopping worker gets to finish in-flight requests")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--no-preload", action="store_true",
+                        help="import the app in each worker instead of the master (no memory sharing)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "warning"))
+    return parser.parse_args(argv)
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_app():
+    import app as app_module
+    return app_module.app
+
+
+class Master:
+    def __init__(self, args, sock):
+        self.args = args
+        self.sock = sock
+        self.app = None if args.no_preload else load_app()
+        self.workers = {}       # pid -> (slot, started_at)
+        self.retiring = set()   # pids asked to stop during a rolling restart
+        self.pending_restart = []
+        self.stopping = False
+
+    # ===== WORKER =====
+    def run_worker(self, slot: int):
+        import uvicorn
+
+        # The master's handlers must not leak into the worker; uvicorn installs its own
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        os.environ["WORKER_ID"] = str(slot)
+        random.seed()
+
+        limit = None
+        if self.args.max_requests > 0:
+            limit = self.args.max_requests + random.randint(0, max(self.args.max_requests_jitter, 0))
+        config = uvicorn.Config(
+            self.app or load_app(),
+            lifespan="on",
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            log_level=self.args.log_level,
+            access_log=False,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker(slot)
+            except BaseException as e:
+                print(f"❌ Worker {slot} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = (slot, time.monotonic())
+        print(f"✅ Worker {slot} started (pid {pid})")
+
+    # ===== SIGNALS =====
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_restart(self, signum, frame):
+        self.pending_restart = list(self.workers)
+
+    # ===== MAIN LOOP =====
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot, started_at = self.workers.pop(pid, (None, 0))
+            self.retiring.discard(pid)
+            if slot is None or self.stopping:
+                continue
+            if time.monotonic() - started_at < WORKER_MIN_UPTIME:
+                print(f"⚠️ Worker {slot} exited right after starting (status {status}); backing off")
+                time.sleep(1)
+            self.spawn(slot)
+
+    def roll(self):
+        """Stop the next worker of a rolling restart once the previous one has been replaced"""
+        if self.retiring or not self.pending_restart:
+            return
+        if len(self.workers) < self.args.workers:
+            return
+        pid = self.pending_restart.pop(0)
+        if pid in self.workers:
+            self.retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        print("🛑 Stopping workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            print(f"⚠️ Worker pid {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        while self.workers:
+            self.reap()
+            time.sleep(0.1)
+
+    def run(self):
+        # Everything imported so far is shared read-only with the workers; keep the
+        # collector from touching (and so copying) those pages in every child
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_restart)
+
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+        print(f"🚀 PayShield listening on http://{self.args.host}:{self.args.port} with {self.args.workers} workers")
+        if self.args.workers > 1:
+            print("⚠️ Fan-in, device and known-payee signals are per worker and see only part of the traffic")
+
+        while not self.stopping:
+            self.reap()
+            self.roll()
+            time.sleep(0.2)
+        self.shutdown()
+        self.sock.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Before the app is imported: per-process caches check it (see list_cache.py)
+    os.environ["WORKER_COUNT"] = str(args.workers)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))   # model files are loaded by relative path
+    sock = bind_socket(args.host, args.port, args.backlog)
+    Master(args, sock).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+import bulk_review
+from data_access import dal
+from gateway import void_hold
+from ledger import applied, credit_account, ledger_ref
+import list_cache
+from txn_codec import RISK_LEVEL_CODES
+
+# Settlement reconciliation.
+#
+# An approved payment is stored with ``settlement: "PENDING"`` (and
+# ``settlement_at``) before any money moves, and the marker is cleared once the
+# sender is debited and the receiver credited. Every ledger write is tagged with
+# the transaction id (ledger.py), so a record still PENDING after a crash or an
+# ambiguous write can be resolved from the accounts alone:
+#
+#   sender debit applied      finish it: credit the receiver (a no-op if that
+#                             was applied too), clear the marker, keep the hold
+#   sender debit not applied  nothing moved: a scored payment becomes BLOCK
+#                             ("Settlement failed") and its hold is voided; a
+#                             manual approval goes back to REVIEW with its hold
+#
+# Records younger than SETTLEMENT_GRACE_SECONDS may still be settling and are
+# left alone. Records of a bulk review batch (``review_batch``) are settled per
+# batch, so each pass also runs bulk_review.resume_batches(). The first worker
+# runs reconcile_once() at startup and every SETTLEMENT_INTERVAL_SECONDS;
+# ``python settlement.py`` runs one pass.
+
+SETTLEMENT_INTERVAL_SECONDS = int(os.getenv("SETTLEMENT_INTERVAL_SECONDS", "60"))
+SETTLEMENT_GRACE_SECONDS = int(os.getenv("SETTLEMENT_GRACE_SECONDS", "120"))
+SETTLEMENT_BATCH_SIZE = 200
+
+PENDING = "PENDING"
+COMPLETED = "completed"
+ROLLED_BACK = "rolled_back"
+
+PENDING_PROJECTION = {
+    "_id": 0, "transaction_id": 1, "user_id": 1, "sender_account": 1, "receiver_account": 1,
+    "amount": 1, "approved_by": 1, "review_risk_level": 1, "gateway_authorization_id": 1
+}
+MARKER_FIELDS = {"settlement": "", "settlement_at": "", "review_risk_level": ""}
+
+
+def pending_filter(now=None):
+    """PENDING single payments old enough that nobody is still settling them"""
+    now = now or datetime.utcnow()
+    return {
+        "settlement": PENDING,
+        "settlement_at": {"$lt": now - timedelta(seconds=SETTLEMENT_GRACE_SECONDS)},
+        "review_batch": {"$exists": False}
+    }
+
+
+async def _complete(txn: dict):
+    receiver = await dal.accounts.find_one({"account_number": txn["receiver_account"]}, {"_id": 1, "user_id": 1})
+    if receiver:
+        await credit_account(dal.accounts, receiver["_id"], txn["amount"],
+                             ref=ledger_ref(txn["transaction_id"], "credit"))
+    await dal.transactions.update_one(
+        {"transaction_id": txn["transaction_id"], "settlement": PENDING}, {"$unset": MARKER_FIELDS}
+    )
+    if txn.get("approved_by"):
+        await dal.alerts.delete_many({"transaction_id": txn["transaction_id"]})
+    await list_cache.bump(dal.users, [txn["user_id"], receiver and receiver.get("user_id")], list_cache.ACCOUNTS)
+
+
+async def _roll_back(txn: dict):
+    if txn.get("approved_by"):
+        await dal.transactions.update_one(
+            {"transaction_id": txn["transaction_id"], "settlement": PENDING},
+            {
+                "$set": {"decision": "REVIEW", "risk_level": txn.get("review_risk_level")},
+                "$unset": {"approved_by": "", "approved_at": "", "original_risk_score": "", "approval_note": "",
+                           **MARKER_FIELDS}
+            }
+        )
+        return
+    result = await dal.transactions.update_one(
+        {"transaction_id": txn["transaction_id"], "settlement": PENDING},
+        {
+            "$set": {"decision": "BLOCK", "risk_level": RISK_LEVEL_CODES["CRITICAL"], "risk_score": 1.0},
+            "$push": {"factors": ["settlement_failed"]},
+            "$unset": MARKER_FIELDS
+        }
+    )
+    if result.modified_count and txn.get("gateway_authorization_id"):
+        await void_hold(txn["gateway_authorization_id"])
+
+
+async def reconcile(txn: dict) -> str:
+    """Resolve one PENDING record from the ledger; returns COMPLETED or ROLLED_BACK"""
+    sender_id = ObjectId(txn["sender_account"])
+    if await applied(dal.accounts, sender_id, ledger_ref(txn["transaction_id"], "debit")):
+        await _complete(txn)
+        return COMPLETED
+    await _roll_back(txn)
+    return ROLLED_BACK
+
+
+async def reconcile_once() -> dict:
+    counts = {COMPLETED: 0, ROLLED_BACK: 0, "batches": 0, "errors": 0}
+    try:
+        counts["batches"], completed, reverted = await bulk_review.resume_batches()
+        counts[COMPLETED] += completed
+        counts[ROLLED_BACK] += reverted
+    except Exception as e:
+        counts["errors"] += 1
+        print(f"⚠️ Resuming bulk review batches failed: {e}")
+    pending = await dal.transactions.find(pending_filter(), PENDING_PROJECTION) \
+        .limit(SETTLEMENT_BATCH_SIZE).to_list(length=SETTLEMENT_BATCH_SIZE)
+    for txn in pending:
+        try:
+            counts[await reconcile(txn)] += 1
+        except Exception as e:
+            counts["errors"] += 1
+            print(f"⚠️ Reconciling {txn['transaction_id']} failed: {e}")
+    if pending or counts["batches"]:
+        print(f"✅ Settlement reconciled: {counts}")
+    return counts
+
+
+async def run_reconciler(interval: int = SETTLEMENT_INTERVAL_SECONDS):
+    """Background loop started from the FastAPI lifespan"""
+    while True:
+        try:
+            await reconcile_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Settlement reconciler error: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from data_access import MONGODB_URI, DB_NAME
+    from gateway import gateway
+
+    async def main():
+        await dal.connect(MONGODB_URI, DB_NAME)
+        await gateway.start()
+        try:
+            await reconcile_once()
+        finally:
+            await gateway.close()
+            dal.close()
+
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+import asyncio
+import math
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Online per-user spending profile for amount-anomaly scoring.
+#
+# Each user document carries ``spending_profile`` = {n, mean, m2, max, at}: the
+# running count, mean and sum of squared deviations (Welford) of approved amounts,
+# plus an exponentially decayed max (half-life PROFILE_MAX_HALF_LIFE_DAYS) as of
+# ``at``. Every approved payment folds in with one pipeline update on the user
+# document, so the update is O(1), atomic and never scans history. The payment
+# path already loads the user, so scoring against the profile is free.
+
+PROFILE_FIELD = "spending_profile"
+# Below this many approved payments the profile is too thin to score against
+PROFILE_MIN_HISTORY = int(os.getenv("PROFILE_MIN_HISTORY", "10"))
+PROFILE_MAX_HALF_LIFE_DAYS = float(os.getenv("PROFILE_MAX_HALF_LIFE_DAYS", "30"))
+# Floor for the standard deviation so customers who always send the same amount
+# don't get huge z-scores for small differences
+PROFILE_MIN_STD = 1.0
+PROFILE_MIN_STD_FRACTION = 0.05
+
+_HALF_LIFE_MS = PROFILE_MAX_HALF_LIFE_DAYS * 86400 * 1000
+
+
+def apply(profile: dict, amount: float, now: datetime = None) -> dict:
+    """Fold one approved amount into a profile (pure-Python mirror of update_pipeline)"""
+    now = now or datetime.utcnow()
+    profile = profile or {}
+    n = profile.get("n", 0)
+    mean = profile.get("mean", 0.0)
+    m2 = profile.get("m2", 0.0)
+    n1 = n + 1
+    delta = amount - mean
+    mean1 = mean + delta / n1
+    return {
+        "n": n1,
+        "mean": mean1,
+        "m2": m2 + delta * (amount - mean1),
+        "max": max(amount, decayed_max(profile, now)),
+        "at": now
+    }
+
+
+def decayed_max(profile: dict, now: datetime = None) -> float:
+    if not profile or not profile.get("max"):
+        return 0.0
+    now = now or datetime.utcnow()
+    elapsed_ms = max((now - profile["at"]).total_seconds() * 1000, 0.0)
+    return profile["max"] * 0.5 ** (elapsed_ms / _HALF_LIFE_MS)
+
+
+def update_pipeline(amount: float, now: datetime) -> list:
+    """Aggregation-pipeline update applying one Welford step to the user document"""
+    field = f"${PROFILE_FIELD}"
+    return [{"$set": {PROFILE_FIELD: {"$let": {
+        "vars": {
+            "n": {"$ifNull": [f"{field}.n", 0]},
+            "mean": {"$ifNull": [f"{field}.mean", 0.0]},
+            "m2": {"$ifNull": [f"{field}.m2", 0.0]},
+            "max": {"$ifNull": [f"{field}.max", 0.0]},
+            "at": {"$ifNull": [f"{field}.at", now]}
+        },
+        "in": {"$let": {
+            "vars": {
+                "n1": {"$add": ["$$n", 1]},
+                "delta": {"$subtract": [amount, "$$mean"]},
+                "decay": {"$pow": [0.5, {"$divide": [{"$max": [{"$subtract": [now, "$$at"]}, 0]}, _HALF_LIFE_MS]}]}
+            },
+            "in": {"$let": {
+                "vars": {"mean1": {"$add": ["$$mean", {"$divide": ["$$delta", "$$n1"]}]}},
+                "in": {
+                    "n": "$$n1",
+                    "mean": "$$mean1",
+                    "m2": {"$add": ["$$m2", {"$multiply": ["$$delta", {"$subtract": [amount, "$$mean1"]}]}]},
+                    "max": {"$max": [amount, {"$multiply": ["$$max", "$$decay"]}]},
+                    "at": now
+                }
+            }}
+        }}
+    }}}}]
+
+
+def profile_update(user_id: str, amount: float, now: datetime = None) -> UpdateOne:
+    """The profile update as a bulk_write operation"""
+    return UpdateOne({"_id": ObjectId(user_id)}, update_pipeline(amount, now or datetime.utcnow()))
+
+
+async def record_approved(users, user_id: str, amount: float, now: datetime = None):
+    await users.update_one({"_id": ObjectId(user_id)}, update_pipeline(amount, now or datetime.utcnow()))
+
+
+def profile_features(profile: dict, amount: float, now: datetime = None) -> dict:
+    """Rule-engine fields for ``amount`` against the user's profile (empty while the profile is thin)"""
+    n = (profile or {}).get("n", 0)
+    if n < PROFILE_MIN_HISTORY:
+        return {}
+    std = math.sqrt(profile["m2"] / (n - 1)) if n > 1 else 0.0
+    std = max(std, PROFILE_MIN_STD_FRACTION * abs(profile["mean"]), PROFILE_MIN_STD)
+    features = {
+        "profile_count": n,
+        "profile_mean": round(profile["mean"], 2),
+        "amount_zscore": round((amount - profile["mean"]) / std, 2)
+    }
+    recent_max = decayed_max(profile, now)
+    if recent_max > 0:
+        features["amount_to_recent_max"] = round(amount / recent_max, 2)
+    return features
+
+
+async def rebuild_profiles(db) -> int:
+    """Recompute every profile from the approved transactions in the hot tier"""
+    profiles = {}
+    cursor = db.transactions.find(
+        {"decision": "APPROVE"}, {"_id": 0, "user_id": 1, "amount": 1, "timestamp": 1}
+    ).sort("timestamp", 1)
+    async for txn in cursor:
+        if ObjectId.is_valid(txn.get("user_id", "")):
+            profiles[txn["user_id"]] = apply(profiles.get(txn["user_id"]), txn["amount"], txn["timestamp"])
+
+    ops = [UpdateOne({"_id": ObjectId(uid)}, {"$set": {PROFILE_FIELD: p}}) for uid, p in profiles.items()]
+    for i in range(0, len(ops), 1000):
+        await db.users.bulk_write(ops[i:i + 1000], ordered=False)
+    print(f"✅ Rebuilt spending profiles for {len(profiles)} users")
+    return len(profiles)
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from data_access import MONGODB_URI, DB_NAME
+
+    async def main():
+        client = AsyncIOMotorClient(MONGODB_URI)
+        try:
+            await rebuild_profiles(client[DB_NAME])
+        finally:
+            client.close()
+
+    asyncio.run(main())
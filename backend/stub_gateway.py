@@ -0,0 +1,130 @@
+"""
+Local stub payment gateway for offline benchmarks.
+
+Serves POST /v1/authorize with a configurable latency distribution (lognormal
+body plus a slow tail), error rate and decline rate, and POST /v1/void, which
+releases a hold it issued. Responses are remembered
+per Idempotency-Key, so hedged or retried attempts of one payment get the same
+answer, as with a real gateway.
+
+    python stub_gateway.py --port 9100 --latency-ms 40 --tail-prob 0.02 --tail-ms 1500 --error-rate 0.01
+    PAYMENT_GATEWAY_URL=http://127.0.0.1:9100 uvicorn app:app
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from collections import OrderedDict
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse
+
+
+class StubConfig:
+    latency_ms = 40.0       # median of the lognormal body
+    latency_sigma = 0.5
+    tail_prob = 0.0         # share of requests that take tail_ms instead
+    tail_ms = 1500.0
+    error_rate = 0.0        # share answered with 503
+    decline_rate = 0.0      # share declined with 402
+
+
+config = StubConfig()
+app = FastAPI(title="PayShield stub gateway")
+_answers = OrderedDict()    # Idempotency-Key -> (status, body)
+MAX_REMEMBERED = 100000
+_holds = OrderedDict()      # authorization_id -> amount, until voided
+stats = {"requests": 0, "duplicates": 0, "errors": 0, "declines": 0, "voids": 0, "open_holds": 0}
+
+
+def sample_latency() -> float:
+    if config.tail_prob and random.random() < config.tail_prob:
+        return config.tail_ms / 1000
+    return random.lognormvariate(0, config.latency_sigma) * config.latency_ms / 1000
+
+
+@app.post("/v1/authorize")
+async def authorize(payload: dict, idempotency_key: str = Header(None)):
+    stats["requests"] += 1
+    await asyncio.sleep(sample_latency())
+
+    if config.error_rate and random.random() < config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(status_code=503, content={"reason": "Gateway temporarily unavailable"})
+
+    if idempotency_key and idempotency_key in _answers:
+        stats["duplicates"] += 1
+        status, body = _answers[idempotency_key]
+        return JSONResponse(status_code=status, content=body)
+
+    if config.decline_rate and random.random() < config.decline_rate:
+        stats["declines"] += 1
+        status, body = 402, {"approved": False, "reason": "Card declined by issuer"}
+    else:
+        status, body = 200, {
+            "approved": True,
+            "reason": "Payment authorized by gateway",
+            "authorization_id": f"AUTH{uuid.uuid4().hex[:12].upper()}",
+            "amount": payload.get("amount")
+        }
+        _holds[body["authorization_id"]] = payload.get("amount")
+        if len(_holds) > MAX_REMEMBERED:
+            _holds.popitem(last=False)
+    if idempotency_key:
+        _answers[idempotency_key] = (status, body)
+        if len(_answers) > MAX_REMEMBERED:
+            _answers.popitem(last=False)
+    stats["open_holds"] = len(_holds)
+    return JSONResponse(status_code=status, content=body)
+
+
+@app.post("/v1/void")
+async def void(payload: dict):
+    stats["requests"] += 1
+    await asyncio.sleep(sample_latency())
+
+    if config.error_rate and random.random() < config.error_rate:
+        stats["errors"] += 1
+        return JSONResponse(status_code=503, content={"reason": "Gateway temporarily unavailable"})
+
+    # Voiding twice is fine: the second call finds nothing to release
+    if payload.get("authorization_id") in _holds:
+        del _holds[payload["authorization_id"]]
+        stats["voids"] += 1
+    stats["open_holds"] = len(_holds)
+    return {"voided": True, "authorization_id": payload.get("authorization_id")}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def configure(args):
+    config.latency_ms = args.latency_ms
+    config.latency_sigma = args.latency_sigma
+    config.tail_prob = args.tail_prob
+    config.tail_ms = args.tail_ms
+    config.error_rate = args.error_rate
+    config.decline_rate = args.decline_rate
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stub payment gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms)
+    parser.add_argument("--latency-sigma", type=float, default=StubConfig.latency_sigma)
+    parser.add_argument("--tail-prob", type=float, default=StubConfig.tail_prob)
+    parser.add_argument("--tail-ms", type=float, default=StubConfig.tail_ms)
+    parser.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    parser.add_argument("--decline-rate", type=float, default=StubConfig.decline_rate)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    args = parse_args()
+    configure(args)
+    print(f"🚀 Stub gateway on http://{args.host}:{args.port} "
+          f"(median {args.latency_ms}ms, tail {args.tail_prob:.1%} @ {args.tail_ms}ms, errors {args.error_rate:.1%})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
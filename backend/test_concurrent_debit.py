@@ -0,0 +1,106 @@
+import asyncio
+import os
+import random
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from ledger import debit_account, credit_account, transfer
+
+# Concurrency stress test for the conditional debit primitive.
+# Needs a local mongod; uses a throwaway database that is dropped afterwards.
+
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017/")
+TEST_DB_NAME = os.getenv("TEST_DB_NAME", "payshield_ledger_test")
+
+def _mongod_available():
+    """One quick ping, so the tests skip instead of timing out when no mongod is running"""
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+pytestmark = pytest.mark.skipif(not _mongod_available(), reason=f"no mongod at {MONGODB_TEST_URI}")
+
+def print_test_header(test_name):
+    print("\n" + "="*60)
+    print(f"TEST: {test_name}")
+    print("="*60)
+
+async def _with_accounts(balances, body):
+    client = AsyncIOMotorClient(MONGODB_TEST_URI, maxPoolSize=100)
+    await client.drop_database(TEST_DB_NAME)
+    accounts = client[TEST_DB_NAME].accounts
+    try:
+        result = await accounts.insert_many([{"balance": b} for b in balances])
+        return await body(accounts, result.inserted_ids)
+    finally:
+        await client.drop_database(TEST_DB_NAME)
+        client.close()
+
+# Test 1: many concurrent debits of one account never overdraw it
+def test_no_overdraft():
+    print_test_header("500 concurrent debits against one account")
+
+    async def body(accounts, ids):
+        results = await asyncio.gather(*[debit_account(accounts, ids[0], 7.0) for _ in range(500)])
+        succeeded = sum(1 for r in results if r is not None)
+        final = (await accounts.find_one({"_id": ids[0]}))["balance"]
+        print(f"Succeeded: {succeeded}, final balance: {final}")
+        assert succeeded == 142, f"expected 142 successful debits, got {succeeded}"
+        assert final == 1000.0 - 142 * 7.0
+        assert min(r["balance"] for r in results if r is not None) >= 0
+
+    asyncio.run(_with_accounts([1000.0], body))
+    print("✅ PASSED")
+
+# Test 2: random transfers between accounts conserve money and never go negative
+def test_concurrent_transfers_conserve_balance():
+    print_test_header("2000 concurrent random transfers between 10 accounts")
+
+    async def body(accounts, ids):
+        rng = random.Random(42)
+        ops = []
+        for _ in range(2000):
+            sender, receiver = rng.sample(ids, 2)
+            ops.append(transfer(accounts, sender, receiver, float(rng.randint(1, 300))))
+        await asyncio.gather(*ops)
+        balances = [doc["balance"] async for doc in accounts.find({})]
+        print(f"Final balances: {balances}")
+        assert sum(balances) == 10 * 1000.0
+        assert min(balances) >= 0
+
+    asyncio.run(_with_accounts([1000.0] * 10, body))
+    print("✅ PASSED")
+
+# Test 3: post-images reflect the update
+def test_returns_post_image():
+    print_test_header("Debit and credit return the updated document")
+
+    async def body(accounts, ids):
+        after = await debit_account(accounts, ids[0], 40.0)
+        assert after["balance"] == 60.0
+        after = await credit_account(accounts, ids[0], 15.0)
+        assert after["balance"] == 75.0
+        assert await debit_account(accounts, ids[0], 75.01) is None
+
+    asyncio.run(_with_accounts([100.0], body))
+    print("✅ PASSED")
+
+if __name__ == "__main__":
+    passed = failed = 0
+    for test in (test_returns_post_image, test_no_overdraft, test_concurrent_transfers_conserve_balance):
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAILED - {test.__name__}: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"❌ ERROR - {test.__name__}: {e}")
+            failed += 1
+    print(f"\n✅ Passed: {passed}  ❌ Failed: {failed}")
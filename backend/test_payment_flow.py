@@ -0,0 +1,120 @@
+import os
+import uuid
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# End-to-end smoke tests for the payment endpoints, in-process through FastAPI's
+# TestClient (lifespan included). Needs a local mongod; uses a throwaway database
+# that is dropped afterwards. No payment gateway: card checks stay local.
+
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017/")
+TEST_DB_NAME = os.getenv("TEST_DB_NAME", "payshield_flow_test")
+
+def _mongod_available():
+    """One quick ping, so the tests skip instead of timing out when no mongod is running"""
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+pytestmark = pytest.mark.skipif(not _mongod_available(), reason=f"no mongod at {MONGODB_TEST_URI}")
+
+# Read by data_access / gateway / app at import time
+os.environ["MONGODB_URI"] = MONGODB_TEST_URI
+os.environ["DB_NAME"] = TEST_DB_NAME
+os.environ["PAYMENT_GATEWAY_URL"] = ""
+os.environ["FANIN_WARMUP"] = "false"
+os.environ["DEVICE_WARMUP"] = "false"
+os.environ["EXPLAIN_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient
+from app import app
+
+SENDER = "sender@flow.test"
+RECEIVER_ACCOUNT = "4111111111111111"
+
+def print_test_header(test_name):
+    print("\n" + "="*60)
+    print(f"TEST: {test_name}")
+    print("="*60)
+
+def _reset():
+    client = MongoClient(MONGODB_TEST_URI)
+    client.drop_database(TEST_DB_NAME)
+    client.close()
+
+def _sender(client, email=SENDER, balance=10000.0):
+    response = client.post("/api/user/create", json={
+        "firebase_uid": uuid.uuid4().hex, "email": email, "role": "customer", "name": "Flow Test", "balance": balance
+    })
+    assert response.status_code == 200, response.text
+    response = client.post("/api/accounts/create", headers={"Authorization": email}, json={
+        "account_number": "5500000000000004", "bank_name": "Test Bank", "account_type": "credit",
+        "expiry_date": "12/99", "cardholder_name": "Flow Test", "is_primary": True
+    })
+    assert response.status_code == 200, response.text
+
+def _payment(amount=50.0):
+    return {"receiver_account": RECEIVER_ACCOUNT, "amount": amount, "payment_type": "PAYMENT", "cvv": "123"}
+
+# Test 1: a plain payment is scored, stored and answered
+def test_process_payment():
+    print_test_header("POST /api/v2/transactions/process")
+    _reset()
+    try:
+        with TestClient(app) as client:
+            _sender(client)
+            response = client.post("/api/v2/transactions/process", json=_payment(),
+                                   headers={"Authorization": SENDER, "User-Agent": "Mozilla/5.0 (X11; Linux x86_64)"})
+            assert response.status_code == 200, response.text
+            result = response.json()
+            assert result["decision"] in ("APPROVE", "REVIEW", "BLOCK")
+
+            history = client.get("/api/v2/transactions/history", headers={"Authorization": SENDER}).json()
+            stored = history["transactions"][0]
+            assert stored["transaction_id"] == result["transaction_id"]
+            assert stored["risk_level"] == result["risk_level"]
+    finally:
+        _reset()
+    print("✅ PASSED")
+
+# Test 2: a retry with the same Idempotency-Key replays the first answer
+def test_process_payment_idempotent():
+    print_test_header("POST /api/v2/transactions/process with Idempotency-Key")
+    _reset()
+    try:
+        with TestClient(app) as client:
+            _sender(client)
+            headers = {"Authorization": SENDER, "Idempotency-Key": uuid.uuid4().hex}
+            first = client.post("/api/v2/transactions/process", json=_payment(), headers=headers)
+            second = client.post("/api/v2/transactions/process", json=_payment(), headers=headers)
+            assert first.status_code == 200, first.text
+            assert second.status_code == 200, second.text
+            assert second.headers.get("Idempotent-Replayed") == "true"
+            assert second.json()["transaction_id"] == first.json()["transaction_id"]
+
+            balance = client.get("/api/accounts/list", headers={"Authorization": SENDER}).json()["accounts"][0]["balance"]
+            if first.json()["decision"] == "APPROVE":
+                assert balance == 10000.0 - 50.0
+    finally:
+        _reset()
+    print("✅ PASSED")
+
+if __name__ == "__main__":
+    passed = failed = 0
+    for test in (test_process_payment, test_process_payment_idempotent):
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAILED - {test.__name__}: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"❌ ERROR - {test.__name__}: {e}")
+            failed += 1
+    print(f"\n✅ Passed: {passed}  ❌ Failed: {failed}")
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from migrations import QUERY_SHAPES, explain_command, plan_stages, run_migrations
+
+# Explain-plan verification for every registered query shape.
+# Needs a local mongod; uses a throwaway database that is dropped afterwards.
+
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017/")
+TEST_DB_NAME = os.getenv("TEST_DB_NAME", "payshield_plan_test")
+
+def _mongod_available():
+    """One quick ping, so the tests skip instead of timing out when no mongod is running"""
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+pytestmark = pytest.mark.skipif(not _mongod_available(), reason=f"no mongod at {MONGODB_TEST_URI}")
+
+FORBIDDEN_STAGES = {"COLLSCAN", "SORT"}
+
+def print_test_header(test_name):
+    print("\n" + "="*60)
+    print(f"TEST: {test_name}")
+    print("="*60)
+
+async def _migrate():
+    client = AsyncIOMotorClient(MONGODB_TEST_URI)
+    try:
+        await run_migrations(client[TEST_DB_NAME])
+    finally:
+        client.close()
+
+def seed(db, n=2000):
+    """Enough documents that the planner has real choices to make"""
+    now = datetime.utcnow()
+    decisions = ["APPROVE", "REVIEW", "BLOCK"]
+    db.transactions.insert_many([
+        {
+            "transaction_id": f"TXN{i:012d}",
+            "user_id": f"u{i % 50}",
+            "amount": float(i % 997),
+            "decision": decisions[i % 3],
+            "risk_level": "LOW",
+            "timestamp": now - timedelta(minutes=i)
+        }
+        for i in range(n)
+    ])
+    db.accounts.insert_many([
+        {"user_id": f"u{i}", "account_number": f"{1000000000 + i}", "is_primary": i % 2 == 0, "balance": 1000.0}
+        for i in range(200)
+    ])
+    db.alerts.insert_many([
+        {"transaction_id": f"TXN{i:012d}", "decision": decisions[1 + i % 2], "risk_score": (i % 100) / 100,
+         "timestamp": now - timedelta(minutes=i)}
+        for i in range(n // 2)
+    ])
+
+def setup_database():
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=3000)
+    client.drop_database(TEST_DB_NAME)
+    asyncio.run(_migrate())
+    db = client[TEST_DB_NAME]
+    seed(db)
+    return client, db
+
+def check_shape(db, shape):
+    explain = db.command("explain", explain_command(shape), verbosity="queryPlanner")
+    stages = plan_stages(explain)
+    bad = FORBIDDEN_STAGES.intersection(stages)
+    print(f"  {shape['name']:<24} {' > '.join(stages)}")
+    assert stages, f"{shape['name']}: no plan stages found in explain output"
+    assert not bad, f"{shape['name']}: plan uses {sorted(bad)}"
+
+def test_query_plans():
+    print_test_header("Explain plans for registered query shapes")
+    client, db = setup_database()
+    try:
+        failures = []
+        for shape in QUERY_SHAPES:
+            try:
+                check_shape(db, shape)
+            except AssertionError as e:
+                failures.append(str(e))
+        assert not failures, "; ".join(failures)
+        print(f"✅ PASSED - {len(QUERY_SHAPES)} query shapes use indexes")
+    finally:
+        client.drop_database(TEST_DB_NAME)
+        client.close()
+
+def test_migrations_idempotent():
+    print_test_header("Migrations are recorded and not re-applied")
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=3000)
+    client.drop_database(TEST_DB_NAME)
+    try:
+        asyncio.run(_migrate())
+        versions = {d["_id"] for d in client[TEST_DB_NAME].schema_migrations.find()}
+        asyncio.run(_migrate())
+        assert versions == {d["_id"] for d in client[TEST_DB_NAME].schema_migrations.find()}
+        print(f"✅ PASSED - Applied versions: {sorted(versions)}")
+    finally:
+        client.drop_database(TEST_DB_NAME)
+        client.close()
+
+if __name__ == "__main__":
+    passed = failed = 0
+    for test in (test_migrations_idempotent, test_query_plans):
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAILED - {test.__name__}: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"❌ ERROR - {test.__name__}: {e}")
+            failed += 1
+    print(f"\n✅ Passed: {passed}  ❌ Failed: {failed}")
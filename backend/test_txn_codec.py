@@ -0,0 +1,158 @@
+import math
+from datetime import datetime
+from device import fingerprint
+from features import MODEL_FEATURES, build_feature_vector
+from rules import rule_engine
+from txn_codec import (
+    compact_factors, decode_transaction, encode_legacy, encode_transaction, render_factors
+)
+
+# Round trips through the compact transaction encoding (txn_codec.py). No database:
+# encode_transaction / encode_legacy produce what would be stored, decode_transaction
+# what readers get back. Features are stored as float32, so floats are compared
+# with a relative tolerance.
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+
+def print_test_header(test_name):
+    print("\n" + "="*60)
+    print(f"TEST: {test_name}")
+    print("="*60)
+
+def assert_close(actual, expected, name):
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), f"{name}: {actual!r} is not a dict"
+        assert set(actual) == set(expected), f"{name}: keys {sorted(actual)} != {sorted(expected)}"
+        for key in expected:
+            assert_close(actual[key], expected[key], f"{name}.{key}")
+    elif isinstance(expected, float) and not isinstance(expected, bool):
+        assert math.isclose(actual, expected, rel_tol=1e-6, abs_tol=1e-6), f"{name}: {actual!r} != {expected!r}"
+    else:
+        assert actual == expected, f"{name}: {actual!r} != {expected!r}"
+
+def _scored_transaction():
+    """A payment the way execute_transaction builds it: (document, stored features, rule factors)"""
+    amount, sender_balance, receiver_balance = 60000.0, 62000.0, 1500.0
+    velocity = {"transactions_24h": 25, "transactions_1h": 7, "volume_24h": 81234.5, "high_velocity": True}
+    fan_in = {
+        "receiver_distinct_senders_1h": 4, "receiver_distinct_senders_24h": 12,
+        "receiver_inbound_volume_24h": 15321.75, "receiver_inbound_count_24h": 14
+    }
+    device_signals = {"new_device_for_user": True, "device_transactions_24h": 3,
+                      "device_distinct_users": 2, "user_known_devices": 1}
+    rule_result = rule_engine.evaluate({
+        "amount": amount, "sender_balance": sender_balance, "receiver_balance": receiver_balance,
+        "payment_type": "TRANSFER", "transactions_1h": velocity["transactions_1h"],
+        "transactions_24h": velocity["transactions_24h"], "first_time_payee": True,
+        **device_signals, **fan_in
+    })
+    drain_pct = amount / sender_balance * 100
+    model_inputs = build_feature_vector(amount, sender_balance, receiver_balance, "TRANSFER",
+                                        velocity["transactions_24h"], velocity["transactions_1h"],
+                                        velocity["volume_24h"])
+    risk_factors = rule_result["risk_factors"] + ["ML model detected suspicious patterns",
+                                                  "Held for manual compliance check"]
+    doc = {
+        "transaction_id": "TXN0123456789AB",
+        "user_id": "u1",
+        "amount": amount,
+        "payment_type": "TRANSFER",
+        "decision": "REVIEW",
+        "risk_level": "HIGH",
+        "risk_score": 0.72,
+        "ml_score": 0.81,
+        "ml_stage": "full",
+        "risk_factors": risk_factors,
+        "fired_rules": rule_result["fired_rules"],
+        "velocity_features": velocity,
+        "device_info": {**fingerprint(USER_AGENT, client_device_id="widget-device-1"), **device_signals},
+        "ml_features": {
+            "amount": amount,
+            "sender_balance": sender_balance,
+            "drain_percentage": drain_pct,
+            "transactions_24h": velocity["transactions_24h"],
+            "transactions_1h": velocity["transactions_1h"],
+            **fan_in
+        },
+        "timestamp": datetime(2024, 1, 1, 12, 30)
+    }
+    stored_features = {**dict(zip(MODEL_FEATURES, model_inputs[0].tolist())), **fan_in, **device_signals}
+    return doc, stored_features, rule_result["factors"]
+
+# Test 1: a freshly scored payment decodes back to what was scored
+def test_round_trip():
+    print_test_header("encode_transaction → decode_transaction")
+    doc, stored_features, rule_factors = _scored_transaction()
+    assert len(doc["fired_rules"]) >= 3, doc["fired_rules"]
+
+    stored = encode_transaction(doc, stored_features, rule_factors)
+    assert isinstance(stored["risk_level"], int)
+    assert "risk_factors" not in stored and "velocity_features" not in stored
+
+    decoded = decode_transaction(dict(stored))
+    assert decoded["risk_level"] == doc["risk_level"]
+    assert decoded["ml_stage"] == doc["ml_stage"]
+    assert decoded["risk_factors"] == doc["risk_factors"]
+    assert decoded["fired_rules"] == doc["fired_rules"]
+    assert_close(decoded["velocity_features"], doc["velocity_features"], "velocity_features")
+    assert_close(decoded["ml_features"], doc["ml_features"], "ml_features")
+    assert_close(decoded["device_info"], doc["device_info"], "device_info")
+    assert "codec" not in decoded and "features" not in decoded
+    print("✅ PASSED")
+
+# Test 2: a verbose document written before the codec converts without losing anything readers see
+def test_legacy_round_trip():
+    print_test_header("encode_legacy → decode_transaction")
+    doc, _, _ = _scored_transaction()
+    # Before the cascade there was no ml_stage
+    legacy = {**doc, "ml_stage": None}
+
+    decoded = decode_transaction(encode_legacy(dict(legacy)))
+    assert decoded["risk_level"] == doc["risk_level"]
+    assert decoded["ml_stage"] == "full"
+    assert decoded["risk_factors"] == doc["risk_factors"]
+    assert decoded["fired_rules"] == doc["fired_rules"]
+    assert_close(decoded["velocity_features"], doc["velocity_features"], "velocity_features")
+    assert_close(decoded["ml_features"], doc["ml_features"], "ml_features")
+    assert_close(decoded["device_info"], doc["device_info"], "device_info")
+
+    # Admin outcomes and unknown values survive as well
+    for level in ("ADMIN_APPROVED", "ADMIN_REJECTED", "SOMETHING_NEW"):
+        assert decode_transaction(encode_legacy({**legacy, "risk_level": level}))["risk_level"] == level
+    print("✅ PASSED")
+
+# Test 3: sentences rendered with format specifiers parse back into their rule and params
+def test_format_specifier_messages():
+    print_test_header("Rule messages with format specifiers")
+    sentences = {
+        "insufficient_funds": "Insufficient funds: $1234.50 available, $99999.99 requested",
+        "critical_drain": "Critical account drain: 96.8% of balance",
+        "very_large_amount": "Very large transaction amount: $1,250,000.00",
+        "extreme_amount_for_user": "Amount far above this customer's usual: 7.3σ over a $1,024.10 average",
+        "above_recent_max": "Amount is 12.0x this customer's recent largest payment",
+        "high_velocity": "High transaction velocity: 7 txns in last hour, 25 in last 24h",
+    }
+    for rule_id, sentence in sentences.items():
+        assert rule_engine.rule(rule_id) is not None, f"{rule_id} missing from the rule table"
+        factors = compact_factors([sentence])
+        assert factors[0][0] == rule_id, f"{sentence!r} parsed as {factors[0]}"
+        assert render_factors(factors) == [sentence]
+
+    # Text no template produces is kept verbatim
+    assert compact_factors(["Critical account drain: lots"]) == [[None, "Critical account drain: lots"]]
+    print("✅ PASSED")
+
+if __name__ == "__main__":
+    passed = failed = 0
+    for test in (test_round_trip, test_legacy_round_trip, test_format_specifier_messages):
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ FAILED - {test.__name__}: {e}")
+            failed += 1
+        except Exception as e:
+            print(f"❌ ERROR - {test.__name__}: {e}")
+            failed += 1
+    print(f"\n✅ Passed: {passed}  ❌ Failed: {failed}")
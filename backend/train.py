@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import average_precision_score, roc_auc_score
+from sklearn.preprocessing import StandardScaler
+from drift import SCORE_EDGES, histogram_counts, reference_profile
+from features import MODEL_FEATURES, build_feature_matrix
+from model_bundle import (DRIFT_REFERENCE_FILE, LATEST_FILE, MANIFEST_FILE, MODEL_FILE, SCALER_FILE,
+                          file_sha256)
+
+# Out-of-core training pipeline for the serving model.
+#
+# Replaces the notebook (Copy_of_PayShield_ML.ipynb), which loaded the whole
+# PaySim CSV into pandas, engineered features the API never builds and pickled
+# the results by hand. Here:
+#
+#   1. prepare: the CSV is streamed in chunks of --chunk-rows. Each chunk is
+#      turned into exactly the serving schema with features.build_feature_matrix.
+#      Sender velocity (transactions and volume in the previous 24 steps, and in
+#      the current step) is carried across chunks, one PaySim step being one hour.
+#      Shards are written as float32 .npy files, split by step into train and
+#      validation. Scaler statistics come from StandardScaler.partial_fit.
+#   2. train: an xgboost.DataIter feeds the shards one at a time into an
+#      external-memory DMatrix (pages cached on disk under the work directory), so
+#      RAM is bounded by the chunk size rather than the dataset. Class imbalance is
+#      handled with scale_pos_weight instead of SMOTE.
+#   3. bundle: model (XGBoost JSON), scaler statistics, a drift reference profile
+#      and a manifest (data hash, parameters, metrics, file hashes) are written to
+#      <out>/<version>/ and LATEST is switched to it atomically. Set
+#      MODEL_BUNDLE_DIR=<out> to serve it (see model_bundle.py).
+#
+# The same CSV, parameters and seed give the same model.
+#
+#   python train.py data/PS_20174392719_1491204439457_log.csv --out models
+
+CHUNK_ROWS = 250_000
+# PaySim spans 743 hourly steps; the last ~20% are held out for validation
+VALID_FROM_STEP = 600
+VELOCITY_WINDOW_STEPS = 24
+
+# Same hyper-parameters as the notebook's XGBoost, with histogram trees (required
+# for external memory) and a fixed seed
+DEFAULT_PARAMS = {
+    "objective": "binary:logistic",
+    "eval_metric": ["logloss", "aucpr"],
+    "tree_method": "hist",
+    "max_depth": 8,
+    "learning_rate": 0.1,
+    "min_child_weight": 3,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "seed": 42,
+}
+NUM_BOOST_ROUND = 200
+
+CSV_COLUMNS = {
+    "step": np.int32,
+    "type": str,
+    "amount": np.float64,
+    "nameOrig": str,
+    "oldbalanceOrg": np.float64,
+    "oldbalanceDest": np.float64,
+    "isFraud": np.int8,
+}
+
+
+class SenderVelocity:
+    """Per-sender transaction count and volume over the previous 24 steps, across chunks"""
+
+    def __init__(self, window: int = VELOCITY_WINDOW_STEPS):
+        self.window = window
+        self.history = {}           # nameOrig -> deque of (step, amount)
+        self.expiry = deque()       # (step, nameOrig) in arrival order
+
+    def _expire(self, step: int):
+        horizon = step - self.window
+        while self.expiry and self.expiry[0][0] <= horizon:
+            _, name = self.expiry.popleft()
+            entries = self.history.get(name)
+            while entries and entries[0][0] <= horizon:
+                entries.popleft()
+            if not entries:
+                self.history.pop(name, None)
+
+    def update(self, steps: np.ndarray, names: np.ndarray, amounts: np.ndarray) -> tuple:
+        """(transactions_24h, transactions_1h, volume_24h) before each row, then fold the rows in"""
+        n = len(steps)
+        t24 = np.zeros(n, dtype=np.int32)
+        t1 = np.zeros(n, dtype=np.int32)
+        volume = np.zeros(n, dtype=np.float64)
+        for i in range(n):
+            step, name, amount = int(steps[i]), names[i], float(amounts[i])
+            self._expire(step)
+            entries = self.history.get(name)
+            if entries:
+                t24[i] = len(entries)
+                t1[i] = sum(1 for s, _ in entries if s == step)
+                volume[i] = sum(a for _, a in entries)
+            else:
+                entries = self.history[name] = deque()
+            entries.append((step, amount))
+            self.expiry.append((step, name))
+        return t24, t1, volume
+
+
+def prepare(csv_path: str, work_dir: str, chunk_rows: int = CHUNK_ROWS, valid_from_step: int = VALID_FROM_STEP) -> dict:
+    """Stream the CSV into float32 feature shards; returns shard lists, scaler and class counts"""
+    velocity = SenderVelocity()
+    scaler = StandardScaler()
+    shards = {"train": [], "valid": []}
+    counts = {"train": [0, 0], "valid": [0, 0]}     # [negatives, positives]
+    last_step = -1
+    for n, chunk in enumerate(pd.read_csv(csv_path, usecols=list(CSV_COLUMNS), dtype=CSV_COLUMNS,
+                                          chunksize=chunk_rows)):
+        steps = chunk["step"].to_numpy()
+        if steps[0] < last_step or np.any(np.diff(steps) < 0):
+            raise ValueError("CSV rows must be ordered by step")
+        last_step = steps[-1]
+        t24, t1, volume = velocity.update(steps, chunk["nameOrig"].to_numpy(), chunk["amount"].to_numpy())
+        X = build_feature_matrix(chunk["amount"].to_numpy(), chunk["oldbalanceOrg"].to_numpy(),
+                                 chunk["oldbalanceDest"].to_numpy(), chunk["type"].to_numpy(), t24, t1, volume)
+        y = chunk["isFraud"].to_numpy().astype(np.float32)
+        for split, mask in (("train", steps < valid_from_step), ("valid", steps >= valid_from_step)):
+            if not mask.any():
+                continue
+            stem = os.path.join(work_dir, f"{split}_{n:05d}")
+            np.save(f"{stem}_X.npy", X[mask].astype(np.float32))
+            np.save(f"{stem}_y.npy", y[mask])
+            shards[split].append(stem)
+            counts[split][0] += int((y[mask] == 0).sum())
+            counts[split][1] += int((y[mask] == 1).sum())
+            if split == "train":
+                scaler.partial_fit(X[mask])
+        print(f"⚙️ Prepared chunk {n}: {len(chunk):,} rows (step {steps[0]}-{steps[-1]})")
+    if not shards["train"] or not counts["train"][1]:
+        raise ValueError("no training rows, or no fraud in the training split")
+    return {"shards": shards, "scaler": scaler, "counts": counts}
+
+
+class ShardIter(xgb.DataIter):
+    """Feeds prepared shards, standardized, one at a time"""
+
+    def __init__(self, shards: list, mean: np.ndarray, scale: np.ndarray, cache_prefix: str):
+        self.shards = shards
+        self.mean = mean
+        self.scale = scale
+        self._it = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def load(self, stem: str) -> tuple:
+        X = (np.load(f"{stem}_X.npy").astype(np.float64) - self.mean) / self.scale
+        return X.astype(np.float32), np.load(f"{stem}_y.npy")
+
+    def next(self, input_data) -> bool:
+        if self._it == len(self.shards):
+            return False
+        X, y = self.load(self.shards[self._it])
+        input_data(data=X, label=y)
+        self._it += 1
+        return True
+
+    def reset(self):
+        self._it = 0
+
+
+def train(csv_path: str, out_dir: str, work_dir: str = None, chunk_rows: int = CHUNK_ROWS,
+          valid_from_step: int = VALID_FROM_STEP, num_boost_round: int = NUM_BOOST_ROUND,
+          params: dict = None) -> str:
+    """Run the whole pipeline; returns the new bundle's version directory"""
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    started = time.monotonic()
+    scratch = work_dir or tempfile.mkdtemp(prefix="payshield-train-")
+    os.makedirs(scratch, exist_ok=True)
+    try:
+        data_hash = file_sha256(csv_path)
+        prepared = prepare(csv_path, scratch, chunk_rows, valid_from_step)
+        scaler = prepared["scaler"]
+        negatives, positives = prepared["counts"]["train"]
+        params["scale_pos_weight"] = negatives / positives
+        print(f"✅ Prepared {negatives + positives:,} training rows ({positives:,} fraud), "
+              f"scale_pos_weight={params['scale_pos_weight']:.1f}")
+
+        train_iter = ShardIter(prepared["shards"]["train"], scaler.mean_, scaler.scale_,
+                               os.path.join(scratch, "cache_train"))
+        dtrain = xgb.DMatrix(train_iter)
+        evals = [(dtrain, "train")]
+        valid_iter = None
+        if prepared["shards"]["valid"]:
+            valid_iter = ShardIter(prepared["shards"]["valid"], scaler.mean_, scaler.scale_,
+                                   os.path.join(scratch, "cache_valid"))
+            evals.append((xgb.DMatrix(valid_iter), "valid"))
+        booster = xgb.train(params, dtrain, num_boost_round=num_boost_round, evals=evals, verbose_eval=25)
+        # Free the DMatrix pages before the scratch directory goes
+        del dtrain, evals
+
+        # Feature profile over the training split; score profile and metrics over validation
+        feature_counts = sum(histogram_counts(train_iter.load(stem)[0]) for stem in prepared["shards"]["train"])
+        metrics, score_counts = {}, None
+        if valid_iter is not None:
+            labels, scores = [], []
+            for stem in prepared["shards"]["valid"]:
+                X, y = valid_iter.load(stem)
+                scores.append(booster.inplace_predict(X))
+                labels.append(y)
+            labels, scores = np.concatenate(labels), np.concatenate(scores)
+            score_counts = histogram_counts(scores.reshape(-1, 1), SCORE_EDGES)[0]
+            if 0 < labels.sum() < len(labels):
+                metrics = {"valid_roc_auc": float(roc_auc_score(labels, scores)),
+                           "valid_pr_auc": float(average_precision_score(labels, scores)),
+                           "valid_rows": int(len(labels)), "valid_fraud": int(labels.sum())}
+                print(f"✅ Validation ROC-AUC {metrics['valid_roc_auc']:.4f}, PR-AUC {metrics['valid_pr_auc']:.4f}")
+
+        return write_bundle(out_dir, booster, scaler, reference_profile(feature_counts, score_counts), {
+            "data": {"path": os.path.basename(csv_path), "sha256": data_hash,
+                     "train_rows": negatives + positives, "train_fraud": positives,
+                     "valid_from_step": valid_from_step, "chunk_rows": chunk_rows},
+            "params": params,
+            "num_boost_round": num_boost_round,
+            "metrics": metrics,
+            "training_seconds": round(time.monotonic() - started, 1)
+        })
+    finally:
+        if work_dir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def write_bundle(out_dir: str, booster, scaler, drift_reference: dict, details: dict) -> str:
+    """Write a new version directory, then point LATEST at it"""
+    fingerprint = hashlib.sha256(json.dumps(
+        {"data": details["data"]["sha256"], "params": details["params"], "rounds": details["num_boost_round"]},
+        sort_keys=True).encode()).hexdigest()[:8]
+    created = datetime.now(timezone.utc)
+    version = f"{created:%Y%m%d-%H%M%S}-{fingerprint}"
+    os.makedirs(out_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{version}-", dir=out_dir)
+
+    booster.save_model(os.path.join(staging, MODEL_FILE))
+    with open(os.path.join(staging, SCALER_FILE), "w") as f:
+        json.dump({"mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist(), "var": scaler.var_.tolist(),
+                   "n_samples_seen": int(scaler.n_samples_seen_)}, f)
+    with open(os.path.join(staging, DRIFT_REFERENCE_FILE), "w") as f:
+        json.dump(drift_reference, f)
+    manifest = {
+        "version": version,
+        "created_at": created.isoformat(),
+        "features": MODEL_FEATURES,
+        **details,
+        "libraries": {"xgboost": xgb.__version__, "numpy": np.__version__, "python": platform.python_version()},
+        "files": {name: file_sha256(os.path.join(staging, name))
+                  for name in (MODEL_FILE, SCALER_FILE, DRIFT_REFERENCE_FILE)}
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    path = os.path.join(out_dir, version)
+    os.rename(staging, path)
+    latest_tmp = os.path.join(out_dir, f".{LATEST_FILE}.tmp")
+    with open(latest_tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(latest_tmp, os.path.join(out_dir, LATEST_FILE))
+    print(f"✅ Model bundle {version} written to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the serving model from a PaySim CSV")
+    parser.add_argument("csv", help="PaySim CSV (ordered by step)")
+    parser.add_argument("--out", default="models", help="bundle root; served with MODEL_BUNDLE_DIR=<out>")
+    parser.add_argument("--work-dir", default=None, help="scratch directory for shards and DMatrix pages")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--valid-from-step", type=int, default=VALID_FROM_STEP)
+    parser.add_argument("--rounds", type=int, default=NUM_BOOST_ROUND)
+    args = parser.parse_args()
+    train(args.csv, args.out, args.work_dir, args.chunk_rows, args.valid_from_step, args.rounds)
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import math
+import os
+import re
+import string
+import time
+from functools import lru_cache
+import numpy as np
+from bson import Binary, encode as bson_encode
+from pymongo import UpdateOne
+from data_access import dal
+from device import DEVICE_SIGNALS
+from features import MODEL_FEATURES, EXTENDED_FEATURES
+from rules import rule_engine
+
+# Compact storage form of transaction documents.
+#
+# A transaction used to carry its risk factors as rendered English sentences, the
+# fired rule ids again, velocity and ML feature dicts, device signals inside
+# device_info and string enums. Stored with ``codec: 1`` it keeps instead:
+#
+#   risk_level, ml_stage   small integer codes (RISK_LEVELS, ML_STAGES; append only)
+#   factors                [[rule id, *message params], ["ml_suspicious"], [None, "free text"]]
+#                          rendered again with the rule table's message templates on read
+#   features               float32 little-endian vector in STORED_FEATURES order: the
+#                          model's 22 inputs, receiver fan-in and device signals. NaN
+#                          means "not recorded" (older documents). XGBoost scores in
+#                          float32 as well, so the vector is what the model saw.
+#   device_info            {device_id, attrs: [DEVICE_ATTRS...]}; device_id stays a
+#                          field because device.warm_up queries it
+#
+# ``decision`` stays a string: it is the key of most transaction indexes and queries
+# (review queue, archive, analytics capture, payees, profiles). ``amount`` and the
+# scores stay float64 fields.
+#
+# decode_transaction() turns either form (or a projection of one) into the API
+# shape, so readers never see the difference. rewrite_collection() converts
+# existing documents in _id order, in rate-limited batches; every update is
+# guarded on the fields a concurrent review changes, so it never overwrites one.
+
+CODEC_VERSION = 1
+CODEC_BATCH_SIZE = int(os.getenv("CODEC_BATCH_SIZE", "500"))
+CODEC_MAX_DOCS_PER_SEC = float(os.getenv("CODEC_MAX_DOCS_PER_SEC", "2000"))
+
+RISK_LEVELS = ("LOW", "MEDIUM", "HIGH", "CRITICAL", "ADMIN_APPROVED", "ADMIN_REJECTED")
+ML_STAGES = ("rules", "prefix", "full")
+RISK_LEVEL_CODES = {name: code for code, name in enumerate(RISK_LEVELS)}
+ML_STAGE_CODES = {name: code for code, name in enumerate(ML_STAGES)}
+
+# Factors that don't come from the rule table
+FIXED_FACTORS = {
+    "ml_suspicious": "ML model detected suspicious patterns",
+    "settlement_insufficient_funds": "Insufficient funds at settlement",
+    "settlement_failed": "Settlement failed",
+}
+_FIXED_BY_TEXT = {text: factor_id for factor_id, text in FIXED_FACTORS.items()}
+
+STORED_FEATURES = MODEL_FEATURES + EXTENDED_FEATURES + list(DEVICE_SIGNALS)
+_SLOT = {name: i for i, name in enumerate(STORED_FEATURES)}
+# Decoded as ints (counts and 0/1 flags); everything else as float
+_INT_FEATURES = {
+    "type_transfer", "type_cash_out", "type_payment", "type_debit", "type_cash_in",
+    "transactions_24h", "transactions_1h", "critical_drain", "high_drain",
+    "high_velocity_1h", "high_velocity_24h", "large_amount",
+    "receiver_distinct_senders_1h", "receiver_distinct_senders_24h", "receiver_inbound_count_24h",
+    "device_transactions_24h", "device_distinct_users", "user_known_devices",
+}
+_BOOL_FEATURES = {"new_device_for_user"}
+
+DEVICE_ATTRS = ("device_id_source", "user_agent", "device_type", "browser", "browser_version", "os")
+# Replaced by factors / features in the compact form
+VERBOSE_FIELDS = ("risk_factors", "fired_rules", "velocity_features", "ml_features")
+
+
+# ===== ENUMS =====
+def risk_level_name(value):
+    return RISK_LEVELS[value] if isinstance(value, int) and 0 <= value < len(RISK_LEVELS) else value
+
+
+def ml_stage_name(value):
+    return ML_STAGES[value] if isinstance(value, int) and 0 <= value < len(ML_STAGES) else value
+
+
+# ===== FEATURE VECTOR =====
+def feature_vector(values: dict) -> np.ndarray:
+    """float32 vector in STORED_FEATURES order, NaN where ``values`` has nothing"""
+    vector = np.full(len(STORED_FEATURES), np.nan, dtype="<f4")
+    for name, value in values.items():
+        if name in _SLOT and value is not None:
+            vector[_SLOT[name]] = float(value)
+    return vector
+
+
+def pack_features(values: dict) -> Binary:
+    return Binary(feature_vector(values).tobytes())
+
+
+def unpack_features(blob: bytes) -> dict:
+    """Recorded features by name; NaN slots are left out"""
+    values = {}
+    for name, value in zip(STORED_FEATURES, np.frombuffer(blob, dtype="<f4").tolist()):
+        if math.isnan(value):
+            continue
+        if name in _BOOL_FEATURES:
+            values[name] = bool(value)
+        elif name in _INT_FEATURES:
+            values[name] = int(round(value))
+        else:
+            values[name] = value
+    return values
+
+
+# ===== RISK FACTORS =====
+@lru_cache(maxsize=256)
+def _message_pattern(message: str):
+    parts = []
+    for literal, name, _, _ in string.Formatter().parse(message):
+        parts.append(re.escape(literal))
+        if name:
+            parts.append("(.+?)")
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def _param(text: str):
+    plain = text.replace(",", "")
+    for convert in (int, float):
+        try:
+            return convert(plain)
+        except ValueError:
+            continue
+    return text
+
+
+def parse_factor(text: str, rule):
+    """``[rule id, *params]`` for a sentence ``rule`` rendered, if it renders back identically"""
+    match = _message_pattern(rule.message).match(text)
+    if not match:
+        return None
+    factor = [rule.id, *(_param(value) for value in match.groups())]
+    return factor if rule.render(factor[1:]) == text else None
+
+
+def _factor_from_text(text: str, rule_id: str = None) -> list:
+    if text in _FIXED_BY_TEXT:
+        return [_FIXED_BY_TEXT[text]]
+    candidates = [rule_engine.rule(rule_id)] if rule_id else rule_engine.rules
+    for rule in candidates:
+        factor = parse_factor(text, rule) if rule else None
+        if factor:
+            return factor
+    return [None, text]
+
+
+def compact_factors(risk_factors: list, rule_factors: list = (), fired_rules: list = ()) -> list:
+    """
+    Factor list for stored risk factor sentences. ``rule_factors`` are the rule
+    engine's factors for the leading sentences when known; the rest are matched
+    against the fixed factors and the rule templates, or kept as text.
+    """
+    factors = [list(factor) for factor in rule_factors]
+    for i in range(len(factors), len(risk_factors)):
+        factors.append(_factor_from_text(risk_factors[i], fired_rules[i] if i < len(fired_rules) else None))
+    return factors
+
+
+def render_factors(factors: list) -> list:
+    sentences = []
+    for factor_id, *params in factors:
+        if factor_id is None:
+            sentences.append(params[0])
+        elif factor_id in FIXED_FACTORS:
+            sentences.append(FIXED_FACTORS[factor_id])
+        else:
+            rule = rule_engine.rule(factor_id)
+            # A rule since removed from the table can only be shown by id
+            sentences.append(rule.render(params) if rule else factor_id)
+    return sentences
+
+
+# ===== DOCUMENTS =====
+def encode_transaction(doc: dict, features: dict, rule_factors: list = ()) -> dict:
+    """Compact form of a verbose transaction document; ``features`` by STORED_FEATURES name"""
+    compact = {key: value for key, value in doc.items() if key not in VERBOSE_FIELDS}
+    compact["codec"] = CODEC_VERSION
+    compact["risk_level"] = RISK_LEVEL_CODES.get(doc.get("risk_level"), doc.get("risk_level"))
+    compact["ml_stage"] = ML_STAGE_CODES.get(doc.get("ml_stage"), doc.get("ml_stage"))
+    compact["factors"] = compact_factors(doc.get("risk_factors") or [], rule_factors, doc.get("fired_rules") or [])
+    compact["features"] = pack_features(features)
+    device = doc.get("device_info")
+    if isinstance(device, dict) and "device_id" in device and \
+            set(device) <= {"device_id", *DEVICE_ATTRS, *DEVICE_SIGNALS}:
+        compact["device_info"] = {"device_id": device["device_id"], "attrs": [device.get(a) for a in DEVICE_ATTRS]}
+    return compact
+
+
+def legacy_features(doc: dict) -> dict:
+    """The feature slots a verbose document still lets us fill (receiver balances were never stored)"""
+    values = {}
+    velocity = doc.get("velocity_features") or {}
+    ml = doc.get("ml_features") or {}
+    device = doc.get("device_info") if isinstance(doc.get("device_info"), dict) else {}
+    amount = doc.get("amount")
+    if amount is not None:
+        values.update(amount=amount, log_amount=math.log1p(amount), large_amount=amount > 50000)
+    if doc.get("payment_type"):
+        for payment_type in ("TRANSFER", "CASH_OUT", "PAYMENT", "DEBIT", "CASH_IN"):
+            values[f"type_{payment_type.lower()}"] = doc["payment_type"] == payment_type
+    for name in ("transactions_24h", "transactions_1h", "volume_24h"):
+        if velocity.get(name, ml.get(name)) is not None:
+            values[name] = velocity.get(name, ml.get(name))
+    if "transactions_1h" in values:
+        values["high_velocity_1h"] = values["transactions_1h"] > 5
+    if "transactions_24h" in values:
+        values["high_velocity_24h"] = values["transactions_24h"] > 20
+    balance = ml.get("sender_balance")
+    if balance is not None and amount is not None:
+        drain_pct = ml.get("drain_percentage", (amount / balance * 100) if balance > 0 else 0)
+        values.update(
+            sender_balance=balance,
+            sender_balance_after=balance - amount,
+            amount_to_balance_ratio=amount / balance if balance > 0 else 0,
+            drain_ratio=drain_pct / 100,
+            critical_drain=drain_pct > 90,
+            high_drain=drain_pct > 70
+        )
+    for name in EXTENDED_FEATURES:
+        if ml.get(name) is not None:
+            values[name] = ml[name]
+    for name in DEVICE_SIGNALS:
+        if device.get(name) is not None:
+            values[name] = device[name]
+    return values
+
+
+def encode_legacy(doc: dict) -> dict:
+    if doc.get("ml_stage") is None and doc.get("ml_features"):
+        # Before the cascade every ML score came from the full model
+        doc = {**doc, "ml_stage": "full"}
+    return encode_transaction(doc, legacy_features(doc))
+
+
+def decode_transaction(doc: dict) -> dict:
+    """API form of a stored transaction, compact or verbose, whole or projected (in place)"""
+    if "risk_level" in doc:
+        doc["risk_level"] = risk_level_name(doc["risk_level"])
+    if "ml_stage" in doc:
+        doc["ml_stage"] = ml_stage_name(doc["ml_stage"])
+    if "factors" in doc:
+        factors = doc.pop("factors")
+        doc["risk_factors"] = render_factors(factors)
+        doc["fired_rules"] = [f[0] for f in factors if f[0] is not None and f[0] not in FIXED_FACTORS]
+
+    device = doc.get("device_info")
+    if isinstance(device, dict) and "attrs" in device:
+        doc["device_info"] = {"device_id": device["device_id"], **dict(zip(DEVICE_ATTRS, device["attrs"]))}
+
+    if "features" in doc:
+        values = unpack_features(doc.pop("features"))
+        if "transactions_1h" in values and "transactions_24h" in values:
+            doc["velocity_features"] = {
+                "transactions_24h": values["transactions_24h"],
+                "transactions_1h": values["transactions_1h"],
+                "volume_24h": values.get("volume_24h"),
+                "high_velocity": values["transactions_1h"] > 5 or values["transactions_24h"] > 20
+            }
+        doc["ml_features"] = None
+        if doc.get("ml_stage") is not None:
+            doc["ml_features"] = {
+                "amount": doc.get("amount", values.get("amount")),
+                "sender_balance": values.get("sender_balance"),
+                "drain_percentage": values["drain_ratio"] * 100 if "drain_ratio" in values else None,
+                "transactions_24h": values.get("transactions_24h"),
+                "transactions_1h": values.get("transactions_1h"),
+                **{name: values[name] for name in EXTENDED_FEATURES if name in values}
+            }
+        if isinstance(doc.get("device_info"), dict):
+            doc["device_info"].update({name: values[name] for name in DEVICE_SIGNALS if name in values})
+    doc.pop("codec", None)
+    return doc
+
+
+# ===== REWRITE EXISTING DOCUMENTS =====
+async def rewrite_collection(collection, batch_size: int = CODEC_BATCH_SIZE,
+                             max_docs_per_sec: float = CODEC_MAX_DOCS_PER_SEC, dry_run: bool = False) -> dict:
+    """Convert verbose documents to the compact form; returns counts and BSON sizes before/after"""
+    stats = {"documents": 0, "rewritten": 0, "skipped": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = None
+    while True:
+        started = time.monotonic()
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        for doc in batch:
+            stats["documents"] += 1
+            if doc.get("codec") == CODEC_VERSION:
+                continue
+            compact = encode_legacy(doc)
+            stats["bytes_before"] += len(bson_encode(doc))
+            stats["bytes_after"] += len(bson_encode(compact))
+            changed = {key: value for key, value in compact.items() if key not in doc or doc[key] != value}
+            ops.append(UpdateOne(
+                # A review that lands in between changes decision and risk_level; leave that document for the next run
+                {"_id": doc["_id"], "codec": {"$exists": False},
+                 "decision": doc.get("decision"), "risk_level": doc.get("risk_level")},
+                {"$set": changed, "$unset": {field: "" for field in VERBOSE_FIELDS if field in doc}}
+            ))
+
+        if ops and not dry_run:
+            result = await collection.bulk_write(ops, ordered=False)
+            stats["rewritten"] += result.modified_count
+            stats["skipped"] += len(ops) - result.modified_count
+        elif ops:
+            stats["rewritten"] += len(ops)
+
+        min_duration = len(batch) / max_docs_per_sec if max_docs_per_sec > 0 else 0
+        elapsed = time.monotonic() - started
+        if elapsed < min_duration:
+            await asyncio.sleep(min_duration - elapsed)
+    return stats
+
+
+def report(name: str, stats: dict) -> str:
+    converted = stats["rewritten"] + stats["skipped"]
+    if not converted:
+        return f"{name}: {stats['documents']} documents, nothing to rewrite"
+    before = stats["bytes_before"] / converted
+    after = stats["bytes_after"] / converted
+    return (f"{name}: {stats['rewritten']} rewritten, {stats['skipped']} changed concurrently; "
+            f"{before:.0f} -> {after:.0f} bytes per document ({before - after:.0f} saved, "
+            f"{(1 - after / before) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    from data_access import MONGODB_URI, DB_NAME
+    from archive import ARCHIVE_STATE_COLLECTION, archive_name
+
+    parser = argparse.ArgumentParser(description="Rewrite stored transactions in the compact encoding")
+    parser.add_argument("--dry-run", action="store_true", help="only measure the bytes that would be saved")
+    parser.add_argument("--batch-size", type=int, default=CODEC_BATCH_SIZE)
+    parser.add_argument("--max-docs-per-sec", type=float, default=CODEC_MAX_DOCS_PER_SEC)
+    args = parser.parse_args()
+
+    async def main():
+        await dal.connect(MONGODB_URI, DB_NAME)
+        try:
+            state = await dal.db[ARCHIVE_STATE_COLLECTION].find_one({"_id": "transactions"}) or {}
+            names = ["transactions"] + [archive_name("transactions", m) for m in sorted(state.get("months", []))]
+            for name in names:
+                stats = await rewrite_collection(dal.db[name], args.batch_size, args.max_docs_per_sec, args.dry_run)
+                print(f"✅ {report(name, stats)}")
+        finally:
+            dal.close()
+
+    asyncio.run(main())
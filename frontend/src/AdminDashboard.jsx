@@ -121,6 +121,46 @@ function AdminDashboard({ onLogout, userEmail }) {
     }
   };
 
+  const handleBulkReview = async (action) => {
+    const ids = transactions.filter(txn => txn.decision === 'REVIEW').map(txn => txn.transaction_id);
+    if (ids.length === 0) {
+      return;
+    }
+    if (!confirm(`Are you sure you want to ${action.toUpperCase()} all ${ids.length} transactions under review?`)) {
+      return;
+    }
+
+    try {
+      setProcessingTxn('bulk');
+
+      const response = await fetch(`${API_URL}/api/v2/transactions/bulk-${action}`, {
+        method: 'POST',
+        headers: {
+          'Authorization': userEmail || 'admin@test.com',
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ transaction_ids: ids })
+      });
+
+      const data = await response.json();
+
+      if (!response.ok) {
+        throw new Error(data.detail || `Failed to ${action} transactions`);
+      }
+
+      const summary = Object.entries(data.summary).map(([outcome, count]) => `${outcome}: ${count}`).join('\n');
+      alert(`✅ Bulk ${action} complete\n${summary}`);
+
+      await fetchDashboardData(true);
+
+    } catch (error) {
+      console.error(`Error during bulk ${action}:`, error);
+      alert(`❌ Error: ${error.message}`);
+    } finally {
+      setProcessingTxn(null);
+    }
+  };
+
   const handleLogout = () => {
     if (onLogout) onLogout();
   };
@@ -369,6 +409,28 @@ function AdminDashboard({ onLogout, userEmail }) {
               <TrendingUp className="w-5 h-5 text-indigo-600" />
               Live Transaction Feed
             </h2>
+            {transactions.some(txn => txn.decision === 'REVIEW') && (
+              <div className="flex items-center gap-2">
+                <button
+                  onClick={() => handleBulkReview('approve')}
+                  disabled={processingTxn !== null}
+                  className="flex items-center gap-1 px-3 py-1.5 bg-green-600 hover:bg-green-700 text-white text-xs font-semibold rounded transition disabled:opacity-50 disabled:cursor-not-allowed"
+                  title="Approve every transaction under review"
+                >
+                  <Check className="w-3 h-3" />
+                  Approve all
+                </button>
+                <button
+                  onClick={() => handleBulkReview('reject')}
+                  disabled={processingTxn !== null}
+                  className="flex items-center gap-1 px-3 py-1.5 bg-red-600 hover:bg-red-700 text-white text-xs font-semibold rounded transition disabled:opacity-50 disabled:cursor-not-allowed"
+                  title="Reject every transaction under review"
+                >
+                  <X className="w-3 h-3" />
+                  Reject all
+                </button>
+              </div>
+            )}
           </div>
           
           {transactions.length === 0 ? (
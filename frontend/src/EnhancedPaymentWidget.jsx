@@ -1,9 +1,19 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { CreditCard, Lock, Shield, AlertTriangle, CheckCircle, LogOut, Users, Plus, DollarSign, Clock } from 'lucide-react';
 import { Link } from 'react-router-dom';
 
 const API_URL = import.meta.env.VITE_API_URL || "https://payshield-fraud-detection-app.onrender.com";
 
+// Persistent per-browser id for device risk signals (new device, shared device)
+function getDeviceId() {
+  let deviceId = localStorage.getItem('payshield_device_id');
+  if (!deviceId) {
+    deviceId = crypto.randomUUID();
+    localStorage.setItem('payshield_device_id', deviceId);
+  }
+  return deviceId;
+}
+
 function EnhancedPaymentWidget({ currentUser, onLogout }) {
   const [accounts, setAccounts] = useState([]);
   const [contacts, setContacts] = useState([]);
@@ -26,50 +36,29 @@ function EnhancedPaymentWidget({ currentUser, onLogout }) {
   const [paymentStatus, setPaymentStatus] = useState(null);
   const [showBlockedModal, setShowBlockedModal] = useState(false);
   const [fraudDetails, setFraudDetails] = useState(null);
+  // Reused when a payment is retried after a network error, so the server never charges twice
+  const idempotencyKey = useRef(null);
 
   useEffect(() => {
     if (currentUser && currentUser.email) {
-      fetchAccounts();
-      fetchContacts();
-      fetchTransactionHistory();
+      fetchWidgetData();
     }
   }, [currentUser]);
 
-  const fetchAccounts = async () => {
+  // Accounts, contacts and recent history in one round trip
+  const fetchWidgetData = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/accounts/list`, {
+      const response = await fetch(`${API_URL}/api/v2/widget/bootstrap`, {
         headers: { 'Authorization': currentUser.email }
       });
       const data = await response.json();
       setAccounts(data.accounts || []);
-      const primary = data.accounts?.find(acc => acc.is_primary);
-      if (primary) setSelectedAccount(primary);
-    } catch (error) {
-      console.error('Error fetching accounts:', error);
-    }
-  };
-
-  const fetchContacts = async () => {
-    try {
-      const response = await fetch(`${API_URL}/api/contacts/list`, {
-        headers: { 'Authorization': currentUser.email }
-      });
-      const data = await response.json();
       setContacts(data.contacts || []);
-    } catch (error) {
-      console.error('Error fetching contacts:', error);
-    }
-  };
-
-  const fetchTransactionHistory = async () => {
-    try {
-      const response = await fetch(`${API_URL}/api/v2/transactions/history?limit=5`, {
-        headers: { 'Authorization': currentUser.email }
-      });
-      const data = await response.json();
       setTransactionHistory(data.transactions || []);
+      const primary = data.accounts?.find(acc => acc.is_primary);
+      if (primary) setSelectedAccount(primary);
     } catch (error) {
-      console.error('Error fetching history:', error);
+      console.error('Error loading payment widget:', error);
     }
   };
 
@@ -100,6 +89,10 @@ function EnhancedPaymentWidget({ currentUser, onLogout }) {
     setProcessing(true);
     setPaymentStatus(null);
 
+    if (!idempotencyKey.current) {
+      idempotencyKey.current = crypto.randomUUID();
+    }
+
     try {
       // ✅ FIX: Include sender_account_id in the request
       const response = await fetch(`${API_URL}/api/v2/transactions/process`, {
@@ -107,7 +100,9 @@ function EnhancedPaymentWidget({ currentUser, onLogout }) {
         headers: {
           'Content-Type': 'application/json',
           'Authorization': currentUser.email,
-          'User-Agent': navigator.userAgent
+          'User-Agent': navigator.userAgent,
+          'X-Device-Id': getDeviceId(),
+          'Idempotency-Key': idempotencyKey.current
         },
         body: JSON.stringify({
           ...formData,
@@ -117,6 +112,9 @@ function EnhancedPaymentWidget({ currentUser, onLogout }) {
       });
 
       const result = await response.json();
+      if (response.ok) {
+        idempotencyKey.current = null;
+      }
 
       console.log('Transaction Result:', result);
 
@@ -148,8 +146,7 @@ function EnhancedPaymentWidget({ currentUser, onLogout }) {
         newBalance: result.new_balance
       });
 
-      fetchAccounts();
-      fetchTransactionHistory();
+      fetchWidgetData();
 
     } catch (error) {
       console.error('Payment error:', error);
@@ -10,6 +10,7 @@ function MerchantDashboard() {
   const [stats, setStats] = useState(null);
   const [recentTransactions, setRecentTransactions] = useState([]);
   const [alerts, setAlerts] = useState([]);
+  const [series, setSeries] = useState([]);
   const [loading, setLoading] = useState(true);
   const navigate = useNavigate();
   const currentUser = getCurrentUser(); // Get current user
@@ -56,6 +57,17 @@ function MerchantDashboard() {
         console.error('Failed to fetch transactions:', txnRes.status);
       }
 
+      // Last 90 days for this merchant, from the daily rollups
+      const seriesRes = await fetch(`${apiUrl}/api/v2/analytics/merchant/timeseries?granularity=day&points=90`, {
+        headers: {
+          'Authorization': currentUser.email
+        }
+      });
+      if (seriesRes.ok) {
+        const seriesData = await seriesRes.json();
+        setSeries(seriesData.series || []);
+      }
+
       setLoading(false);
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
@@ -88,6 +100,8 @@ function MerchantDashboard() {
     return styles[decision] || styles.REVIEW;
   };
 
+  const maxVolume = Math.max(1, ...series.map(p => p.approved_volume));
+
   if (loading) {
     return (
       <div className="min-h-screen bg-gradient-to-br from-indigo-50 to-purple-50 flex items-center justify-center">
@@ -179,6 +193,28 @@ function MerchantDashboard() {
         </div>
       </div>
 
+      {/* 90-day Approved Volume */}
+      <div className="max-w-7xl mx-auto bg-white rounded-xl shadow-sm border border-gray-100 p-6 mb-8">
+        <h2 className="text-lg font-semibold text-gray-900 mb-4 flex items-center gap-2">
+          <DollarSign className="w-5 h-5 text-purple-600" />
+          Approved Volume, Last 90 Days
+        </h2>
+        {series.length === 0 ? (
+          <p className="text-sm text-gray-500">No activity yet</p>
+        ) : (
+          <div className="flex items-end gap-px h-32">
+            {series.map((point) => (
+              <div
+                key={point.bucket}
+                className={`flex-1 rounded-t ${point.counts.BLOCK > 0 ? 'bg-red-400' : 'bg-purple-500'}`}
+                style={{ height: `${(point.approved_volume / maxVolume) * 100}%`, minHeight: '1px' }}
+                title={`${new Date(point.bucket).toLocaleDateString()}: $${point.approved_volume.toLocaleString()} approved, ${point.counts.BLOCK} blocked, ${point.counts.REVIEW} sent to review`}
+              />
+            ))}
+          </div>
+        )}
+      </div>
+
       <div className="max-w-7xl mx-auto grid grid-cols-1 lg:grid-cols-3 gap-6">
         {/* Recent Alerts */}
         <div className="lg:col-span-1 bg-white rounded-xl shadow-sm border border-gray-100 p-6">